@@ -11,7 +11,7 @@ import time
 import json
 import yaml
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, render_template_string, request
+from flask import Flask, Response, jsonify, render_template_string, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 from binance.client import Client
@@ -19,10 +19,20 @@ from binance.client import Client
 # Import core trading modules
 from core.engine import Engine
 from core.broker import LiveBroker
+from core.async_broker import AsyncLiveBroker
+from core.paper import PaperBroker, PaperExchange
+from core.recorder import RecordingClient
 from core.datafeed import DataFeed
+from core.archive import KlineArchive
+from core.stream import MarketStream, BINANCE_US_WS
+from core.userstream import UserDataStream
 from core.account import Account
-from core.storage import Storage
+from core.storage import open_storage
 from core.risk import RiskEngine
+from core.ratelimit import RateLimitedClient
+from core.scheduler import BarScheduler
+from core.metrics import Metrics
+from core.profiler import ProfilerBusy, SamplingProfiler
 
 # Load environment variables
 load_dotenv()
@@ -67,8 +77,12 @@ bot_state = {
 
 # Trading components
 binance_client = None
+scheduler = None
 trading_engine = None
 storage = None
+metrics = Metrics(window=config.get('metrics', {}).get('window', 1000))
+profiler = SamplingProfiler(interval_s=config.get('profiler', {}).get('interval_ms', 5) / 1000,
+                            max_seconds=config.get('profiler', {}).get('max_seconds', 300), logger=logger)
 
 def initialize_trading_components():
     """Initialize all trading components"""
@@ -79,28 +93,86 @@ def initialize_trading_components():
         api_key = os.getenv('BINANCE_US_API_KEY')
         api_secret = os.getenv('BINANCE_US_API_SECRET')
         
-        if not api_key or not api_secret:
+        paper = config.get('mode', 'live') == 'paper'
+        if not paper and (not api_key or not api_secret):
             logger.warning("Binance API credentials not found - running in demo mode")
             bot_state["status"] = "demo_mode"
             return False
         
-        binance_client = Client(api_key, api_secret, tld='us')
+        rl_cfg = config.get('ratelimit', {})
+        # A hung request would hold a gather worker forever: every REST call gets an HTTP timeout
+        rest_timeout = config.get('execution', {}).get('rest_timeout_s', 10)
+        limiter = binance_client = RateLimitedClient(Client(api_key, api_secret, tld='us',
+                                                            requests_params={'timeout': rest_timeout}),
+                                                     limit=rl_cfg.get('weight_per_min', 1200),
+                                                     order_reserve=rl_cfg.get('order_reserve', 0.1),
+                                                     data_reserve=rl_cfg.get('data_reserve', 0.3),
+                                                     max_wait_s=rl_cfg.get('max_wait_s', 5), logger=logger,
+                                                     metrics=metrics)
+        recorder = None
+        if config.get('recorder', {}).get('path'):
+            # Every REST response (and websocket message, below) goes to a replayable log
+            recorder = binance_client = RecordingClient(binance_client, config['recorder']['path'], logger=logger)
+        if paper:
+            # Live market data, local matching engine: orders and balances never reach the exchange
+            paper_cfg = config.get('paper', {})
+            balances = {config['account']['base_currency']: paper_cfg.get('balance', 10000)}
+            binance_client = PaperExchange(binance_client, balances=balances,
+                                           fee_bps=paper_cfg.get('fee_bps', 10.0),
+                                           slippage_bps=paper_cfg.get('slippage_bps', 2.0),
+                                           impact_bps=paper_cfg.get('impact_bps', 0.0), logger=logger)
         
         # Test connection
         account_info = binance_client.get_account()
-        logger.info("Successfully connected to Binance.US")
+        logger.info("Successfully connected to Binance.US" + (" (paper trading)" if paper else ""))
         
         # Initialize components
-        datafeed = DataFeed(binance_client, logger)
-        account = Account(binance_client, logger)
-        broker = LiveBroker(binance_client, account.precision_map())
-        storage = Storage("data", logger)
+        account = Account(binance_client, logger, snapshot_ttl=config['account'].get('snapshot_ttl_s', 10),
+                          filters_path=config['account'].get('filters_path', 'data/filters.json'),
+                          filters_max_age_s=config['account'].get('filters_refresh_s', 21600))
+        account.filters().start_refresh(binance_client, config['account'].get('filters_refresh_s', 21600))
+        archive = KlineArchive(config.get('archive', {}).get('dir', 'data/klines'), client=binance_client,
+                               logger=logger)
+        datafeed = DataFeed(binance_client, logger, account=account,
+                            whale_windows_min=config['whales'].get('windows_min', [config['whales']['window_min']]),
+                            archive=archive)
+        feed_cfg = config.get('datafeed', {})
+        if feed_cfg.get('mode', 'rest') == 'stream':
+            stream = MarketStream(datafeed, config['symbols'], [config['timeframes']['trade']],
+                                  url=feed_cfg.get('ws_url', BINANCE_US_WS), logger=logger)
+            if recorder is not None:
+                stream.handle_message = recorder.tap('market', stream.handle_message)
+            datafeed.attach_stream(stream.start())
+        orders_cfg = config.get('orders', {})
+        if paper:
+            broker = PaperBroker(binance_client, account.precision_map(),
+                                 native_oco=orders_cfg.get('native_oco', 'auto'), filters=account.filters(),
+                                 metrics=metrics)
+        elif orders_cfg.get('async_broker', False):
+            broker = AsyncLiveBroker(binance_client, account.precision_map(),
+                                     native_oco=orders_cfg.get('native_oco', 'auto'), filters=account.filters(),
+                                     retries=orders_cfg.get('retries', 3), logger=logger, metrics=metrics,
+                                     limiter=limiter, recorder=recorder)
+        else:
+            broker = LiveBroker(binance_client, account.precision_map(),
+                                native_oco=orders_cfg.get('native_oco', 'auto'), filters=account.filters(),
+                                metrics=metrics)
+        storage = open_storage(config, logger)
         
         # Initialize trading engine
-        trading_engine = Engine(broker, datafeed, account, config, storage, logger)
+        trading_engine = Engine(broker, datafeed, account, config, storage, logger, metrics=metrics)
+        if paper:
+            binance_client.subscribe(trading_engine.on_execution_report)
+        elif config.get('orders', {}).get('user_stream', False):
+            user_stream = UserDataStream(binance_client, trading_engine.on_execution_report,
+                                         on_resync=trading_engine.resync_brackets,
+                                         url=config.get('datafeed', {}).get('ws_url', BINANCE_US_WS), logger=logger)
+            if recorder is not None:
+                user_stream.handle_message = recorder.tap('user', user_stream.handle_message)
+            user_stream.start()
         
         # Update portfolio value
-        bot_state["portfolio_value"] = datafeed.get_equity_usd()
+        bot_state["portfolio_value"] = datafeed.get_equity_usd() or 0.0
         bot_state["managed_equity"] = bot_state["portfolio_value"] * config['account']['managed_fraction']
         
         bot_state["status"] = "online"
@@ -494,6 +566,90 @@ def api_status():
         "uptime": bot_state["uptime"]
     })
 
+def _client_layer(cls):
+    """The `cls` layer of the wrapped binance_client (paper -> recorder -> rate limiter -> Client)"""
+    client = binance_client
+    while client is not None and not isinstance(client, cls):
+        client = vars(client).get('market') or vars(client).get('client')
+    return client
+
+@app.route("/api/ratelimit")
+def api_ratelimit():
+    """REST weight budget and per-endpoint weight/latency"""
+    client = _client_layer(RateLimitedClient)
+    if client is None:
+        return jsonify({"error": "not connected"}), 503
+    return jsonify(client.stats())
+
+@app.route("/api/recorder")
+def api_recorder():
+    """Frames and bytes written by the response recorder"""
+    recorder = _client_layer(RecordingClient)
+    if recorder is None:
+        return jsonify({"error": "recorder off"}), 404
+    return jsonify(recorder.stats())
+
+@app.route("/api/paper")
+def api_paper():
+    """Paper-trading fills, open orders and simulated balances"""
+    if not isinstance(binance_client, PaperExchange):
+        return jsonify({"error": "not in paper mode"}), 404
+    return jsonify(binance_client.stats())
+
+@app.route("/api/scheduler")
+def api_scheduler():
+    """Bar-close scheduler: next closes, wake lateness, coalesced closes"""
+    if scheduler is None:
+        return jsonify({"error": "not running"}), 503
+    return jsonify(scheduler.stats())
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Per-stage latency histograms, p50/p99 and bot gauges in the Prometheus text format"""
+    metrics.set('bot_portfolio_value_usd', bot_state["portfolio_value"], help_="Portfolio value (USD)")
+    metrics.set('bot_errors', bot_state["error_count"], help_="Errors since start")
+    metrics.set('bot_trade_enabled', int(bot_state["trade_enabled"] and not bot_state["hard_kill"]),
+                help_="1 if live trading is enabled")
+    if scheduler is not None:
+        metrics.set('bot_scheduler_missed', scheduler.missed, help_="Bar closes missed by the scheduler")
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route("/api/profiler")
+def api_profiler():
+    """Sampling profiler state: running, target thread, samples so far"""
+    return jsonify(profiler.stats())
+
+@app.route("/api/profiler/start", methods=["POST"])
+def api_profiler_start():
+    """Sample a thread's stack for ?seconds=N (default 30); the trading loop unless ?thread= names another"""
+    try:
+        return jsonify(profiler.start(float(request.args.get('seconds', 30)),
+                                      request.args.get('thread', 'trading-loop')))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/profiler/stop", methods=["POST"])
+def api_profiler_stop():
+    """End the running profile early; its samples are kept"""
+    return jsonify(profiler.stop())
+
+@app.route("/api/profiler/collapsed")
+def api_profiler_collapsed():
+    """Last profile as folded stacks (flamegraph.pl, speedscope)"""
+    return Response(profiler.collapsed(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.folded'})
+
+@app.route("/api/profiler/top")
+def api_profiler_top():
+    """Last profile's hottest functions by self samples"""
+    return Response(json.dumps({**profiler.stats(), 'top': profiler.top(int(request.args.get('n', 30)))}, indent=2),
+                    mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=profile_top.json'})
+
 @app.route("/health")
 def health_check():
     """Health check endpoint"""
@@ -504,39 +660,55 @@ def health_check():
     })
 
 def trading_loop():
-    """Main trading loop"""
+    """Main trading loop: housekeeping on every scan-timeframe close, a full scan on every trade-timeframe close"""
+    global scheduler
+    sched_cfg = config.get('scheduler', {})
+    scan_tf = config['timeframes'].get('scan', '1m')
+    trade_tf = config['timeframes']['trade']
+    scheduler = BarScheduler([scan_tf, trade_tf], close_delay_s=sched_cfg.get('close_delay_s', 1.0),
+                             jitter_s=sched_cfg.get('jitter_s', 0.0), logger=logger)
     while True:
         try:
+            closed = scheduler.wait()
+            if not closed:
+                break
+
             if bot_state["hard_kill"]:
                 logger.info("Hard kill active - skipping trading loop")
-                time.sleep(60)
                 continue
                 
             if not bot_state["trade_enabled"]:
-                time.sleep(30)
                 continue
                 
             if bot_state["status"] != "online" or not trading_engine:
-                time.sleep(60)
                 continue
             
             # Update scan time
             bot_state["last_scan_time"] = datetime.now().strftime("%m/%d/%Y, %I:%M:%S %p")
             
-            # Run trading logic for each symbol
-            for symbol in config['symbols']:
+            # Paper mode: match resting orders against the bars that just closed
+            if isinstance(trading_engine.broker, PaperBroker):
                 try:
-                    trading_engine.tick(symbol)
+                    trading_engine.broker.sync(trading_engine.datafeed, config['symbols'], scan_tf)
                 except Exception as e:
-                    logger.error(f"Error in trading tick for {symbol}: {e}")
+                    logger.error(f"Error matching paper orders: {e}")
                     bot_state["error_count"] += 1
             
-            # Update portfolio value
+            # Run trading logic for all symbols in one batched scan, only when a trade bar closed
+            if trade_tf in closed:
+                try:
+                    bot_state["error_count"] += trading_engine.scan(config['symbols'])
+                except Exception as e:
+                    logger.error(f"Error in trading scan: {e}")
+                    bot_state["error_count"] += 1
+            
+            # Update portfolio value (served from the scan's account snapshot unless we traded)
             if binance_client:
                 try:
-                    datafeed = DataFeed(binance_client, logger)
-                    bot_state["portfolio_value"] = datafeed.get_equity_usd()
-                    bot_state["managed_equity"] = bot_state["portfolio_value"] * config['account']['managed_fraction']
+                    equity = trading_engine.datafeed.get_equity_usd()
+                    if equity is not None:  # keep the last value through a failed valuation
+                        bot_state["portfolio_value"] = equity
+                        bot_state["managed_equity"] = equity * config['account']['managed_fraction']
                 except Exception as e:
                     logger.error(f"Error updating portfolio value: {e}")
             
@@ -544,15 +716,13 @@ def trading_loop():
             if storage:
                 bot_state["recent_trades"] = storage.get_recent_trades(20)
             
-            logger.info(f"Trading scan completed - Portfolio: ${bot_state['portfolio_value']:.2f}")
-            
-            # Sleep for scan interval
-            time.sleep(60)  # 1 minute between scans
+            if trade_tf in closed:
+                logger.info(f"Trading scan completed - Portfolio: ${bot_state['portfolio_value']:.2f}")
             
         except Exception as e:
             logger.error(f"Error in trading loop: {e}")
             bot_state["error_count"] += 1
-            time.sleep(60)
+            time.sleep(5)
 
 def start_background_tasks():
     """Start background trading tasks"""
@@ -565,7 +735,7 @@ def start_background_tasks():
         logger.warning("Running in demo mode - no live trading")
     
     # Start trading loop
-    trading_thread = threading.Thread(target=trading_loop, daemon=True)
+    trading_thread = threading.Thread(target=trading_loop, name="trading-loop", daemon=True)
     trading_thread.start()
     
     logger.info("Live trading system started")
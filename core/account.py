@@ -1,82 +1,111 @@
 import logging
+import threading
+import time
 from typing import Dict, List
 
+from core.filters import FilterTable
+
 class Account:
-    def __init__(self, client, logger=None):
+    def __init__(self, client, logger=None, snapshot_ttl=10.0, filters_path=None, filters_max_age_s=86400):
         self.client = client
         self.logger = logger or logging.getLogger(__name__)
         self._precision_cache = {}
-        
+        self._filters = FilterTable(filters_path, max_age_s=filters_max_age_s, logger=self.logger)
+        self._filters_loaded = False
+        self.snapshot_ttl = snapshot_ttl
+        self._snapshot = None        # last get_account() response
+        self._snapshot_at = 0.0
+        self._open_orders = None     # get_open_orders() taken alongside the snapshot
+        self._open_orders_at = 0.0
+        self._snapshot_lock = threading.Lock()
+
+    def snapshot(self, max_age=None) -> Dict:
+        """
+        Account info shared by everything in a tick cycle (equity, positions, balances).
+        Re-fetched only when older than max_age (default snapshot_ttl) or after invalidate().
+        """
+        max_age = self.snapshot_ttl if max_age is None else max_age
+        with self._snapshot_lock:
+            if self._snapshot is None or time.monotonic() - self._snapshot_at > max_age:
+                self._snapshot = self.client.get_account()
+                self._snapshot_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop cached account state; call after our own orders or fills change it"""
+        with self._snapshot_lock:
+            self._snapshot = None
+            self._open_orders = None
+
+    def balances(self) -> Dict[str, Dict]:
+        """asset -> {'free', 'locked', 'total'} for every non-zero balance in the snapshot"""
+        out = {}
+        for balance in self.snapshot()['balances']:
+            free = float(balance['free'])
+            locked = float(balance['locked'])
+            if free + locked > 0:
+                out[balance['asset']] = {'free': free, 'locked': locked, 'total': free + locked}
+        return out
+
     def open_positions(self) -> List[Dict]:
         """Get current open positions"""
         try:
-            account = self.client.get_account()
             positions = []
-            
-            for balance in account['balances']:
-                asset = balance['asset']
-                free = float(balance['free'])
-                locked = float(balance['locked'])
-                total = free + locked
-                
-                if total > 0 and asset not in ['USD', 'USDT']:
+
+            for asset, bal in self.balances().items():
+                if asset not in ['USD', 'USDT']:
                     positions.append({
                         'symbol': asset,
-                        'quantity': total,
-                        'free': free,
-                        'locked': locked
+                        'quantity': bal['total'],
+                        'free': bal['free'],
+                        'locked': bal['locked']
                     })
-                    
+
             return positions
-            
+
         except Exception as e:
             self.logger.error(f"Error fetching positions: {e}")
             return []
-    
+
     def open_orders(self, symbol=None) -> List[Dict]:
-        """Get current open orders"""
+        """
+        Get current open orders. A fresh all-symbol snapshot is filtered locally; otherwise a
+        single symbol is fetched on its own (weight 3) rather than refreshing every symbol (weight 40).
+        """
         try:
+            with self._snapshot_lock:
+                fresh = self._open_orders is not None and time.monotonic() - self._open_orders_at <= self.snapshot_ttl
+                if fresh:
+                    orders = self._open_orders
+                elif not symbol:
+                    self._open_orders = orders = self.client.get_open_orders()
+                    self._open_orders_at = time.monotonic()
+
             if symbol:
-                orders = self.client.get_open_orders(symbol=symbol)
-            else:
-                orders = self.client.get_open_orders()
-                
-            return orders
-            
+                if not fresh:
+                    return self.client.get_open_orders(symbol=symbol)
+                return [o for o in orders if o.get('symbol') == symbol]
+            return list(orders)
+
         except Exception as e:
             self.logger.error(f"Error fetching open orders: {e}")
             return []
-    
+
+    def filters(self) -> FilterTable:
+        """Compiled per-symbol exchange filters; read from disk or fetched once, then kept"""
+        if not self._filters_loaded:
+            self._filters.load(self.client)
+            self._filters_loaded = bool(self._filters.symbols)
+        return self._filters
+
     def precision_map(self) -> Dict:
-        """Get symbol precision information"""
+        """Get symbol precision information (decimals of stepSize / tickSize)"""
         if self._precision_cache:
             return self._precision_cache
             
         try:
-            exchange_info = self.client.get_exchange_info()
-            precision_map = {}
-            
-            for symbol_info in exchange_info['symbols']:
-                symbol = symbol_info['symbol']
-                
-                # Get quantity precision
-                qty_precision = 0
-                for filter_info in symbol_info['filters']:
-                    if filter_info['filterType'] == 'LOT_SIZE':
-                        step_size = float(filter_info['stepSize'])
-                        qty_precision = len(str(step_size).split('.')[-1].rstrip('0'))
-                        break
-                
-                # Get price precision
-                price_precision = symbol_info['quotePrecision']
-                
-                precision_map[symbol] = {
-                    'qty': qty_precision,
-                    'price': price_precision
-                }
-            
-            self._precision_cache = precision_map
-            return precision_map
+            self._precision_cache = self.filters().precision_map()
+            return self._precision_cache
             
         except Exception as e:
             self.logger.error(f"Error fetching precision map: {e}")
@@ -85,20 +114,12 @@ class Account:
     def get_balance(self, asset: str) -> Dict:
         """Get balance for specific asset"""
         try:
-            account = self.client.get_account()
-            
-            for balance in account['balances']:
-                if balance['asset'] == asset:
-                    return {
-                        'asset': asset,
-                        'free': float(balance['free']),
-                        'locked': float(balance['locked']),
-                        'total': float(balance['free']) + float(balance['locked'])
-                    }
-                    
+            bal = self.balances().get(asset)
+            if bal:
+                return {'asset': asset, **bal}
+
             return {'asset': asset, 'free': 0.0, 'locked': 0.0, 'total': 0.0}
-            
+
         except Exception as e:
             self.logger.error(f"Error fetching balance for {asset}: {e}")
             return {'asset': asset, 'free': 0.0, 'locked': 0.0, 'total': 0.0}
-
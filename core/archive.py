@@ -0,0 +1,290 @@
+import argparse
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.datafeed import INTERVAL_MS, KLINE_FIELDS, _klines_to_array
+
+ROW_BYTES = 8  # every column is float64, like KlineBuffer
+
+
+class KlineArchive:
+    """
+    Append-only columnar kline store: <dir>/<SYMBOL>/<interval>/<field>.f64, one raw
+    float64 file per KLINE_FIELDS column.
+    - Only closed bars are stored, contiguous from the first bar to the last: gaps are
+      fetched from the exchange when a client is available, and bars the exchange never
+      produced are filled flat (previous close, zero volume). Bar i therefore opens at
+      first_open + i * interval and a time range maps to a slice without searching.
+    - load() returns np.memmap columns (read-only, zero-copy); appends never rewrite
+      existing bytes, so views taken earlier stay valid.
+    - A torn append (crash between column writes) is repaired on open by truncating
+      every column to the shortest one.
+    - append_nowait() is the live path: it never calls the exchange; a gap is backfilled
+      by sync() on a background thread.
+    """
+    def __init__(self, directory, client=None, logger=None):
+        self.directory = directory
+        self.client = client
+        self.logger = logger or logging.getLogger(__name__)
+        self._lengths = {}   # (symbol, interval) -> stored rows
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._backfilling = set()  # (symbol, interval) with a background sync running
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.directory, symbol, interval)
+
+    def _path(self, symbol, interval, field):
+        return os.path.join(self._dir(symbol, interval), f"{field}.f64")
+
+    def _lock(self, symbol, interval):
+        with self._guard:
+            return self._locks.setdefault((symbol, interval), threading.Lock())
+
+    def symbols(self, interval):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(s for s in os.listdir(self.directory) if os.path.isdir(self._dir(s, interval)))
+
+    def length(self, symbol, interval):
+        """Stored bars, after repairing a torn append"""
+        key = (symbol, interval)
+        if key not in self._lengths:
+            sizes = []
+            for field in KLINE_FIELDS:
+                path = self._path(symbol, interval, field)
+                sizes.append(os.path.getsize(path) // ROW_BYTES if os.path.exists(path) else 0)
+            n = min(sizes)
+            if max(sizes) != n:
+                self.logger.warning(f"Repairing torn kline archive for {symbol} {interval}: {sizes} -> {n} rows")
+                for field in KLINE_FIELDS:
+                    path = self._path(symbol, interval, field)
+                    if os.path.exists(path):
+                        with open(path, 'r+b') as f:
+                            f.truncate(n * ROW_BYTES)
+            self._lengths[key] = n
+        return self._lengths[key]
+
+    def _column(self, symbol, interval, field, n):
+        if n == 0:
+            return np.empty(0)
+        return np.memmap(self._path(symbol, interval, field), dtype=np.float64, mode='r', shape=(n,))
+
+    def first_open_time(self, symbol, interval):
+        n = self.length(symbol, interval)
+        return int(self._column(symbol, interval, 'open_time', n)[0]) if n else None
+
+    def last_open_time(self, symbol, interval):
+        n = self.length(symbol, interval)
+        return int(self._column(symbol, interval, 'open_time', n)[-1]) if n else None
+
+    def load(self, symbol, interval, start=None, end=None):
+        """
+        {field: memmap} for bars opening in [start, end) (epoch ms; None = unbounded).
+        Slicing is arithmetic because the archive has no gaps.
+        """
+        n = self.length(symbol, interval)
+        cols = {f: self._column(symbol, interval, f, n) for f in KLINE_FIELDS}
+        if n == 0 or (start is None and end is None):
+            return cols
+        step = INTERVAL_MS[interval]
+        first = int(cols['open_time'][0])
+        a = 0 if start is None else min(n, max(0, -(-(int(start) - first) // step)))
+        b = n if end is None else min(n, max(a, -(-(int(end) - first) // step)))
+        return {f: c[a:b] for f, c in cols.items()}
+
+    def tail(self, symbol, interval, bars):
+        """Last `bars` bars as an (n, 7) array in KLINE_FIELDS order (a small copy)"""
+        n = self.length(symbol, interval)
+        a = max(0, n - bars)
+        if n == 0:
+            return np.empty((0, len(KLINE_FIELDS)))
+        return np.column_stack([self._column(symbol, interval, f, n)[a:] for f in KLINE_FIELDS])
+
+    def append(self, symbol, interval, rows, now_ms=None):
+        """
+        Append bars (n, 7) sorted by open_time. Rows already stored and bars still forming
+        (close_time >= now) are skipped; a gap before the first new row is filled first.
+        Returns the number of rows written.
+        """
+        with self._lock(symbol, interval):
+            last, rows = self._new_rows(symbol, interval, rows, now_ms)
+            if not len(rows):
+                return 0
+            rows = self._contiguous(symbol, interval, last, rows)
+            return self._write(symbol, interval, rows)
+
+    def append_nowait(self, symbol, interval, rows, now_ms=None):
+        """
+        append() for callers holding other locks (kline refreshes, the stream thread): never
+        waits on the exchange or on a running backfill. Rows that would leave a gap are not
+        written; sync() fills it on a background thread and later calls continue from there.
+        Returns the number of rows written.
+        """
+        lock = self._lock(symbol, interval)
+        if not lock.acquire(blocking=False):
+            return 0  # a backfill is writing; the next call appends what is still new
+        try:
+            last, rows = self._new_rows(symbol, interval, rows, now_ms)
+            if not len(rows):
+                return 0
+            step = INTERVAL_MS[interval]
+            start = int(rows[0, 0]) if last is None else last + step
+            if self.client is not None and int(rows[-1, 0]) - start != (len(rows) - 1) * step:
+                self._backfill(symbol, interval)
+                return 0
+            return self._write(symbol, interval, self._contiguous(symbol, interval, last, rows))
+        finally:
+            lock.release()
+
+    def _new_rows(self, symbol, interval, rows, now_ms):
+        """(last stored open_time, rows that are closed and newer than it)"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        last = self.last_open_time(symbol, interval)
+        rows = np.asarray(rows, dtype=np.float64)
+        rows = rows[rows[:, 6] < now_ms] if len(rows) else rows
+        if last is not None and len(rows):
+            rows = rows[rows[:, 0] > last]
+        return last, rows
+
+    def _backfill(self, symbol, interval):
+        """sync() the series on a daemon thread, at most one per series at a time"""
+        key = (symbol, interval)
+        with self._guard:
+            if key in self._backfilling:
+                return
+            self._backfilling.add(key)
+
+        def run():
+            try:
+                written = self.sync(symbol, interval)
+                self.logger.info(f"Backfilled {written} {interval} bar(s) of {symbol} into the kline archive")
+            except Exception as e:
+                self.logger.error(f"Error backfilling kline archive for {symbol} {interval}: {e}")
+            finally:
+                with self._guard:
+                    self._backfilling.discard(key)
+
+        threading.Thread(target=run, name="archive-backfill", daemon=True).start()
+
+    def _contiguous(self, symbol, interval, last, rows):
+        """rows with every missing bar between `last` and rows[-1] supplied (exchange, else flat)"""
+        step = INTERVAL_MS[interval]
+        start = int(rows[0, 0]) if last is None else last + step
+        expected = np.arange(start, int(rows[-1, 0]) + 1, step, dtype=np.int64)
+        if len(expected) == len(rows):
+            return rows
+        have = rows[:, 0].astype(np.int64)
+        missing = np.setdiff1d(expected, have)
+        fetched = self._fetch_range(symbol, interval, int(missing[0]), int(missing[-1]) + step)
+        if len(fetched):
+            fetched = fetched[np.isin(fetched[:, 0].astype(np.int64), missing)]
+            rows = np.concatenate([rows, fetched])
+            rows = rows[np.argsort(rows[:, 0], kind='stable')]
+            have = rows[:, 0].astype(np.int64)
+        out = np.empty((len(expected), len(KLINE_FIELDS)))
+        pos = np.searchsorted(expected, have)
+        out[:] = np.nan
+        out[pos] = rows
+        holes = np.flatnonzero(np.isnan(out[:, 0]))
+        if len(holes):
+            self.logger.info(f"{symbol} {interval}: {len(holes)} bar(s) missing upstream; filled flat")
+            prev_close = None if last is None else float(self._column(symbol, interval, 'close',
+                                                                       self.length(symbol, interval))[-1])
+            for i in holes:  # holes are rare and short; each copies the close before it
+                c = out[i - 1, 4] if i > 0 else prev_close
+                out[i] = [expected[i], c, c, c, c, 0.0, expected[i] + step - 1]
+        return out
+
+    def _fetch_range(self, symbol, interval, start_ms, end_ms):
+        if self.client is None:
+            return np.empty((0, len(KLINE_FIELDS)))
+        chunks = []
+        while start_ms < end_ms:
+            klines = self.client.get_klines(symbol=symbol, interval=interval, startTime=start_ms,
+                                            endTime=end_ms - 1, limit=1000)
+            rows = _klines_to_array(klines)
+            if not len(rows):
+                break
+            chunks.append(rows)
+            start_ms = int(rows[-1, 0]) + INTERVAL_MS[interval]
+            if len(rows) < 1000:
+                break
+        return np.concatenate(chunks) if chunks else np.empty((0, len(KLINE_FIELDS)))
+
+    def _write(self, symbol, interval, rows):
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        n = self.length(symbol, interval)
+        for i, field in enumerate(KLINE_FIELDS):
+            with open(self._path(symbol, interval, field), 'ab') as f:
+                f.write(np.ascontiguousarray(rows[:, i]).tobytes())
+        self._lengths[(symbol, interval)] = n + len(rows)
+        return len(rows)
+
+    def sync(self, symbol, interval, start_ms=None, now_ms=None):
+        """Fetch everything after the last stored bar (or from start_ms if empty) up to now"""
+        if self.client is None:
+            raise RuntimeError("KlineArchive.sync needs a client")
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        last = self.last_open_time(symbol, interval)
+        if last is None:
+            if start_ms is None:
+                raise ValueError(f"{symbol} {interval} is not archived yet; give a start time")
+            begin = int(start_ms) - int(start_ms) % INTERVAL_MS[interval]
+        else:
+            begin = last + INTERVAL_MS[interval]
+        written = 0
+        while begin < now_ms:
+            rows = self._fetch_range(symbol, interval, begin, min(now_ms, begin + 1000 * INTERVAL_MS[interval]))
+            if not len(rows):
+                begin += 1000 * INTERVAL_MS[interval]  # upstream hole longer than one page
+                continue
+            written += self.append(symbol, interval, rows, now_ms)
+            begin = int(rows[-1, 0]) + INTERVAL_MS[interval]
+        return written
+
+
+def main(argv=None):
+    import yaml
+    from binance.client import Client
+
+    parser = argparse.ArgumentParser(description="Kline archive maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_sync = sub.add_parser("sync", help="fetch missing bars from the exchange")
+    p_sync.add_argument("--config", default="settings.yaml")
+    p_sync.add_argument("--symbols", nargs="*")
+    p_sync.add_argument("--interval", default="1m")
+    p_sync.add_argument("--days", type=float, default=30, help="history to start from when a series is empty")
+    p_info = sub.add_parser("info", help="list archived series")
+    p_info.add_argument("--config", default="settings.yaml")
+    p_info.add_argument("--interval", default="1m")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with open(args.config, 'r') as f:
+        params = yaml.safe_load(f)
+    directory = params.get('archive', {}).get('dir', 'data/klines')
+
+    if args.cmd == "info":
+        archive = KlineArchive(directory)
+        for symbol in archive.symbols(args.interval):
+            n = archive.length(symbol, args.interval)
+            first, last = archive.first_open_time(symbol, args.interval), archive.last_open_time(symbol, args.interval)
+            print(f"{symbol:12s} {args.interval:4s} {n:>10d} bars  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(first / 1000))} -> "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(last / 1000))}")
+        return
+
+    archive = KlineArchive(directory, client=Client(tld='us'))
+    start = int((time.time() - args.days * 86_400) * 1000)
+    for symbol in args.symbols or params['symbols']:
+        written = archive.sync(symbol, args.interval, start_ms=start)
+        archive.logger.info(f"{symbol} {args.interval}: +{written} bars, {archive.length(symbol, args.interval)} total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from core.archive import KlineArchive
+from core.datafeed import INTERVAL_MS, KLINE_FIELDS
+from core.risk import RiskEngine
+from core.signals import entry_rule, exit_levels
+from core.sizing import aggressive_size
+
+
+# --- Data -----------------------------------------------------------------
+
+def load_klines(path):
+    """(bars, 7) float64 array in KLINE_FIELDS order from a .npy or a Binance kline CSV (header optional)"""
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.float64, copy=False)
+    df = pd.read_csv(path, header=None, usecols=range(len(KLINE_FIELDS)))
+    if not np.issubdtype(df[0].dtype, np.number):
+        df = df.iloc[1:]  # header row
+    return df.to_numpy(dtype=np.float64)
+
+
+def columns(klines):
+    """{field: 1-D array} view of a (bars, 7) klines array; column dicts (e.g. memmaps) pass through"""
+    if isinstance(klines, dict):
+        return klines
+    return {f: klines[:, i] for i, f in enumerate(KLINE_FIELDS)}
+
+
+def resample(klines, interval):
+    """Aggregate to `interval` bars (e.g. 1m -> 5m); a trailing incomplete bar is dropped"""
+    step = INTERVAL_MS[interval]
+    c = columns(klines)
+    open_time = np.asarray(c['open_time']).astype(np.int64)
+    base = int(np.median(np.diff(open_time))) if len(open_time) > 1 else step
+    if base >= step:
+        return klines
+    bucket = open_time // step
+    starts = np.r_[0, np.flatnonzero(np.diff(bucket)) + 1]
+    ends = np.r_[starts[1:], len(open_time)] - 1
+    out = np.column_stack([
+        bucket[starts] * step,
+        c['open'][starts],
+        np.maximum.reduceat(c['high'], starts),
+        np.minimum.reduceat(c['low'], starts),
+        c['close'][ends],
+        np.add.reduceat(c['volume'], starts),
+        bucket[starts] * step + step - 1,
+    ]).astype(np.float64)
+    if open_time[-1] + base < bucket[-1] * step + step:
+        out = out[:-1]
+    return out
+
+
+def synthetic_klines(days, interval='1m', seed=0, start_ms=1_600_000_000_000, price=100.0):
+    """Random-walk klines with volume bursts, for smoke tests and timing"""
+    rng = np.random.default_rng(seed)
+    step = INTERVAL_MS[interval]
+    n = int(days * 86_400_000 // step)
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.r_[price, close[:-1]]
+    spread = np.abs(rng.normal(0, 0.0008, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.lognormal(3, 0.5, n) * (1 + 4 * (rng.random(n) < 0.02))
+    t = start_ms + np.arange(n, dtype=np.int64) * step
+    return np.column_stack([t, open_, high, low, close, volume, t + step - 1]).astype(np.float64)
+
+
+# --- Indicators over long 1-D series ------------------------------------------
+
+def ema_1d(x, length):
+    """
+    ema() (adjust=False) without a per-bar loop. Within a chunk,
+    y[k] = q^(k+1) * (y_prev + a * cumsum(x[j] * q^-(j+1))); chunks are sized so the
+    q^-k weights stay far from overflow, and each chunk seeds the next.
+    """
+    a = 2.0 / (length + 1)
+    q = 1.0 - a
+    chunk = max(1, int(100 / -math.log10(q)))
+    out = np.empty(len(x))
+    prev = x[0]
+    k = np.arange(1, chunk + 1)
+    w = q ** -k.astype(np.float64)
+    decay = q ** k.astype(np.float64)
+    for s in range(0, len(x), chunk):
+        xs = x[s:s + chunk]
+        m = len(xs)
+        ys = decay[:m] * (prev + a * np.cumsum(xs * w[:m]))
+        out[s:s + m] = ys
+        prev = ys[-1]
+    return out
+
+
+def rolling_mean_1d(x, length):
+    out = np.full(len(x), np.nan)
+    if len(x) >= length:
+        c = np.cumsum(np.concatenate(([0.0], x)))
+        out[length - 1:] = (c[length:] - c[:-length]) / length
+    return out
+
+
+def rolling_std_1d(x, length):
+    """Sample std (ddof=1) over a trailing window, via centred running sums"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= length:
+        xc = x - x.mean()
+        c1 = np.cumsum(np.concatenate(([0.0], xc)))
+        c2 = np.cumsum(np.concatenate(([0.0], xc * xc)))
+        s1 = c1[length:] - c1[:-length]
+        s2 = c2[length:] - c2[:-length]
+        out[length - 1:] = np.sqrt(np.maximum(s2 - s1 * s1 / length, 0.0) / (length - 1))
+    return out
+
+
+def indicators_1d(high, low, close, volume, params):
+    """compute_indicators for one long series: (macd_line, macd_sig, ema_long, atr, volz)"""
+    macd_line = ema_1d(close, params['macd']['fast']) - ema_1d(close, params['macd']['slow'])
+    macd_sig = ema_1d(macd_line, params['macd']['signal'])
+    ema_long = ema_1d(close, params['ema']['len'])
+    prev = np.concatenate(([np.nan], close[:-1]))
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+    atrv = rolling_mean_1d(tr, params['atr_len'])
+    atrv[:params['atr_len']] = np.nan  # first TR is undefined, as in the pandas version
+    volz = (volume - rolling_mean_1d(volume, 20)) / (rolling_std_1d(volume, 20) + 1e-9)
+    return macd_line, macd_sig, ema_long, atrv, volz
+
+
+# --- Exits --------------------------------------------------------------------
+
+EXIT_REASONS = np.array(['sl', 'tp', 'trail', 'time'])
+
+
+def simulate_exits(cols, idx, entry, stop, tp, atr, params, horizon=None, batch=100_000):
+    """
+    For entries at the close of bars idx, the first exit over the next `horizon` bars:
+    stop (trailing trail_atr below the highest price once that is at or above entry), take-profit, or
+    the close of the last bar (time_bars). A bar touching both assumes the stop.
+    Returns (exit_bar, exit_price, reason_code) arrays, all computed with window matrices.
+    """
+    exits = params['exits']
+    horizon = horizon or exits.get('time_bars') or 500
+    trail = exits.get('trail_atr') or 0.0
+    last = cols['close'][-1]
+    o, h, l, c = (np.concatenate((cols[f], np.full(horizon, last))) for f in ('open', 'high', 'low', 'close'))
+    n = len(cols['close'])
+    steps = np.arange(1, horizon + 1)
+
+    exit_bar = np.empty(len(idx), dtype=np.int64)
+    exit_price = np.empty(len(idx))
+    reason = np.empty(len(idx), dtype=np.int8)
+    for s in range(0, len(idx), batch):
+        sl = slice(s, s + batch)
+        rows = idx[sl][:, None] + steps          # (entries, horizon) bar numbers
+        H, L, O = h[rows], l[rows], o[rows]
+        st = np.broadcast_to(stop[sl, None], H.shape)
+        if trail:
+            # Highest price seen before each bar (entry close included) sets that bar's trailing
+            # stop; it only takes over once it has reached entry, i.e. price ran trail_atr ATR
+            peak = np.maximum.accumulate(np.concatenate([entry[sl, None], H[:, :-1]], axis=1), axis=1)
+            trailing = peak - trail * atr[sl, None]
+            st = np.where(trailing >= entry[sl, None], np.maximum(st, trailing), st)
+        sl_hit = L <= st
+        hit = sl_hit | (H >= tp[sl, None])
+        k = hit.argmax(axis=1)
+        any_hit = hit[np.arange(len(k)), k]
+        r = np.arange(len(k))
+        is_sl = any_hit & sl_hit[r, k]
+        stop_k = st[r, k]
+        price = np.where(is_sl, np.minimum(O[r, k], stop_k), np.maximum(O[r, k], tp[sl]))
+        code = np.where(is_sl, np.where(stop_k > stop[sl], 2, 0), 1)
+
+        k = np.where(any_hit, k, horizon - 1)
+        bars = np.minimum(idx[sl] + 1 + k, n - 1)
+        exit_bar[sl] = bars
+        exit_price[sl] = np.where(any_hit, price, c[idx[sl] + horizon])
+        reason[sl] = np.where(any_hit, code, 3)
+    return exit_bar, exit_price, reason
+
+
+# --- Portfolio ----------------------------------------------------------------
+
+def candidates(symbol, klines, params, indicators=None):
+    """
+    Every bar whose close meets the entry rules, with its precomputed exit.
+    indicators: (macd_line, macd_sig, ema_long, atr, volz) aligned with klines, if already known.
+    """
+    cols = columns(klines)
+    close = np.ascontiguousarray(cols['close'])
+    if indicators is None:
+        high, low, volume = (np.ascontiguousarray(cols[f]) for f in ('high', 'low', 'volume'))
+        indicators = indicators_1d(high, low, close, volume, params)
+    macd_line, macd_sig, ema_long, atrv, volz = indicators
+    # No historical whale flag, so volume alone confirms
+    idx = np.flatnonzero(entry_rule(close, macd_line, macd_sig, ema_long, atrv, volz, False))
+    entry = close[idx]
+    atr = atrv[idx]
+    stop, tp = exit_levels(entry, atr, params)
+    exit_bar, exit_price, reason = simulate_exits(cols, idx, entry, stop, tp, atr, params)
+    close_time = cols['close_time']
+    return {
+        'symbol': symbol, 'time': close_time[idx].astype(np.int64), 'entry': entry, 'stop': stop, 'tp': tp,
+        'exit_time': close_time[exit_bar].astype(np.int64), 'exit_price': exit_price, 'reason': reason,
+    }
+
+
+def run(data, params, equity=10_000.0, fee_bps=10.0, indicators=None):
+    """
+    Backtest {symbol: klines array or column dict} on the trade timeframe. Candidate entries are walked in
+    time order (not bars): one position per symbol, the open-position cap, free cash,
+    aggressive_size and RiskEngine's daily stop and loss-streak cooldown on the simulated clock.
+    indicators: optional {symbol: precomputed indicator tuple}, e.g. from an optimizer cache.
+    Returns (report dict, trades DataFrame).
+    """
+    indicators = indicators or {}
+    cands = [candidates(s, k, params, indicators.get(s)) for s, k in data.items()
+             if len(columns(k)['close'])]
+    if not cands:
+        return summarize([], equity, equity, []), pd.DataFrame()
+    sym_of = np.concatenate([np.full(len(c['time']), i) for i, c in enumerate(cands)])
+    cat = {f: np.concatenate([c[f] for c in cands]) for f in cands[0] if f != 'symbol'}
+    order = np.lexsort((sym_of, cat['time']))
+
+    fee = fee_bps / 10_000
+    risk = RiskEngine(params)
+    cash = equity
+    realized = equity
+    open_heap = []            # (exit_time, seq, symbol_id, qty, entry, exit_price, reason, entry_time)
+    busy_until = {}           # symbol_id -> exit time of its open position
+    trades, curve = [], [(int(cat['time'][order[0]]) if len(order) else 0, equity)]
+    day = None
+    cap = params['limits']['max_trades_day']
+
+    def close_until(t):
+        nonlocal cash, realized
+        while open_heap and open_heap[0][0] <= t:
+            exit_time, _, sid, qty, entry, price, reason, entry_time = heapq.heappop(open_heap)
+            proceeds = qty * price * (1 - fee)
+            pnl = proceeds - qty * entry * (1 + fee)
+            cash += proceeds
+            realized += pnl
+            risk.record_trade_pnl(pnl, now_ts=exit_time / 1000)
+            trades.append((cands[sid]['symbol'], entry_time, exit_time, entry, price, qty, pnl,
+                           EXIT_REASONS[reason]))
+            curve.append((exit_time, realized))
+
+    for seq, j in enumerate(order):
+        t = int(cat['time'][j])
+        sid = int(sym_of[j])
+        close_until(t)
+        if busy_until.get(sid, -1) >= t:
+            continue
+        d = t // 86_400_000
+        if d != day:
+            day = d
+            risk.on_new_day(realized)
+        ok, _ = risk.can_trade_now(t / 1000, realized)
+        if not ok or len(open_heap) >= cap:
+            continue
+        entry = float(cat['entry'][j])
+        qty, _ = aggressive_size(realized, params['account']['managed_fraction'], params['risk']['per_trade'],
+                                 entry, float(cat['stop'][j]), params['risk']['max_symbol_alloc'])
+        cost = qty * entry * (1 + fee)
+        if qty <= 0 or cost > cash:
+            continue
+        cash -= cost
+        exit_time = int(cat['exit_time'][j])
+        busy_until[sid] = exit_time
+        heapq.heappush(open_heap, (exit_time, seq, sid, qty, entry, float(cat['exit_price'][j]),
+                                   int(cat['reason'][j]), t))
+    close_until(float('inf'))
+
+    fields = ['symbol', 'entry_time', 'exit_time', 'entry', 'exit', 'qty', 'pnl', 'reason']
+    trades_df = pd.DataFrame(trades, columns=fields)
+    return summarize(trades, equity, realized, curve, candidates_seen=len(order)), trades_df
+
+
+def summarize(trades, start_equity, end_equity, curve, candidates_seen=0):
+    pnl = np.array([t[6] for t in trades])
+    eq = np.array([e for _, e in curve]) if curve else np.array([start_equity])
+    peak = np.maximum.accumulate(eq)
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    report = {
+        'start_equity': start_equity,
+        'end_equity': round(float(end_equity), 2),
+        'return_pct': round(100 * (end_equity / start_equity - 1), 2),
+        'max_drawdown_pct': round(float(100 * ((peak - eq) / peak).max()), 2) if len(eq) else 0.0,
+        'trades': int(len(pnl)),
+        'signals': int(candidates_seen),
+        'win_rate_pct': round(100 * len(wins) / len(pnl), 2) if len(pnl) else 0.0,
+        'avg_win': round(float(wins.mean()), 2) if len(wins) else 0.0,
+        'avg_loss': round(float(losses.mean()), 2) if len(losses) else 0.0,
+        'profit_factor': round(float(wins.sum() / -losses.sum()), 3) if len(losses) and losses.sum() else None,
+        'exits': {},
+        'by_symbol': {},
+    }
+    for t in trades:
+        report['exits'][t[7]] = report['exits'].get(t[7], 0) + 1
+        s = report['by_symbol'].setdefault(t[0], {'trades': 0, 'pnl': 0.0})
+        s['trades'] += 1
+        s['pnl'] = round(s['pnl'] + t[6], 2)
+    return report
+
+
+def load_dir(directory, symbols=None, interval=None):
+    """{symbol: klines} from <SYMBOL>[-_.]*.csv|.npy files, resampled to `interval`"""
+    data = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(('.csv', '.npy')):
+            continue
+        symbol = name.replace('-', '.').replace('_', '.').split('.')[0].upper()
+        if symbols and symbol not in symbols:
+            continue
+        klines = load_klines(os.path.join(directory, name))
+        data[symbol] = np.concatenate([data[symbol], klines]) if symbol in data else klines
+    for symbol, klines in data.items():
+        klines = klines[np.argsort(klines[:, 0], kind='stable')]
+        data[symbol] = resample(klines, interval) if interval else klines
+    return data
+
+
+def load_archive(directory, symbols, interval=None, source='1m', start=None, end=None):
+    """
+    {symbol: klines} from a core.archive.KlineArchive. A series archived at `interval`
+    itself is returned as its memory-mapped columns; otherwise `source` bars are resampled.
+    """
+    archive = KlineArchive(directory)
+    data = {}
+    for symbol in symbols:
+        src = interval if interval and archive.length(symbol, interval) else source
+        cols = archive.load(symbol, src, start, end)
+        if not len(cols['open_time']):
+            continue
+        data[symbol] = resample(cols, interval) if interval and interval != src else cols
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the strategy over historical klines")
+    parser.add_argument("data", nargs="?", help="directory of <SYMBOL>*.csv / .npy kline files")
+    parser.add_argument("--config", default="settings.yaml")
+    parser.add_argument("--symbols", nargs="*", help="default: settings symbols")
+    parser.add_argument("--interval", help="resample to this timeframe (default: timeframes.trade)")
+    parser.add_argument("--equity", type=float, default=10_000.0)
+    parser.add_argument("--fee-bps", type=float, default=10.0, help="per side")
+    parser.add_argument("--synthetic", type=float, metavar="DAYS",
+                        help="ignore data and use random-walk 1m klines for this many days")
+    parser.add_argument("--archive", metavar="DIR", help="read klines from a kline archive (see core.archive)")
+    parser.add_argument("--archive-interval", default="1m", help="archived interval to resample from")
+    parser.add_argument("--trades", help="write the trade list to this CSV")
+    parser.add_argument("--json", help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r') as f:
+        params = yaml.safe_load(f)
+    interval = args.interval or params['timeframes']['trade']
+    symbols = args.symbols or params['symbols']
+
+    t0 = time.perf_counter()
+    if args.synthetic:
+        data = {s: resample(synthetic_klines(args.synthetic, seed=i), interval) for i, s in enumerate(symbols)}
+    elif args.archive:
+        data = load_archive(args.archive, symbols, interval, args.archive_interval)
+    elif args.data:
+        data = load_dir(args.data, set(symbols), interval)
+    else:
+        parser.error("give a data directory, --archive DIR or --synthetic DAYS")
+    t1 = time.perf_counter()
+    report, trades = run(data, params, equity=args.equity, fee_bps=args.fee_bps)
+    t2 = time.perf_counter()
+
+    bars = sum(len(columns(k)['close']) for k in data.values())
+    report['bars'] = bars
+    report['load_s'] = round(t1 - t0, 3)
+    report['run_s'] = round(t2 - t1, 3)
+    print(json.dumps(report, indent=2))
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import yaml
+
+BENCHMARKS = {}  # name -> (fn, params, full_params)
+
+
+def benchmark(name, params, full=()):
+    """
+    Register a benchmark. fn(param, config) is a generator: setup, then `yield run` (a
+    zero-argument callable, the timed part), then teardown. `config` is the loaded
+    settings.yaml. `full` params only run with --full.
+    """
+    def register(fn):
+        BENCHMARKS[name] = (fn, list(params), list(full))
+        return fn
+    return register
+
+
+def measure(run, sample_time=0.05, repeat=5, max_time=10.0):
+    """
+    asv-style timing: calls per sample are calibrated so a sample takes about sample_time,
+    then up to `repeat` samples are taken (fewer if max_time runs out). Per-call seconds.
+    """
+    t0 = time.perf_counter()
+    run()  # warm-up, also the calibration sample
+    first = time.perf_counter() - t0
+    number = max(1, int(sample_time / first)) if first > 0 else 1000
+    samples = [first] if number == 1 else []
+    started = time.perf_counter()
+    while len(samples) < repeat and (not samples or time.perf_counter() - started < max_time):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - t0) / number)
+    return {'median_s': statistics.median(samples), 'min_s': min(samples), 'samples': len(samples),
+            'number': number}
+
+
+def _frame(bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+    wick = np.abs(rng.normal(0, 0.001, bars)) * close
+    return pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods=bars, freq='5min'),
+                         'open': close, 'high': close + wick, 'low': close - wick, 'close': close,
+                         'volume': rng.uniform(1, 50, bars)})
+
+
+def load_config(path="settings.yaml"):
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+_QUIET = logging.getLogger("bench")
+_QUIET.setLevel(logging.CRITICAL)
+
+
+# --- Signals ----------------------------------------------------------------
+
+@benchmark("signals.compute_indicators", [300, 1_000, 10_000], full=[100_000])
+def bench_compute_indicators(bars, p):
+    from core.signals import compute_indicators
+    df = _frame(bars)
+    yield lambda: compute_indicators(df, p['macd']['fast'], p['macd']['slow'], p['macd']['signal'],
+                                     p['ema']['len'], p['atr_len'])
+
+
+@benchmark("signals.generate_signal", [300, 1_000, 10_000])
+def bench_generate_signal(bars, p):
+    from core.signals import generate_signal
+    df = _frame(bars)
+    yield lambda: generate_signal(df, False, p)
+
+
+@benchmark("signals.batch_symbols", [10, 100])
+def bench_signals_batch(symbols, p):
+    from core.signals import generate_signals_batch
+    frames = {f"S{i}USD": _frame(300, seed=i) for i in range(symbols)}
+    flags = {s: False for s in frames}
+    yield lambda: generate_signals_batch(frames, flags, p)
+
+
+@benchmark("signals.streaming_bar", [1])
+def bench_streaming_bar(_, p):
+    from core.signals import StreamingIndicators
+    df = _frame(400)
+    state = StreamingIndicators.from_history(df.iloc[:300], p)
+    rows = df.iloc[300:][['high', 'low', 'close', 'volume']].to_numpy()
+    i = [0]
+
+    def run():
+        h, l, c, v = rows[i[0] % len(rows)]
+        state.signal(h, l, c, v, False, p)
+        state.update(h, l, c, v)
+        i[0] += 1
+    yield run
+
+
+# --- Whales -----------------------------------------------------------------
+
+@benchmark("whales.whale_flag", [10, 100, 1_000], full=[5_000])
+def bench_whale_flag(trades_per_s, p):
+    """One poll (a second of trades at this rate) plus the flag decision, through DataFeed"""
+    from core.datafeed import DataFeed
+    from core.fake_exchange import FakeMarket
+    p = p['whales']
+    client = FakeMarket(['BTCUSD'], bars=10, trades_per_s=trades_per_s)
+    feed = DataFeed(client, _QUIET, whale_windows_min=p.get('windows_min', [p['window_min']]))
+    run = lambda: feed.whale_flag('BTCUSD', window_min=p['window_min'], single_trade=p['single_trade'],
+                                  window_notional=p['window_notional'], imbalance=p['imbalance'])
+    run()
+    yield run
+
+
+# --- Storage ----------------------------------------------------------------
+
+def _storage(backend, directory):
+    from core.storage import open_storage
+    return open_storage({'storage': {'backend': backend, 'data_dir': directory}}, _QUIET)
+
+
+def _trade(i):
+    return {'symbol': ('BTCUSD', 'SOLUSD', 'ETHUSD')[i % 3], 'side': 'SELL', 'role': 'TP' if i % 2 else 'SL',
+            'quantity': 0.01, 'price': 100.0 + i % 97, 'pnl': (i % 7) - 3.0, 'clientOrderId': f"X-SELL-TP-{i:08d}"}
+
+
+def _fill(storage, records):
+    for i in range(records):
+        storage.log_trade_close(_trade(i))
+    if hasattr(storage, 'flush'):
+        storage.flush()
+
+
+@benchmark("storage.write.jsonl", [1_000, 10_000, 100_000], full=[1_000_000])
+def bench_write_jsonl(records, p):
+    root = tempfile.mkdtemp(prefix="bench-")
+    runs = [0]
+
+    def run():
+        runs[0] += 1
+        storage = _storage('jsonl', os.path.join(root, str(runs[0])))
+        _fill(storage, records)
+        storage.close()
+    yield run
+    shutil.rmtree(root, ignore_errors=True)
+
+
+@benchmark("storage.write.sqlite", [1_000, 10_000, 100_000], full=[1_000_000])
+def bench_write_sqlite(records, p):
+    root = tempfile.mkdtemp(prefix="bench-")
+    runs = [0]
+
+    def run():
+        runs[0] += 1
+        storage = _storage('sqlite', os.path.join(root, str(runs[0])))
+        _fill(storage, records)
+        storage.close()
+    yield run
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def _read_bench(backend, records, read):
+    root = tempfile.mkdtemp(prefix="bench-")
+    storage = _storage(backend, root)
+    _fill(storage, records)
+    yield lambda: read(storage)
+    storage.close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+@benchmark("storage.recent.jsonl", [1_000, 100_000], full=[1_000_000])
+def bench_recent_jsonl(records, p):
+    yield from _read_bench('jsonl', records, lambda s: s.get_recent_trades(50, symbol='SOLUSD'))
+
+
+@benchmark("storage.recent.sqlite", [1_000, 100_000], full=[1_000_000])
+def bench_recent_sqlite(records, p):
+    yield from _read_bench('sqlite', records, lambda s: s.get_recent_trades(50, symbol='SOLUSD'))
+
+
+@benchmark("storage.scan.jsonl", [1_000, 100_000], full=[1_000_000])
+def bench_scan_jsonl(records, p):
+    yield from _read_bench('jsonl', records, lambda s: s.get_trades(symbol='ETHUSD'))
+
+
+@benchmark("storage.scan.sqlite", [1_000, 100_000], full=[1_000_000])
+def bench_scan_sqlite(records, p):
+    yield from _read_bench('sqlite', records, lambda s: s.get_trades(symbol='ETHUSD'))
+
+
+# --- Engine -----------------------------------------------------------------
+
+def _engine(symbols, latency_ms, root, p):
+    from core.account import Account
+    from core.broker import LiveBroker
+    from core.datafeed import DataFeed
+    from core.engine import Engine
+    from core.fake_exchange import FakeMarket
+    client = FakeMarket(symbols, bars=600, trades_per_s=50, latency_s=latency_ms / 1000)
+    account = Account(client, _QUIET, snapshot_ttl=p['account'].get('snapshot_ttl_s', 10))
+    feed = DataFeed(client, _QUIET, account=account,
+                    whale_windows_min=p['whales'].get('windows_min', [p['whales']['window_min']]))
+    broker = LiveBroker(client, account.precision_map(), filters=account.filters())
+    return Engine(broker, feed, account, p, _storage('jsonl', root), _QUIET)
+
+
+@benchmark("engine.tick", [0, 20, 50])
+def bench_engine_tick(latency_ms, p):
+    """One symbol end to end (risk gate, klines + trades over REST, signal) at this REST latency"""
+    root = tempfile.mkdtemp(prefix="bench-")
+    engine = _engine(['BTCUSD'], latency_ms, root, p)
+    engine.tick('BTCUSD')
+    yield lambda: engine.tick('BTCUSD')
+    engine.storage.close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+@benchmark("engine.scan_20_symbols", [0, 20, 50])
+def bench_engine_scan(latency_ms, p):
+    """Engine.scan over 20 symbols: gather fan-out on the worker pool at this REST latency"""
+    root = tempfile.mkdtemp(prefix="bench-")
+    symbols = [f"S{i:02d}USD" for i in range(20)]
+    engine = _engine(symbols, latency_ms, root, p)
+    engine.scan(symbols)
+    yield lambda: engine.scan(symbols)
+    engine.storage.close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+# --- Runner -----------------------------------------------------------------
+
+def machine():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'processor': platform.processor() or platform.node(),
+            'cpus': os.cpu_count()}
+
+
+def run_all(config, pattern=None, full=False, sample_time=0.05, repeat=5, max_time=10.0, out=sys.stdout,
+            smallest=False):
+    """Run the registered benchmarks against `config` (settings dict); `smallest` runs each at its first param"""
+    results = {}
+    for name, (fn, params, full_params) in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        sizes = params[:1] if smallest else params + (full_params if full else [])
+        for param in sizes:
+            key = f"{name}[{param}]"
+            gen = fn(param, config)
+            try:
+                run = next(gen)
+                results[key] = measure(run, sample_time, repeat, max_time)
+            except Exception as e:
+                results[key] = {'error': f"{type(e).__name__}: {e}"}
+            finally:
+                gen.close()  # runs the teardown after the yield
+            r = results[key]
+            out.write(f"{key:45s} {'ERROR ' + r['error'] if 'error' in r else _fmt(r['median_s'])}\n")
+            out.flush()
+    return results
+
+
+def _fmt(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:9.3f} {unit}"
+    return f"{seconds / 1e-9:9.1f} ns"
+
+
+def compare(results, baseline, tolerance):
+    """(key, baseline_s, now_s, ratio, verdict) per benchmark present in both"""
+    rows = []
+    for key, r in results.items():
+        b = baseline.get('results', {}).get(key)
+        if 'error' in r or not b or 'median_s' not in b:
+            continue
+        ratio = r['median_s'] / b['median_s']
+        verdict = 'REGRESSION' if ratio > 1 + tolerance else 'faster' if ratio < 1 / (1 + tolerance) else 'ok'
+        rows.append((key, b['median_s'], r['median_s'], ratio, verdict))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Engine.tick hot path and storage I/O")
+    parser.add_argument("-k", dest="pattern", help="only benchmarks whose name contains this")
+    parser.add_argument("--list", action="store_true", help="list benchmarks and exit")
+    parser.add_argument("--full", action="store_true", help="include the large sizes (1M records, ...)")
+    parser.add_argument("--quick", action="store_true", help="only the smallest size of each benchmark")
+    parser.add_argument("--config", default="settings.yaml")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save", action="store_true", help="write these results into the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown over baseline flagged (0.25 = 25%%)")
+    parser.add_argument("--sample-time", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-time", type=float, default=10.0, help="time budget per benchmark")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (_, params, full_params) in BENCHMARKS.items():
+            print(f"{name:35s} {params}" + (f" + full {full_params}" if full_params else ""))
+        return 0
+
+    results = run_all(load_config(args.config), args.pattern, args.full, args.sample_time, args.repeat,
+                      args.max_time, smallest=args.quick)
+    report = {'machine': machine(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != report['machine']:
+            print(f"\nwarning: baseline was recorded on {baseline.get('machine')}; timings may not compare")
+        rows = compare(results, baseline, args.tolerance)
+        if rows:
+            print(f"\n{'benchmark':45s} {'baseline':>12s} {'now':>12s} {'ratio':>7s}")
+            for key, b, now, ratio, verdict in rows:
+                print(f"{key:45s} {_fmt(b):>12s} {_fmt(now):>12s} {ratio:7.2f}  {verdict}")
+        regressions = [r[0] for r in rows if r[4] == 'REGRESSION']
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+            status = 1
+    elif not args.save:
+        print(f"\nno baseline at {args.baseline}; run with --save to record one")
+
+    if args.save:
+        merged = {'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                merged = json.load(f)
+        merged['machine'], merged['created'] = report['machine'], report['created']
+        merged.setdefault('results', {}).update({k: v for k, v in results.items() if 'error' not in v})
+        with open(args.baseline, 'w') as f:
+            json.dump(merged, f, indent=2, sort_keys=True)
+        print(f"\nbaseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
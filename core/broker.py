@@ -1,61 +1,317 @@
+import logging
 import uuid
 import time
+import threading
+from collections import deque
 from typing import Optional
 
+import numpy as np
+from binance.exceptions import BinanceAPIException, BinanceOrderException
+
+TRANSIENT_CODES = {-1001, -1006, -1007}  # disconnected / unexpected response / timeout: outcome unknown
+UNKNOWN_ORDER = -2013
+
+
+def _rejected(e):
+    """The exchange (or the client, before sending) definitively refused the request: nothing was placed"""
+    if isinstance(e, BinanceOrderException):
+        return True
+    return isinstance(e, BinanceAPIException) and e.code not in TRANSIENT_CODES and e.status_code < 500
+
+
+def _oco_unsupported(e):
+    """A rejection of OCO itself for the symbol, as opposed to this order's prices or quantity"""
+    msg = (getattr(e, 'message', None) or str(e)).lower()
+    return _rejected(e) and 'oco' in msg and ('support' in msg or 'allow' in msg)
+
+
+class OrderNotPlaced(Exception):
+    """A request whose response was lost, confirmed by lookup not to be on the exchange"""
+
+
+class BracketBook:
+    """
+    Our own open brackets, indexed by every leg's clientOrderId.
+    Lets a fill find its role and sibling with a dict lookup instead of scanning open orders.
+    """
+    def __init__(self):
+        self._by_cid = {}  # clientOrderId -> (bracket, role)
+        self._lock = threading.Lock()
+
+    def register(self, symbol, qty, entry_price, entry_cid, sl_cid, tp_cid, native_oco=False):
+        bracket = {'symbol': symbol, 'qty': qty, 'entry_price': entry_price, 'native_oco': native_oco,
+                   'ENTRY': entry_cid, 'SL': sl_cid, 'TP': tp_cid}
+        with self._lock:
+            for role in ('ENTRY', 'SL', 'TP'):
+                if bracket[role]:
+                    self._by_cid[bracket[role]] = (bracket, role)
+        return bracket
+
+    def lookup(self, client_order_id):
+        """(bracket, role) for one of our legs, or None"""
+        return self._by_cid.get(client_order_id)
+
+    def sibling(self, client_order_id):
+        """clientOrderId of the other exit leg, or None"""
+        hit = self._by_cid.get(client_order_id)
+        if not hit or hit[1] not in ('SL', 'TP'):
+            return None
+        bracket, role = hit
+        return bracket['TP' if role == 'SL' else 'SL']
+
+    def close(self, client_order_id):
+        """Forget the bracket this leg belongs to"""
+        with self._lock:
+            hit = self._by_cid.get(client_order_id)
+            if hit:
+                for role in ('ENTRY', 'SL', 'TP'):
+                    self._by_cid.pop(hit[0][role], None)
+
+    def open_brackets(self):
+        with self._lock:
+            seen = {}
+            for bracket, _ in self._by_cid.values():
+                seen[id(bracket)] = bracket
+            return list(seen.values())
+
+
 class LiveBroker:
     """
     Thin wrapper around your Binance.US client.
     - Places MARKET entry.
-    - Immediately places separate STOP_LOSS_LIMIT and LIMIT_TP (emulated OCO).
-    - Monitors and cancels sibling on fill.
+    - Protects it with one native OCO exit where the symbol allows it; otherwise places
+      separate STOP_LOSS_LIMIT and LIMIT_TP (emulated OCO).
+    - Monitors and cancels sibling on fill (emulated brackets only).
+    - Records per-step round-trip latency (entry, oco, stop_loss, take_profit, cancel).
     """
-    def __init__(self, client, symbol_precisions):
+    def __init__(self, client, symbol_precisions, native_oco="auto", latency_window=500, filters=None,
+                 metrics=None, logger=None):
         self.client = client
+        self.logger = logger or logging.getLogger(__name__)
         self.symbol_precisions = symbol_precisions  # e.g., {"BTCUSD": {"qty": 6, "price": 2}}
+        self.filters = filters  # FilterTable: exact stepSize/tickSize quantization where available
+        self.brackets = BracketBook()
+        self.native_oco = native_oco  # "auto" (exchangeInfo ocoAllowed), True or False
+        self._oco_allowed = {}        # symbol -> bool from REST or a rejected OCO; overrides the filter table
+        self.latency = {}             # step -> deque of seconds
+        self.latency_window = latency_window
+        self.metrics = metrics        # optional core.metrics.Metrics: order_<step> stages per symbol
+
+    def _observe(self, step, elapsed, symbol=""):
+        self.latency.setdefault(step, deque(maxlen=self.latency_window)).append(elapsed)
+        if self.metrics is not None:
+            self.metrics.observe('bot_stage_seconds', elapsed, f"order_{step}", symbol or "")
+
+    def _timed(self, step, fn, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(**kwargs)
+        finally:
+            self._observe(step, time.perf_counter() - t0, kwargs.get('symbol'))
+
+    def latency_stats(self):
+        """step -> {'count', 'p50_ms', 'p99_ms'} over the recent window"""
+        out = {}
+        for step, samples in self.latency.items():
+            arr = np.array(samples) * 1000
+            out[step] = {'count': len(arr), 'p50_ms': float(np.percentile(arr, 50)),
+                         'p99_ms': float(np.percentile(arr, 99))}
+        return out
+
+    def supports_oco(self, symbol):
+        """
+        ocoAllowed from the filter table's exchangeInfo, else one get_symbol_info per symbol.
+        A failed lookup answers False for this bracket only; it is not remembered.
+        """
+        if self.native_oco != "auto":
+            return bool(self.native_oco)
+        if symbol in self._oco_allowed:
+            return self._oco_allowed[symbol]
+        f = self.filters.get(symbol) if self.filters is not None else None
+        if f is not None and f.oco_allowed is not None:
+            return f.oco_allowed
+        try:
+            info = self.client.get_symbol_info(symbol) or {}
+        except Exception as e:
+            self.logger.warning(f"Could not look up ocoAllowed for {symbol}, using separate exits: {e}")
+            return False
+        self._oco_allowed[symbol] = bool(info.get('ocoAllowed', False))
+        return self._oco_allowed[symbol]
 
     def _round(self, symbol, qty=None, price=None):
+        """Quantity floored to stepSize and price snapped to tickSize, as order-ready strings"""
+        f = self.filters.get(symbol) if self.filters is not None else None
+        if f is not None:
+            rq = f.quantize_qty(qty) if qty is not None else None
+            rp = f.quantize_price(price) if price is not None else None
+            return rq, rp
         p = self.symbol_precisions[symbol]
-        rq = round(qty, p['qty']) if qty is not None else None
-        rp = round(price, p['price']) if price is not None else None
+        rq = f"{round(qty, p['qty']):.{p['qty']}f}" if qty is not None else None
+        rp = f"{round(price, p['price']):.{p['price']}f}" if price is not None else None
         return rq, rp
 
-    def place_market_entry(self, symbol: str, side: str, qty: float, client_id: Optional[str]=None):
+    def check_order(self, symbol, qty, price, market=False):
+        """Why the exchange would reject this order's filters, or None (always None without a table)"""
+        f = self.filters.get(symbol) if self.filters is not None else None
+        return f.check(qty, price, market) if f is not None else None
+
+    # Request builders: one place for rounding and the clientOrderId scheme, shared with AsyncLiveBroker
+
+    def _entry_request(self, symbol, side, qty, client_id=None):
         client_id = client_id or f"{symbol}-{side}-ENT-{uuid.uuid4().hex[:10]}"
         qty, _ = self._round(symbol, qty=qty)
-        # Replace below with your client call for MARKET order:
-        resp = self.client.create_order(symbol=symbol, side=side, type="MARKET", quantity=str(qty), newClientOrderId=client_id)
-        return resp
+        return dict(symbol=symbol, side=side, type="MARKET", quantity=qty, newClientOrderId=client_id)
 
-    def place_stop_loss(self, symbol, side, qty, stop_price, limit_price, client_id=None):
+    def _stop_loss_request(self, symbol, side, qty, stop_price, limit_price, client_id=None):
         # Opposite side for exit
         exit_side = "SELL" if side == "BUY" else "BUY"
         qty, stop_price = self._round(symbol, qty=qty, price=stop_price)
         _, limit_price = self._round(symbol, price=limit_price)
         cid = client_id or f"{symbol}-{exit_side}-SL-{uuid.uuid4().hex[:8]}"
-        # Replace with your STOP_LOSS_LIMIT call; on Binance.US it's typically type="STOP_LOSS_LIMIT"
-        return self.client.create_order(symbol=symbol, side=exit_side, type="STOP_LOSS_LIMIT",
-                                     quantity=str(qty), price=str(limit_price),
-                                     stopPrice=str(stop_price), timeInForce="GTC",
-                                     newClientOrderId=cid)
+        # On Binance.US the stop leg is type="STOP_LOSS_LIMIT"
+        return dict(symbol=symbol, side=exit_side, type="STOP_LOSS_LIMIT", quantity=qty,
+                    price=limit_price, stopPrice=stop_price, timeInForce="GTC", newClientOrderId=cid)
 
-    def place_take_profit(self, symbol, side, qty, tp_price, client_id=None):
+    def _take_profit_request(self, symbol, side, qty, tp_price, client_id=None):
         exit_side = "SELL" if side == "BUY" else "BUY"
         qty, tp_price = self._round(symbol, qty=qty, price=tp_price)
         cid = client_id or f"{symbol}-{exit_side}-TP-{uuid.uuid4().hex[:8]}"
-        return self.client.create_order(symbol=symbol, side=exit_side, type="LIMIT",
-                                     quantity=str(qty), price=str(tp_price),
-                                     timeInForce="GTC", newClientOrderId=cid)
+        return dict(symbol=symbol, side=exit_side, type="LIMIT", quantity=qty, price=tp_price,
+                    timeInForce="GTC", newClientOrderId=cid)
+
+    def _oco_request(self, symbol, side, qty, stop_price, limit_price, tp_price):
+        exit_side = "SELL" if side == "BUY" else "BUY"
+        qty, stop_price = self._round(symbol, qty=qty, price=stop_price)
+        _, limit_price = self._round(symbol, price=limit_price)
+        _, tp_price = self._round(symbol, price=tp_price)
+        tag = uuid.uuid4().hex[:8]
+        return dict(symbol=symbol, side=exit_side, quantity=qty, price=tp_price,
+                    stopPrice=stop_price, stopLimitPrice=limit_price, stopLimitTimeInForce="GTC",
+                    listClientOrderId=f"{symbol}-{exit_side}-OCO-{tag}",
+                    limitClientOrderId=f"{symbol}-{exit_side}-TP-{tag}",
+                    stopClientOrderId=f"{symbol}-{exit_side}-SL-{tag}")
+
+    @staticmethod
+    def _oco_legs(request, resp):
+        """(sl_resp, tp_resp) from an OCO response, keyed by the clientOrderIds we sent"""
+        sl_cid, tp_cid = request['stopClientOrderId'], request['limitClientOrderId']
+        reports = {r.get('clientOrderId'): r for r in resp.get('orderReports') or resp.get('orders') or []}
+        return (dict(reports.get(sl_cid) or {}, clientOrderId=sl_cid),
+                dict(reports.get(tp_cid) or {}, clientOrderId=tp_cid))
+
+    def place_market_entry(self, symbol: str, side: str, qty: float, client_id: Optional[str]=None):
+        return self._timed("entry", self.client.create_order, **self._entry_request(symbol, side, qty, client_id))
+
+    def place_stop_loss(self, symbol, side, qty, stop_price, limit_price, client_id=None):
+        return self._timed("stop_loss", self.client.create_order,
+                           **self._stop_loss_request(symbol, side, qty, stop_price, limit_price, client_id))
+
+    def place_take_profit(self, symbol, side, qty, tp_price, client_id=None):
+        return self._timed("take_profit", self.client.create_order,
+                           **self._take_profit_request(symbol, side, qty, tp_price, client_id))
+
+    def place_oco_exit(self, symbol, side, qty, stop_price, limit_price, tp_price):
+        """
+        One native OCO: LIMIT take-profit + STOP_LOSS_LIMIT; the exchange cancels the loser.
+        When the outcome is unknown (timeout, 5xx, -1001/-1006/-1007) the legs are looked up by
+        clientOrderId: found -> returned as if acked, absent -> OrderNotPlaced, lookup failing
+        -> RuntimeError. Definitive rejections are raised as they come.
+        """
+        request = self._oco_request(symbol, side, qty, stop_price, limit_price, tp_price)
+        try:
+            resp = self._timed("oco", self.client.create_oco_order, **request)
+        except Exception as e:
+            if _rejected(e):
+                raise
+            resp = self._find_oco(request, e)
+        return self._oco_legs(request, resp)
+
+    def _find_oco(self, request, error):
+        """The OCO's legs as an orderReports response if either reached the book"""
+        legs = []
+        for cid in (request['stopClientOrderId'], request['limitClientOrderId']):
+            try:
+                legs.append(self.client.get_order(symbol=request['symbol'], origClientOrderId=cid))
+            except BinanceAPIException as e:
+                if e.code != UNKNOWN_ORDER:
+                    raise RuntimeError(f"OCO {request['listClientOrderId']} outcome unknown ({error}); "
+                                       f"lookup failed: {e}") from error
+            except Exception as e:
+                raise RuntimeError(f"OCO {request['listClientOrderId']} outcome unknown ({error}); "
+                                   f"lookup failed: {e}") from error
+        if not legs:
+            raise OrderNotPlaced(f"OCO {request['listClientOrderId']} not on the exchange ({error})") from error
+        return {'listClientOrderId': request['listClientOrderId'], 'orderReports': legs}
+
+    def _oco_rejected(self, symbol):
+        # Never leave the entry naked: remember the rejection and emulate instead
+        self._oco_allowed[symbol] = False
+        if self.native_oco is True:
+            self.native_oco = "auto"
+
+    def place_exits(self, symbol, side, qty, stop_price, limit_price, tp_price):
+        """
+        Protect a filled entry. Returns (sl_resp, tp_resp, native): native OCO where supported,
+        falling back to two separate orders if the symbol disallows it or the OCO was definitely
+        not placed. Only a rejection of OCO itself disables it for the symbol. If the OCO's
+        outcome can't be established the error propagates: separate exits on top of a live
+        OCO would sell the position twice.
+        """
+        if self.supports_oco(symbol):
+            try:
+                sl_resp, tp_resp = self.place_oco_exit(symbol, side, qty, stop_price, limit_price, tp_price)
+                return sl_resp, tp_resp, True
+            except Exception as e:
+                if not (_rejected(e) or isinstance(e, OrderNotPlaced)):
+                    raise
+                if _oco_unsupported(e):
+                    self._oco_rejected(symbol)
+        sl_resp = self.place_stop_loss(symbol, side, qty, stop_price=stop_price, limit_price=limit_price)
+        tp_resp = self.place_take_profit(symbol, side, qty, tp_price=tp_price)
+        return sl_resp, tp_resp, False
+
+    def place_bracket(self, symbol, side, qty, stop_price, limit_price, tp_price):
+        """
+        Entry then exits: (entry_resp, sl_resp, tp_resp, native_oco).
+        Exits cover the entry's executedQty (re-quantized to the lot step), so a partial fill
+        is not oversold; an entry that filled nothing gets no exits.
+        """
+        entry_resp = self.place_market_entry(symbol, side, qty)
+        executed = (entry_resp or {}).get('executedQty')
+        filled = float(executed) if executed is not None else qty
+        if filled <= 0:
+            self.logger.error(f"Entry {entry_resp.get('clientOrderId')} for {symbol} not filled "
+                              f"({entry_resp.get('status')}); no exits placed")
+            return entry_resp, None, None, False
+        if filled < qty:
+            self.logger.warning(f"Entry for {symbol} only filled {filled}/{qty}; protecting the filled quantity")
+        sl_resp, tp_resp, native = self.place_exits(symbol, side, filled, stop_price, limit_price, tp_price)
+        return entry_resp, sl_resp, tp_resp, native
 
     def cancel_order(self, symbol, order_id=None, client_order_id=None):
-        return self.client.cancel_order(symbol=symbol, orderId=order_id, origClientOrderId=client_order_id)
+        return self._timed("cancel", self.client.cancel_order, symbol=symbol, orderId=order_id,
+                           origClientOrderId=client_order_id)
+
+    def register_bracket(self, symbol, qty, entry_price, entry_resp, sl_resp, tp_resp, native_oco=False):
+        """Remember a placed bracket so fills can be routed without REST lookups"""
+        entry_cid, sl_cid, tp_cid = ((r or {}).get('clientOrderId') for r in (entry_resp, sl_resp, tp_resp))
+        return self.brackets.register(symbol, qty, entry_price, entry_cid, sl_cid, tp_cid, native_oco)
 
     def reconcile_oco(self, symbol, filled_exit_client_id, sibling_hint="TP" ):
         """
         When stop or TP fills, cancel sibling.
+        Known brackets cancel the sibling directly by clientOrderId; unknown ones fall back
+        to scanning open orders for the matching sibling type.
         """
         try:
-            # Ideally pass the sibling clientOrderId you stored.
-            # Here we scan open orders and cancel the matching sibling type.
+            sibling = self.brackets.sibling(filled_exit_client_id)
+            if sibling:
+                bracket, _ = self.brackets.lookup(filled_exit_client_id)
+                self.brackets.close(filled_exit_client_id)
+                if not bracket['native_oco']:  # the exchange already cancelled a native OCO leg
+                    self.cancel_order(symbol, client_order_id=sibling)
+                return
+
             open_orders = self.client.get_open_orders(symbol=symbol)
             for o in open_orders:
                 if sibling_hint in (o.get('clientOrderId') or ''):
@@ -1,125 +1,307 @@
 import pandas as pd
 import numpy as np
 from binance.client import Client
-from datetime import datetime, timedelta
 import logging
+import threading
+import time
+
+from core.whales import WhaleDetector
+
+# Columns kept per bar in KlineBuffer; times are epoch milliseconds stored as float64
+KLINE_FIELDS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time']
+
+AGG_TRADES_SPAN_MS = 3_600_000 - 1  # longest startTime..endTime range aggTrades accepts
+
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000, '3d': 259_200_000, '1w': 604_800_000,
+}
+
+
+class KlineBuffer:
+    """
+    Bars for one (symbol, interval), oldest first; the last row may still be forming.
+    Storage is a linear buffer twice the capacity, compacted to the front when it fills,
+    so view() is always a contiguous slice (no copy) and appends are amortized O(1).
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.empty((2 * capacity, len(KLINE_FIELDS)), dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def view(self):
+        """Zero-copy view; rows may be rewritten by the next merge()"""
+        return self._data[self._start:self._end]
+
+    def last_open_time(self):
+        return int(self._data[self._end - 1, 0]) if self._end > self._start else None
+
+    def merge(self, rows):
+        """Merge bars sorted by open_time: the row matching the last cached bar replaces it, newer rows append"""
+        if len(rows) == 0:
+            return
+        last = self.last_open_time()
+        if last is not None:
+            rows = rows[rows[:, 0] >= last]
+            if len(rows) and int(rows[0, 0]) == last:
+                self._data[self._end - 1] = rows[0]
+                rows = rows[1:]
+        if len(rows) > self.capacity:
+            rows = rows[-self.capacity:]
+
+        n = len(rows)
+        if self._end + n > len(self._data):
+            keep = self.view()[-(self.capacity - n):] if self.capacity > n else self.view()[:0]
+            self._data[:len(keep)] = keep
+            self._start, self._end = 0, len(keep)
+        self._data[self._end:self._end + n] = rows
+        self._end += n
+        if len(self) > self.capacity:
+            self._start = self._end - self.capacity
+
+
+def _klines_to_array(klines):
+    """Raw REST/WS kline rows -> float64 array in KLINE_FIELDS order"""
+    if not klines:
+        return np.empty((0, len(KLINE_FIELDS)), dtype=np.float64)
+    return np.array([k[:7] for k in klines], dtype=np.float64)
+
+
+def _klines_frame(arr):
+    """(n, 7) kline array -> DataFrame; OHLCV columns share memory with arr, timestamp is derived"""
+    df = pd.DataFrame(arr[:, 1:6], columns=['open', 'high', 'low', 'close', 'volume'], copy=False)
+    df.insert(0, 'timestamp', pd.to_datetime(arr[:, 0].astype(np.int64), unit='ms'))
+    df['close_time'] = arr[:, 6].astype(np.int64)
+    return df
+
 
 class DataFeed:
-    def __init__(self, client, logger=None):
+    def __init__(self, client, logger=None, account=None, price_ttl=5.0, whale_windows_min=(1,), archive=None,
+                 clock=None):
         self.client = client
+        self.clock = clock or time.time  # epoch seconds; a replay drives this from the recording
+        self.archive = archive  # optional core.archive.KlineArchive: warm starts and closed-bar history
         self.logger = logger or logging.getLogger(__name__)
-        self.whale_cache = {}
-        
+        self.account = account  # optional core.account.Account; shares its cached snapshot
+        self.whale_cache = {}  # symbol -> WhaleDetector
+        self.whale_windows_min = tuple(whale_windows_min)
+        self.kline_buffers = {}  # (symbol, interval) -> KlineBuffer
+        self._kline_locks = {}  # (symbol, interval) -> Lock; symbols refresh in parallel
+        self._locks_guard = threading.Lock()
+        self.price_ttl = price_ttl
+        self._prices = None          # symbol -> last price, from get_all_tickers()
+        self._prices_at = 0.0
+        self._price_lock = threading.Lock()
+        self._quote_routes = {}      # asset -> pair used to value it, None if unpriceable
+        self.stream = None           # core.stream.MarketStream once attached
+
+    def _refresh_klines(self, symbol, interval, bars):
+        """Bring the (symbol, interval) buffer up to date, fetching only bars past the cached one"""
+        key = (symbol, interval)
+        buf = self.kline_buffers.get(key)
+        if buf is None or buf.capacity < bars:
+            buf = KlineBuffer(max(bars, 1))
+            seed = self._archived_tail(symbol, interval, bars)
+            if len(seed):
+                # Archive covers the history; only bars since its last close come over REST below
+                buf.merge(seed)
+                self.kline_buffers[key] = buf
+            else:
+                lookback_min = bars * INTERVAL_MS[interval] // 60_000
+                klines = self.client.get_historical_klines(symbol, interval, f"{lookback_min} minutes ago UTC")
+                buf.merge(_klines_to_array(klines))
+                self.kline_buffers[key] = buf
+                self._archive_closed(symbol, interval, buf)
+                return buf
+
+        # startTime = last cached open: re-fetches the forming bar plus anything newer
+        start = buf.last_open_time()
+        while True:
+            klines = self.client.get_klines(symbol=symbol, interval=interval, startTime=start, limit=1000)
+            rows = _klines_to_array(klines)
+            buf.merge(rows)
+            if len(rows) < 1000:
+                break
+            start = int(rows[-1, 0])
+        self._archive_closed(symbol, interval, buf)
+        return buf
+
+    def _archived_tail(self, symbol, interval, bars):
+        """Last `bars` archived bars if they reach close to now, else nothing"""
+        if self.archive is None:
+            return np.empty((0, len(KLINE_FIELDS)))
+        try:
+            last = self.archive.last_open_time(symbol, interval)
+            step = INTERVAL_MS[interval]
+            # Older than a buffer's worth: a REST pull is no more expensive than the catch-up
+            if last is None or self.clock() * 1000 - last > bars * step:
+                return np.empty((0, len(KLINE_FIELDS)))
+            return self.archive.tail(symbol, interval, bars)
+        except Exception as e:
+            self.logger.error(f"Error reading kline archive for {symbol} {interval}: {e}")
+            return np.empty((0, len(KLINE_FIELDS)))
+
+    def _archive_closed(self, symbol, interval, buf):
+        if self.archive is None or len(buf) == 0:
+            return
+        try:
+            # Called under the kline lock: gaps are backfilled in the background, not here
+            self.archive.append_nowait(symbol, interval, buf.view(), now_ms=int(self.clock() * 1000))
+        except Exception as e:
+            self.logger.error(f"Error archiving klines for {symbol} {interval}: {e}")
+
+    def history(self, symbol, interval, bars):
+        """
+        Up to `bars` closed bars ending at the latest one, archive first then the live buffer,
+        as a get_klines-style DataFrame; for warm-starting indicators beyond the live lookback.
+        """
+        with self._kline_lock(symbol, interval):
+            buf = self.kline_buffers.get((symbol, interval))
+            live = buf.view()[:-1] if buf is not None and len(buf) else np.empty((0, len(KLINE_FIELDS)))
+            if self.archive is not None:
+                past = self.archive.tail(symbol, interval, bars)
+                if len(live) and len(past):
+                    live = live[live[:, 0] > past[-1, 0]]
+                live = np.concatenate([past, live])
+            return _klines_frame(live[-bars:].copy())
+
+    def _kline_lock(self, symbol, interval):
+        with self._locks_guard:
+            return self._kline_locks.setdefault((symbol, interval), threading.Lock())
+
+    def attach_stream(self, stream):
+        """Serve klines and trades from a live core.stream.MarketStream when it is connected"""
+        self.stream = stream
+
+    def merge_klines(self, symbol, interval, rows, closed=True):
+        """Merge pushed bars (e.g. from the websocket) into an existing buffer; archive only once a bar closed"""
+        with self._kline_lock(symbol, interval):
+            buf = self.kline_buffers.get((symbol, interval))
+            if buf is not None:
+                buf.merge(rows)
+                if closed:
+                    self._archive_closed(symbol, interval, buf)
+
+    def klines_array(self, symbol, interval='5m', lookback=300, refresh=False):
+        """
+        Bars covering the last `lookback` minutes as an (n, 7) array in KLINE_FIELDS order.
+        Copied under the buffer's lock: the stream thread and other scans merge into the
+        same buffer, and a view would change (or be compacted away) under the caller.
+        """
+        bars = max(1, lookback * 60_000 // INTERVAL_MS[interval])
+        with self._kline_lock(symbol, interval):
+            buf = self.kline_buffers.get((symbol, interval))
+            streamed = self.stream is not None and self.stream.is_live() and buf is not None and buf.capacity >= bars
+            if refresh or not streamed:
+                buf = self._refresh_klines(symbol, interval, bars)
+            return buf.view()[-bars:].copy()
+
     def get_klines(self, symbol, interval='5m', lookback=300):
         """Get historical kline data"""
         try:
-            klines = self.client.get_historical_klines(
-                symbol, interval, f"{lookback} minutes ago UTC"
-            )
-            
-            df = pd.DataFrame(klines, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume',
-                'close_time', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-            ])
-            
-            # Convert to numeric
-            numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col])
-                
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            return df
-            
+            return _klines_frame(self.klines_array(symbol, interval, lookback))
+
         except Exception as e:
             self.logger.error(f"Error fetching klines for {symbol}: {e}")
             return pd.DataFrame()
-    
+
+    def get_prices(self, max_age=None):
+        """All ticker prices {symbol: price} from one bulk request, cached for price_ttl seconds"""
+        max_age = self.price_ttl if max_age is None else max_age
+        with self._price_lock:
+            if self._prices is None or time.monotonic() - self._prices_at > max_age:
+                tickers = self.client.get_all_tickers()
+                self._prices = {t['symbol']: float(t['price']) for t in tickers}
+                self._prices_at = time.monotonic()
+            return self._prices
+
+    def _quote_route(self, asset, prices):
+        """Pair used to value `asset` (USD first, then USDT); resolved once and remembered"""
+        route = self._quote_routes.get(asset)
+        if route is None or route not in prices:
+            route = next((p for p in (f"{asset}USD", f"{asset}USDT") if p in prices), None)
+            self._quote_routes[asset] = route
+        return route
+
     def get_equity_usd(self):
-        """Get total account equity in USD"""
+        """Total account equity in USD, or None if it could not be valued (never a false 0.0)"""
         try:
-            account = self.client.get_account()
-            total_usd = 0.0
-            
+            account = self.account.snapshot() if self.account is not None else self.client.get_account()
+
+            assets, qty = [], []
             for balance in account['balances']:
-                asset = balance['asset']
-                free = float(balance['free'])
-                locked = float(balance['locked'])
-                total = free + locked
-                
+                total = float(balance['free']) + float(balance['locked'])
                 if total > 0:
-                    if asset == 'USD' or asset == 'USDT':
-                        total_usd += total
-                    else:
-                        # Convert to USD using current price
-                        try:
-                            ticker = self.client.get_symbol_ticker(symbol=f"{asset}USD")
-                            price = float(ticker['price'])
-                            total_usd += total * price
-                        except:
-                            # If USD pair doesn't exist, try USDT
-                            try:
-                                ticker = self.client.get_symbol_ticker(symbol=f"{asset}USDT")
-                                price = float(ticker['price'])
-                                total_usd += total * price
-                            except:
-                                pass
-                                
-            return total_usd
-            
+                    assets.append(balance['asset'])
+                    qty.append(total)
+            if not assets:
+                return 0.0
+
+            # Stablecoins count at par; everything else from one bulk ticker snapshot
+            prices = {} if all(a in ('USD', 'USDT') for a in assets) else self.get_prices()
+            px = np.array([1.0 if a in ('USD', 'USDT') else prices.get(self._quote_route(a, prices), np.nan)
+                           for a in assets])
+            unpriced = [a for a, p in zip(assets, px) if np.isnan(p)]
+            if unpriced:
+                self.logger.debug(f"No USD/USDT price for {', '.join(unpriced)}; excluded from equity")
+
+            return float(np.nansum(np.array(qty) * px))
+
         except Exception as e:
             self.logger.error(f"Error fetching equity: {e}")
-            return 0.0
-    
+            return None
+
+    def whale_detector(self, symbol):
+        """The symbol's WhaleDetector, created on first use"""
+        detector = self.whale_cache.get(symbol)
+        if detector is None:
+            windows_s = [m * 60 for m in self.whale_windows_min]
+            detector = self.whale_cache.setdefault(symbol, WhaleDetector(windows_s=windows_s, clock=self.clock))
+        return detector
+
+    def poll_trades(self, symbol, horizon_ms=60_000):
+        """Feed aggregate trades newer than the last one seen into the symbol's detector"""
+        detector = self.whale_detector(symbol)
+        if detector.last_id is None:
+            start = int(self.clock() * 1000) - horizon_ms
+            # startTime and endTime must be less than an hour apart; fromId paging covers the rest
+            batch = self.client.get_aggregate_trades(symbol=symbol, startTime=start,
+                                                     endTime=start + AGG_TRADES_SPAN_MS, limit=1000)
+        else:
+            batch = self.client.get_aggregate_trades(symbol=symbol, fromId=detector.last_id + 1, limit=1000)
+        # Page by id until caught up, so bursts above 1000 trades are never truncated
+        while batch:
+            for t in batch:
+                detector.add(t['a'], t['T'], float(t['p']), float(t['q']), t['m'])
+            if len(batch) < 1000:
+                break
+            batch = self.client.get_aggregate_trades(symbol=symbol, fromId=batch[-1]['a'] + 1, limit=1000)
+
     def whale_flag(self, symbol, window_min=1, single_trade=250000, window_notional=1000000, imbalance=0.65):
-        """Detect whale activity"""
+        """
+        Detect whale activity. Trades are aggregate trades (a taker order's fills at one price),
+        so single_trade compares against at least the largest fill; it keeps the per-fill value
+        until a threshold is calibrated on recorded data.
+        """
         try:
-            # Get recent trades
-            trades = self.client.get_recent_trades(symbol=symbol, limit=1000)
-            
-            if not trades:
-                return False
-                
-            now = datetime.now()
-            window_start = now - timedelta(minutes=window_min)
-            
-            recent_trades = []
-            total_volume = 0
-            buy_volume = 0
-            
-            for trade in trades:
-                trade_time = datetime.fromtimestamp(trade['time'] / 1000)
-                if trade_time >= window_start:
-                    qty = float(trade['qty'])
-                    price = float(trade['price'])
-                    notional = qty * price
-                    
-                    recent_trades.append({
-                        'notional': notional,
-                        'is_buyer_maker': trade['isBuyerMaker']
-                    })
-                    
-                    total_volume += notional
-                    if not trade['isBuyerMaker']:  # Market buy
-                        buy_volume += notional
-                    
-                    # Check for single large trade
-                    if notional >= single_trade:
-                        self.logger.info(f"Whale trade detected: {notional:,.2f} USD in {symbol}")
-                        return True
-            
-            # Check for window volume threshold
-            if total_volume >= window_notional:
-                # Check for order imbalance
-                if total_volume > 0:
-                    buy_ratio = buy_volume / total_volume
-                    if buy_ratio >= imbalance or buy_ratio <= (1 - imbalance):
-                        self.logger.info(f"Whale activity detected: {total_volume:,.2f} USD volume with {buy_ratio:.2%} buy ratio in {symbol}")
-                        return True
-                        
-            return False
-            
+            window_s = window_min * 60
+            detector = self.whale_detector(symbol)
+            detector.add_window(window_s)
+
+            # With a live stream the detector is already current; otherwise catch up over REST
+            if self.stream is None or not self.stream.is_live():
+                self.poll_trades(symbol, horizon_ms=detector.horizon_ms)
+
+            flagged, reason = detector.flag(window_s, single_trade, window_notional, imbalance)
+            if flagged:
+                self.logger.info(f"{reason} in {symbol}")
+            return flagged
+
         except Exception as e:
             self.logger.error(f"Error detecting whale activity for {symbol}: {e}")
             return False
-
@@ -1,10 +1,13 @@
 import time
-from core.signals import generate_signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from core.signals import generate_signal, generate_signals_batch, StreamingIndicators
 from core.sizing import aggressive_size
 from core.risk import RiskEngine
+from core.metrics import Metrics
 
 class Engine:
-    def __init__(self, broker, datafeed, account, params, storage, logger):
+    def __init__(self, broker, datafeed, account, params, storage, logger, metrics=None, clock=None):
         self.broker = broker
         self.datafeed = datafeed  # must provide: get_klines(symbol, interval, lookback), get_equity_usd()
         self.account = account    # must provide: open_positions(), open_orders(), precision_map()
@@ -13,52 +16,254 @@ class Engine:
         self.logger = logger
         self.risk = RiskEngine(params)
         self.open_positions_cache = {}
+        self.indicators = {}  # symbol -> StreamingIndicators (indicators.engine: streaming)
+        self._pool = None     # gather workers, created on first scan
+        self._overrun = {}    # symbol -> gather future still running past symbol_timeout_s
+        self._lock = threading.RLock()  # orders and RiskEngine updates: scan thread vs fill stream
+        self.metrics = metrics or Metrics()  # per-stage spans, served at /metrics
+        self.clock = clock or time.time      # risk-day and cooldown time; a replay passes the recorded clock
 
     def tick(self, symbol):
+        with self.metrics.span("tick", symbol):
+            self._tick(symbol)
+
+    def _tick(self, symbol):
         # 1) Risk gates
-        equity = self.datafeed.get_equity_usd()
-        ok, reason = self.risk.can_trade_now(time.time(), equity)
-        if not ok: 
-            self.logger.info(f"[{symbol}] trade halted: {reason}")
-            return
+        with self.metrics.span("risk_gate", symbol):
+            equity = self.datafeed.get_equity_usd()
+            if not self._risk_ok(symbol, equity):
+                return
 
         # 2) Already at position cap?
-        if len(self.account.open_positions()) >=  self.params['limits']['max_trades_day']:
-            return
+        with self.metrics.span("positions", symbol):
+            if self._at_position_cap():
+                return
 
         # 3) Build signal
-        df = self.datafeed.get_klines(symbol, interval=self.params['timeframes']['trade'], lookback=300)
-        whale_flag = self.datafeed.whale_flag(symbol, window_min=self.params['whales']['window_min'],
-                                              single_trade=self.params['whales']['single_trade'],
-                                              window_notional=self.params['whales']['window_notional'],
-                                              imbalance=self.params['whales']['imbalance'])
-        sig = generate_signal(df, whale_flag, self.params)
+        df, whale_flag = self._gather(symbol)
+        with self.metrics.span("signal", symbol):
+            sig = self._signal(symbol, df, whale_flag)
         if not sig:
             return
 
-        # 4) Sizing
-        qty, equity_managed = aggressive_size(
-            total_equity_usd=equity,
-            managed_fraction=self.params['account']['managed_fraction'],
-            risk_per_trade=self.params['risk']['per_trade'],
-            entry=sig['entry'],
-            stop=sig['stop'],
-            max_symbol_alloc=self.params['risk']['max_symbol_alloc'],
-        )
+        # 4) + 5) Size and place
+        self._execute(symbol, sig, equity)
+
+    def scan(self, symbols):
+        """
+        Tick every symbol in one pass: risk gate once, gather market data for all symbols
+        concurrently on a bounded pool, evaluate all signals with one vectorized indicator
+        pass, then place orders and touch RiskEngine serially on this thread.
+        Returns the number of symbols that raised or timed out.
+        """
+        with self.metrics.span("scan"):
+            return self._scan(symbols)
+
+    def _scan(self, symbols):
+        errors = 0
+
+        # 1) Risk gates
+        with self.metrics.span("risk_gate"):
+            equity = self.datafeed.get_equity_usd()
+            if not self._risk_ok(",".join(symbols), equity):
+                return errors
+
+        # 2) Already at position cap?
+        with self.metrics.span("positions"):
+            if self._at_position_cap():
+                return errors
+
+        # 3) Gather market data (read-only REST calls, fanned out)
+        frames, whale_flags = {}, {}
+        exec_params = self.params.get('execution', {})
+        timeout = exec_params.get('symbol_timeout_s', 15)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=exec_params.get('workers', 8),
+                                            thread_name_prefix="gather")
+        futures = {}
+        for symbol in symbols:
+            stuck = self._overrun.get(symbol)
+            if stuck is not None and not stuck.done():
+                # Its last gather still holds a worker (a REST call past symbol_timeout_s): don't queue another
+                self.logger.warning(f"Gathering data for {symbol} still running from an earlier scan; skipped")
+                errors += 1
+                continue
+            self._overrun.pop(symbol, None)
+            futures[symbol] = self._pool.submit(self._gather, symbol)
+        deadline = time.monotonic() + timeout
+        for symbol, fut in futures.items():
+            try:
+                frames[symbol], whale_flags[symbol] = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                errors += 1
+                if fut.cancel():
+                    self.logger.warning(f"Gathering data for {symbol} never started within {timeout}s; skipped")
+                    continue
+                # A running worker can't be cancelled: it ends when its REST call returns or times out
+                self._overrun[symbol] = fut
+                self.metrics.inc('bot_gather_overrun_total', symbol, labels=('symbol',),
+                                 help_="Gathers still running past symbol_timeout_s")
+                self.logger.warning(f"Gathering data for {symbol} still running after {timeout}s; "
+                                    f"result discarded, worker busy until it returns")
+            except Exception as e:
+                self.logger.error(f"Error gathering data for {symbol}: {e}")
+                errors += 1
+
+        # 4) Build signals
+        if self.params.get('indicators', {}).get('engine', 'pandas') == 'streaming':
+            sigs = {}
+            for symbol, df in frames.items():
+                try:
+                    with self.metrics.span("signal", symbol):
+                        sigs[symbol] = self._signal(symbol, df, whale_flags[symbol])
+                except Exception as e:
+                    self.logger.error(f"Error building signal for {symbol}: {e}")
+                    errors += 1
+        else:
+            with self.metrics.span("signal"):  # one vectorized pass over every symbol
+                sigs = generate_signals_batch(frames, whale_flags, self.params)
+
+        # 5) Size and place, one symbol at a time
+        for symbol in symbols:
+            sig = sigs.get(symbol)
+            if not sig:
+                continue
+            try:
+                if self._at_position_cap():
+                    break
+                self._execute(symbol, sig, equity)
+            except Exception as e:
+                self.logger.error(f"Error executing trade for {symbol}: {e}")
+                errors += 1
+        return errors
+
+    def _risk_ok(self, label, equity):
+        if equity is None:
+            # Unknown is not a drawdown: skip this pass rather than trip the daily stop
+            self.logger.warning(f"[{label}] equity unavailable; skipping")
+            return False
+        ok, reason = self.risk.can_trade_now(self.clock(), equity)
+        if not ok:
+            self.logger.info(f"[{label}] trade halted: {reason}")
+        return ok
+
+    def _at_position_cap(self):
+        return len(self.account.open_positions()) >= self.params['limits']['max_trades_day']
+
+    def _gather(self, symbol):
+        """Market data for one symbol: (klines DataFrame, whale flag)"""
+        with self.metrics.span("klines", symbol):
+            df = self.datafeed.get_klines(symbol, interval=self.params['timeframes']['trade'], lookback=300)
+        if len(df):
+            # Scans run just after a close: judge the bar that closed, not the one that opened a moment ago
+            df = df[df['close_time'] < int(self.clock() * 1000)]
+        with self.metrics.span("whales", symbol):
+            whale_flag = self.datafeed.whale_flag(symbol, window_min=self.params['whales']['window_min'],
+                                                  single_trade=self.params['whales']['single_trade'],
+                                                  window_notional=self.params['whales']['window_notional'],
+                                                  imbalance=self.params['whales']['imbalance'])
+        return df, whale_flag
+
+    def _execute(self, symbol, sig, equity):
+        with self._lock:
+            self._place_bracket(symbol, sig, equity)
+
+    def _place_bracket(self, symbol, sig, equity):
+        # Sizing
+        with self.metrics.span("sizing", symbol):
+            qty, equity_managed = aggressive_size(
+                total_equity_usd=equity,
+                managed_fraction=self.params['account']['managed_fraction'],
+                risk_per_trade=self.params['risk']['per_trade'],
+                entry=sig['entry'],
+                stop=sig['stop'],
+                max_symbol_alloc=self.params['risk']['max_symbol_alloc'],
+            )
         if qty <= 0:
             return
 
-        # 5) Place live orders (market + exits)
-        entry_resp = self.broker.place_market_entry(symbol, "BUY", qty)
-        # Fill assumptions: use last price; for robust impl, poll order status
+        # Place live orders (market + native or emulated OCO exits)
         sl_price = sig['stop']
         tp_price = sig['tp']
         # Use slightly worse stop limit to ensure trigger (e.g., limit a bit below stop)
         sl_limit = max(sl_price * 0.999, sl_price - 0.5 * sig['atr'])
-        sl_resp = self.broker.place_stop_loss(symbol, "BUY", qty, stop_price=sl_price, limit_price=sl_limit)
-        tp_resp = self.broker.place_take_profit(symbol, "BUY", qty, tp_price=tp_price)
+        # Reject locally what the exchange filters would reject; the lowest-priced leg binds minNotional
+        reason = (self.broker.check_order(symbol, qty, sig['entry'], market=True)
+                  or self.broker.check_order(symbol, qty, sl_limit))
+        if reason:
+            self.logger.info(f"[{symbol}] order skipped: {reason}")
+            return
+        # Each leg is timed by the broker (order_<leg> stages)
+        with self.metrics.span("bracket", symbol):
+            entry_resp, sl_resp, tp_resp, native = self.broker.place_bracket(
+                symbol, "BUY", qty, stop_price=sl_price, limit_price=sl_limit, tp_price=tp_price)
+
+        with self.metrics.span("storage", symbol):
+            self.storage.log_order(symbol, entry_resp, sl_resp, tp_resp, sig, qty)
+        # Exits protect what actually filled (a partial entry fill leaves it below qty), floored to
+        # the lot step: book the quantity the exit legs were placed for
+        filled = self._filled_qty(sl_resp, self._filled_qty(entry_resp, qty), field='origQty')
+        if filled > 0:
+            self.broker.register_bracket(symbol, filled, self._fill_price(entry_resp, sig['entry']),
+                                         entry_resp, sl_resp, tp_resp, native_oco=native)
+        self._invalidate_account()
+
+    @staticmethod
+    def _filled_qty(resp, default, field='executedQty'):
+        """executedQty (or `field`) of an order response, else `default`"""
+        executed = (resp or {}).get(field)
+        return float(executed) if executed is not None else default
+
+    @staticmethod
+    def _fill_price(resp, default):
+        """Average fill price from an order response's fills, else `default`"""
+        fills = (resp or {}).get('fills') or []
+        qty = sum(float(f['qty']) for f in fills)
+        if qty <= 0:
+            return default
+        return sum(float(f['price']) * float(f['qty']) for f in fills) / qty
+
+    def _signal(self, symbol, df, whale_flag):
+        """
+        generate_signal, or its O(1)-per-bar equivalent when indicators.engine is 'streaming'.
+        df holds closed bars only (see _gather). The last one is evaluated with peek() and
+        committed on the next scan, so the values match generate_signal over df.
+        """
+        if self.params.get('indicators', {}).get('engine', 'pandas') != 'streaming' or len(df) < 2:
+            return generate_signal(df, whale_flag, self.params)
+
+        closed = df.iloc[:-1]
+        state = self.indicators.get(symbol)
+        times = closed['timestamp']
+        if state is None or not (times == state.last_time).any():
+            # First call, or a gap the frame can't bridge: warm-start from what we have,
+            # reaching back into the kline archive when one is attached
+            state = StreamingIndicators.from_history(self._warm_history(symbol, closed), self.params)
+            self.indicators[symbol] = state
+        else:
+            new = closed[times > state.last_time]
+            for h, l, c, v in zip(new['high'], new['low'], new['close'], new['volume']):
+                state.update(h, l, c, v)
+        state.last_time = times.iloc[-1]
+
+        last = df.iloc[-1]
+        return state.signal(last['high'], last['low'], last['close'], last['volume'], whale_flag, self.params)
 
-        self.storage.log_order(symbol, entry_resp, sl_resp, tp_resp, sig, qty)
+    def _warm_history(self, symbol, closed):
+        """Closed bars to warm-start from: up to indicators.warm_bars of archive history ending where `closed` does"""
+        bars = self.params.get('indicators', {}).get('warm_bars', 0)
+        if bars <= len(closed) or getattr(self.datafeed, 'archive', None) is None:
+            return closed
+        try:
+            hist = self.datafeed.history(symbol, self.params['timeframes']['trade'], bars)
+        except Exception as e:
+            self.logger.error(f"Error loading warm-start history for {symbol}: {e}")
+            return closed
+        # The archive already holds df's last bar, which _signal peeks rather than commits
+        hist = hist[hist['timestamp'] <= closed['timestamp'].iloc[-1]]
+        if len(hist) <= len(closed) or hist['timestamp'].iloc[-1] != closed['timestamp'].iloc[-1]:
+            return closed
+        return hist
 
     def on_fill(self, fill_event):
         """
@@ -68,12 +273,74 @@ class Engine:
         symbol = fill_event['symbol']
         side = fill_event['side']   # BUY/SELL
         role = fill_event.get('role')  # ENTRY/SL/TP
-        if role in ('SL','TP'):
-            # cancel sibling
-            sibling_hint = 'TP' if role == 'SL' else 'SL'
-            self.broker.reconcile_oco(symbol, filled_exit_client_id=fill_event.get('clientOrderId'),
-                                      sibling_hint=sibling_hint)
-            pnl = fill_event.get('pnl', 0.0)
-            self.risk.record_trade_pnl(pnl)
-            self.storage.log_trade_close(fill_event)
+        with self._lock:
+            if role in ('SL','TP'):
+                # cancel sibling
+                sibling_hint = 'TP' if role == 'SL' else 'SL'
+                self.broker.reconcile_oco(symbol, filled_exit_client_id=fill_event.get('clientOrderId'),
+                                          sibling_hint=sibling_hint)
+                pnl = fill_event.get('pnl', 0.0)
+                self.risk.record_trade_pnl(pnl, now_ts=self.clock())
+                with self.metrics.span("storage", symbol):
+                    self.storage.log_trade_close(fill_event)
+            self._invalidate_account()
+
+    def on_execution_report(self, event):
+        """
+        User-data executionReport -> on_fill for fully filled orders.
+        Role and entry price come from the broker's bracket book; orders placed before
+        a restart fall back to the -ENT-/-SL-/-TP- clientOrderId convention.
+        Runs under the engine lock: a stop that fills while _place_bracket is still
+        registering its bracket waits for the registration instead of missing it.
+        """
+        if event.get('X') != 'FILLED':
+            return
+        cid = event.get('c') or ''
+        qty = float(event.get('z') or 0)
+        quote = float(event.get('Z') or 0)
+        price = quote / qty if qty else float(event.get('L') or 0)
+        with self._lock:
+            hit = self.broker.brackets.lookup(cid)
+            if hit:
+                bracket, role = hit
+            else:
+                bracket = None
+                role = next((r for tag, r in (('-SL-', 'SL'), ('-TP-', 'TP'), ('-ENT-', 'ENTRY')) if tag in cid),
+                            None)
+            pnl = 0.0
+            if bracket and role in ('SL', 'TP'):
+                pnl = (price - bracket['entry_price']) * qty  # long-only brackets
+
+            self.on_fill({'symbol': event['s'], 'side': event['S'], 'role': role, 'quantity': qty,
+                          'price': price, 'pnl': pnl, 'clientOrderId': cid})
+
+    def resync_brackets(self):
+        """
+        After a user-stream reconnect: replay exit fills we may have missed (REST, per open bracket),
+        then re-read balances and open orders, which may have moved while the stream was down.
+        """
+        for bracket in self.broker.brackets.open_brackets():
+            for role in ('SL', 'TP'):
+                cid = bracket[role]
+                if not cid:
+                    continue
+                try:
+                    order = self.broker.client.get_order(symbol=bracket['symbol'], origClientOrderId=cid)
+                except Exception as e:
+                    self.logger.error(f"Error resyncing {cid}: {e}")
+                    continue
+                if order.get('status') == 'FILLED':
+                    self.on_execution_report({'X': 'FILLED', 'c': cid, 's': bracket['symbol'],
+                                              'S': order.get('side'), 'z': order.get('executedQty'),
+                                              'Z': order.get('cummulativeQuoteQty')})
+                    break
+        self._invalidate_account()
+        self.account.open_positions()
+        self.account.open_orders()
+
+    def _invalidate_account(self):
+        # Our own orders/fills changed balances: next read must hit the exchange
+        invalidate = getattr(self.account, 'invalidate', None)
+        if invalidate:
+            invalidate()
 
@@ -0,0 +1,295 @@
+import asyncio
+import itertools
+import json
+import re
+import threading
+import time
+
+import numpy as np
+from binance.exceptions import BinanceAPIException
+
+from core.datafeed import INTERVAL_MS
+
+
+def api_error(code, msg, status=400):
+    """A BinanceAPIException as the real client would raise it"""
+    return BinanceAPIException(None, status, json.dumps({'code': code, 'msg': msg}))
+
+
+class FakeExchange:
+    """
+    In-memory stand-in for the python-binance Client order endpoints.
+    - MARKET orders fill immediately at prices[symbol]; LIMIT / STOP_LOSS_LIMIT rest as NEW.
+    - create_oco_order is only available when supports_oco is True (otherwise it raises
+      like an exchange that rejects OCO), and filling one leg cancels the other.
+    - latency_s is slept inside every call to model a REST round trip.
+    - fail() queues errors for a method, optionally after the order was accepted
+      (a lost response), to exercise retry and idempotency paths.
+    Responses carry the fields LiveBroker and Engine read (clientOrderId, status, fills, ...).
+    """
+    def __init__(self, prices=None, supports_oco=True, latency_s=0.0, balances=None):
+        self.prices = dict(prices or {})
+        self.supports_oco = supports_oco
+        self.latency_s = latency_s
+        self.balances = dict(balances or {'USD': 100000.0})
+        self.orders = {}     # clientOrderId -> order dict
+        self.calls = []      # (method, kwargs) in call order
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._failures = {}  # method -> [(exception, lost_response)]
+
+    def fail(self, method, error=None, lost_response=False, times=1):
+        """Make the next `times` calls to `method` raise `error` (default: a timeout).
+        With lost_response the call takes effect on the exchange before raising."""
+        error = error if error is not None else TimeoutError(f"{method} timed out")
+        self._failures.setdefault(method, []).extend([(error, lost_response)] * times)
+
+    def _call(self, method, kwargs):
+        self.calls.append((method, kwargs))
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        pending = self._failures.get(method)
+        if pending and not pending[0][1]:
+            raise pending.pop(0)[0]
+
+    def _after(self, method):
+        pending = self._failures.get(method)
+        if pending and pending[0][1]:
+            raise pending.pop(0)[0]
+
+    def _new_order(self, symbol, side, type_, qty, price=None, stop_price=None, cid=None, list_id=-1):
+        order = {
+            'symbol': symbol, 'orderId': next(self._ids), 'orderListId': list_id,
+            'clientOrderId': cid or f"fake-{next(self._ids)}", 'transactTime': int(time.time() * 1000),
+            'price': str(price or 0), 'origQty': str(qty), 'executedQty': '0',
+            'cummulativeQuoteQty': '0', 'status': 'NEW', 'type': type_, 'side': side,
+            'stopPrice': str(stop_price or 0), 'fills': [],
+        }
+        with self._lock:
+            self.orders[order['clientOrderId']] = order
+        return order
+
+    def _fill(self, order, price):
+        qty = float(order['origQty'])
+        order.update(status='FILLED', executedQty=str(qty), cummulativeQuoteQty=str(qty * price),
+                     fills=[{'price': str(price), 'qty': str(qty), 'commission': '0', 'commissionAsset': 'USD'}])
+        base = order['symbol'][:-3] if order['symbol'].endswith('USD') else order['symbol']
+        sign = 1 if order['side'] == 'BUY' else -1
+        self.balances[base] = self.balances.get(base, 0.0) + sign * qty
+        self.balances['USD'] = self.balances.get('USD', 0.0) - sign * qty * price
+
+    # --- client surface -------------------------------------------------
+
+    def create_order(self, symbol, side, type, quantity, newClientOrderId=None, price=None,
+                     stopPrice=None, timeInForce=None, **kwargs):
+        self._call('create_order', dict(symbol=symbol, side=side, type=type, quantity=quantity,
+                                        newClientOrderId=newClientOrderId))
+        if newClientOrderId in self.orders:
+            raise api_error(-2010, "Duplicate order sent.")
+        order = self._new_order(symbol, side, type, float(quantity), price and float(price),
+                                stopPrice and float(stopPrice), newClientOrderId)
+        if type == 'MARKET':
+            self._fill(order, self.prices[symbol])
+        self._after('create_order')
+        return dict(order)
+
+    def create_oco_order(self, symbol, side, quantity, price, stopPrice, stopLimitPrice,
+                         listClientOrderId=None, limitClientOrderId=None, stopClientOrderId=None, **kwargs):
+        self._call('create_oco_order', dict(symbol=symbol, side=side, quantity=quantity))
+        if not self.supports_oco:
+            raise api_error(-1013, "OCO orders are not supported for this symbol.")
+        list_id = next(self._ids)
+        stop = self._new_order(symbol, side, 'STOP_LOSS_LIMIT', float(quantity), float(stopLimitPrice),
+                               float(stopPrice), stopClientOrderId, list_id)
+        limit = self._new_order(symbol, side, 'LIMIT_MAKER', float(quantity), float(price),
+                                None, limitClientOrderId, list_id)
+        self._after('create_oco_order')
+        return {'orderListId': list_id, 'contingencyType': 'OCO', 'listClientOrderId': listClientOrderId,
+                'orderReports': [dict(stop), dict(limit)]}
+
+    def cancel_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        self._call('cancel_order', dict(symbol=symbol, orderId=orderId, origClientOrderId=origClientOrderId))
+        order = self._find(orderId, origClientOrderId)
+        if order['status'] != 'NEW':
+            raise api_error(-2011, "Unknown order sent.")
+        order['status'] = 'CANCELED'
+        return dict(order)
+
+    def get_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        self._call('get_order', dict(symbol=symbol, orderId=orderId, origClientOrderId=origClientOrderId))
+        return dict(self._find(orderId, origClientOrderId))
+
+    def get_open_orders(self, symbol=None, **kwargs):
+        self._call('get_open_orders', dict(symbol=symbol))
+        return [dict(o) for o in self.orders.values()
+                if o['status'] == 'NEW' and (symbol is None or o['symbol'] == symbol)]
+
+    def get_symbol_info(self, symbol):
+        self._call('get_symbol_info', dict(symbol=symbol))
+        return {'symbol': symbol, 'ocoAllowed': self.supports_oco}
+
+    def get_account(self, **kwargs):
+        self._call('get_account', {})
+        return {'balances': [{'asset': a, 'free': str(q), 'locked': '0'} for a, q in self.balances.items()]}
+
+    # --- test helpers ---------------------------------------------------
+
+    def _find(self, order_id=None, client_order_id=None):
+        order = self.orders.get(client_order_id) if client_order_id is not None else \
+            next((o for o in self.orders.values() if o['orderId'] == order_id), None)
+        if order is None:
+            raise api_error(-2013, "Order does not exist.")
+        return order
+
+    def fill_order(self, client_order_id, price=None):
+        """Fill a resting order; the other leg of a native OCO is cancelled like on the exchange.
+        Returns the executionReport the user-data stream would deliver."""
+        order = self.orders[client_order_id]
+        self._fill(order, float(price if price is not None else order['price']))
+        if order['orderListId'] != -1:
+            for other in self.orders.values():
+                if other['orderListId'] == order['orderListId'] and other is not order and other['status'] == 'NEW':
+                    other['status'] = 'CANCELED'
+        return {'e': 'executionReport', 's': order['symbol'], 'S': order['side'], 'c': client_order_id,
+                'X': 'FILLED', 'z': order['executedQty'], 'Z': order['cummulativeQuoteQty'],
+                'L': order['fills'][0]['price']}
+
+
+class FakeMarket(FakeExchange):
+    """
+    FakeExchange plus the market-data endpoints DataFeed and Account read, for benchmarks
+    and offline runs.
+    - Random-walk klines per (symbol, interval) ending at the current bar, from `seed`.
+    - Aggregate trades: each poll that has caught up makes trades_per_s more available (one
+      second's worth, timestamped over the second before now), paged at `limit`; every
+      500th is whale-sized.
+    - Tickers, book tickers and a minimal exchangeInfo (LOT_SIZE / PRICE_FILTER / MIN_NOTIONAL).
+    latency_s is slept in every call, market data included.
+    """
+    def __init__(self, symbols, bars=2000, trades_per_s=10, seed=0, **kwargs):
+        self.symbols = list(symbols)
+        self.bars = bars
+        self.trades_per_s = trades_per_s
+        self.seed = seed
+        self._series = {}     # (symbol, interval) -> (bars, 7) array
+        self._trade_ids = {}  # symbol -> last aggregate trade id produced
+        self._paging = {}     # symbol -> last response was a full page
+        super().__init__(**kwargs)
+        for symbol in self.symbols:
+            self.prices.setdefault(symbol, float(self._klines(symbol, '1m')[-1, 4]))
+
+    def _klines(self, symbol, interval):
+        key = (symbol, interval)
+        if key not in self._series:
+            rng = np.random.default_rng([self.seed, self.symbols.index(symbol)])
+            step = INTERVAL_MS[interval]
+            now = int(time.time() * 1000)
+            t = (now - now % step) - step * np.arange(self.bars - 1, -1, -1)
+            close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.002, self.bars)))
+            open_ = np.concatenate([close[:1], close[:-1]])
+            wick = np.abs(rng.normal(0, 0.001, self.bars)) * close
+            self._series[key] = np.column_stack([t, open_, np.maximum(open_, close) + wick,
+                                                 np.minimum(open_, close) - wick, close,
+                                                 rng.uniform(1, 50, self.bars), t + step - 1])
+        return self._series[key]
+
+    def get_klines(self, symbol, interval, startTime=None, endTime=None, limit=500, **kwargs):
+        self._call('get_klines', dict(symbol=symbol, interval=interval, startTime=startTime, limit=limit))
+        rows = self._klines(symbol, interval)
+        if startTime is not None:
+            rows = rows[rows[:, 0] >= startTime]
+        if endTime is not None:
+            rows = rows[rows[:, 0] <= endTime]
+        rows = rows[:limit] if startTime is not None else rows[-limit:]
+        return rows.tolist()
+
+    def get_historical_klines(self, symbol, interval, start_str=None, **kwargs):
+        self._call('get_historical_klines', dict(symbol=symbol, interval=interval, start_str=start_str))
+        m = re.match(r'(\d+) minutes? ago', start_str or '')
+        bars = int(m.group(1)) * 60_000 // INTERVAL_MS[interval] + 1 if m else self.bars
+        return self._klines(symbol, interval)[-bars:].tolist()
+
+    def get_aggregate_trades(self, symbol, fromId=None, startTime=None, endTime=None, limit=500, **kwargs):
+        self._call('get_aggregate_trades', dict(symbol=symbol, fromId=fromId, startTime=startTime))
+        produced = self._trade_ids.get(symbol, 0)
+        first = produced + 1 if fromId is None else max(int(fromId), 1)
+        if first > produced and not self._paging.get(symbol):
+            # Caught up: another second of trades has happened since the last poll
+            produced = self._trade_ids[symbol] = produced + self.trades_per_s
+        n = max(0, min(limit, produced - first + 1))
+        self._paging[symbol] = n == limit  # the caller will page on; don't tick the clock for that
+        now = int(time.time() * 1000)
+        price = self.prices[symbol]
+        trades = []
+        for k, i in enumerate(range(first, first + n)):
+            qty = 20_000.0 / price if i % 500 == 0 else (i * 7919 % 100 + 1) / price
+            trades.append({'a': i, 'p': f"{price:.2f}", 'q': f"{qty:.6f}", 'f': i, 'l': i,
+                           'T': now - 1000 + (k + 1) * 1000 // max(n, 1), 'm': bool(i % 3), 'M': True})
+        return trades
+
+    def get_all_tickers(self, **kwargs):
+        self._call('get_all_tickers', {})
+        return [{'symbol': s, 'price': str(p)} for s, p in self.prices.items()]
+
+    def get_symbol_ticker(self, symbol=None, **kwargs):
+        self._call('get_symbol_ticker', dict(symbol=symbol))
+        return {'symbol': symbol, 'price': str(self.prices[symbol])}
+
+    def get_orderbook_ticker(self, symbol=None, **kwargs):
+        self._call('get_orderbook_ticker', dict(symbol=symbol))
+        p = self.prices[symbol]
+        return {'symbol': symbol, 'bidPrice': f"{p * 0.9999:.2f}", 'bidQty': '1',
+                'askPrice': f"{p * 1.0001:.2f}", 'askQty': '1'}
+
+    def get_exchange_info(self, **kwargs):
+        self._call('get_exchange_info', {})
+        return {'symbols': [{'symbol': s, 'baseAsset': s[:-3], 'quoteAsset': s[-3:], 'ocoAllowed': self.supports_oco,
+                             'quotePrecision': 8,
+                             'filters': [{'filterType': 'PRICE_FILTER', 'minPrice': '0.01', 'maxPrice': '1000000',
+                                          'tickSize': '0.01'},
+                                         {'filterType': 'LOT_SIZE', 'minQty': '0.00001', 'maxQty': '9000',
+                                          'stepSize': '0.00001'},
+                                         {'filterType': 'MIN_NOTIONAL', 'minNotional': '10'}]}
+                            for s in self.symbols]}
+
+    def get_symbol_info(self, symbol):
+        self._call('get_symbol_info', dict(symbol=symbol))
+        return {'symbol': symbol, 'baseAsset': symbol[:-3], 'quoteAsset': symbol[-3:], 'ocoAllowed': self.supports_oco}
+
+
+class FakeAsyncExchange:
+    """
+    Async (AsyncClient-shaped) front for FakeExchange.
+    latency_s is a number or a callable(method) -> seconds, awaited before each call so
+    concurrent requests overlap the way pooled keep-alive connections do.
+    """
+    def __init__(self, exchange=None, latency_s=0.0):
+        self.exchange = exchange or FakeExchange()
+        self.latency_s = latency_s
+
+    async def _call(self, method, **kwargs):
+        delay = self.latency_s(method) if callable(self.latency_s) else self.latency_s
+        if delay:
+            await asyncio.sleep(delay)
+        return getattr(self.exchange, method)(**kwargs)
+
+    async def create_order(self, **kwargs):
+        return await self._call('create_order', **kwargs)
+
+    async def create_oco_order(self, **kwargs):
+        return await self._call('create_oco_order', **kwargs)
+
+    async def cancel_order(self, **kwargs):
+        return await self._call('cancel_order', **kwargs)
+
+    async def get_order(self, **kwargs):
+        return await self._call('get_order', **kwargs)
+
+    async def get_open_orders(self, **kwargs):
+        return await self._call('get_open_orders', **kwargs)
+
+    async def get_symbol_info(self, symbol):
+        return await self._call('get_symbol_info', symbol=symbol)
+
+    async def close_connection(self):
+        pass
@@ -0,0 +1,192 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from decimal import Decimal
+
+
+def _decimals(value):
+    """Decimal places of an exchange number string ("0.00001000" -> 5, "1e-05" -> 5, "10.0" -> 0)"""
+    exp = Decimal(str(value)).normalize().as_tuple().exponent
+    return max(0, -exp)
+
+
+def _units(value, decimals):
+    """value as an integer count of 10**-decimals"""
+    return int(Decimal(str(value)).scaleb(decimals))
+
+
+def _format(units, decimals):
+    """Integer units back to a plain decimal string, never scientific notation"""
+    if decimals == 0:
+        return str(units)
+    sign = '-' if units < 0 else ''
+    digits = str(abs(units)).rjust(decimals + 1, '0')
+    return f"{sign}{digits[:-decimals]}.{digits[-decimals:]}"
+
+
+class SymbolFilters:
+    """
+    One symbol's LOT_SIZE / PRICE_FILTER / (MIN_)NOTIONAL compiled to integer units.
+    quantize_* snap to the exchange grid with float math plus one integer modulo and
+    return the strings the order endpoints expect.
+    """
+    __slots__ = ('symbol', 'raw', 'qty_decimals', 'qty_scale', 'step_units', 'min_qty_units', 'max_qty_units',
+                 'price_decimals', 'price_scale', 'tick_units', 'min_price', 'max_price',
+                 'min_notional', 'notional_on_market', 'oco_allowed')
+
+    def __init__(self, symbol, raw):
+        self.symbol = symbol
+        self.raw = raw  # filter strings as the exchange sent them; what gets persisted
+        lot = raw.get('LOT_SIZE', {})
+        price = raw.get('PRICE_FILTER', {})
+        notional = raw.get('NOTIONAL') or raw.get('MIN_NOTIONAL') or {}
+
+        step = lot.get('stepSize') or '0'
+        self.qty_decimals = max(_decimals(step), _decimals(lot.get('minQty') or '0'))
+        self.qty_scale = 10 ** self.qty_decimals
+        self.step_units = _units(step, self.qty_decimals) or 1
+        self.min_qty_units = _units(lot.get('minQty') or '0', self.qty_decimals)
+        self.max_qty_units = _units(lot.get('maxQty') or '0', self.qty_decimals) or None
+
+        tick = price.get('tickSize') or '0'
+        self.price_decimals = _decimals(tick) if Decimal(tick) else raw.get('quotePrecision', 8)
+        self.price_scale = 10 ** self.price_decimals
+        self.tick_units = _units(tick, self.price_decimals) or 1
+        self.min_price = float(price.get('minPrice') or 0)
+        self.max_price = float(price.get('maxPrice') or 0) or None
+
+        self.min_notional = float(notional.get('minNotional') or 0)
+        self.notional_on_market = bool(notional.get('applyToMarket', notional.get('applyMinToMarket', True)))
+        self.oco_allowed = raw.get('ocoAllowed')  # None in tables saved before it was kept
+
+    def qty_units(self, qty):
+        """Largest valid quantity <= qty, in units of 10**-qty_decimals (0 if below minQty)"""
+        units = math.floor(qty * self.qty_scale + 1e-9)
+        units -= units % self.step_units
+        if self.max_qty_units and units > self.max_qty_units:
+            units = self.max_qty_units - self.max_qty_units % self.step_units
+        return units if units >= self.min_qty_units else 0
+
+    def quantize_qty(self, qty):
+        """Quantity floored to stepSize (never more than we hold or sized), as a string"""
+        return _format(self.qty_units(qty), self.qty_decimals)
+
+    def quantize_price(self, price):
+        """Price rounded to the nearest tickSize, as a string"""
+        units = round(price * self.price_scale / self.tick_units) * self.tick_units
+        return _format(units, self.price_decimals)
+
+    def check(self, qty, price, market=False):
+        """Reason the exchange would reject (qty, price) after quantizing, or None"""
+        units = self.qty_units(qty)
+        if units <= 0:
+            return f"{self.symbol}: quantity {qty} below minQty/stepSize"
+        q = units / self.qty_scale
+        if price is not None:
+            p = float(self.quantize_price(price))
+            if not market and (p < self.min_price or (self.max_price and p > self.max_price)):
+                return f"{self.symbol}: price {p} outside [{self.min_price}, {self.max_price}]"
+            if self.min_notional and (self.notional_on_market or not market) and q * p < self.min_notional:
+                return f"{self.symbol}: notional {q * p:.8f} below minNotional {self.min_notional}"
+        return None
+
+    def precision(self):
+        return {'qty': self.qty_decimals, 'price': self.price_decimals}
+
+
+class FilterTable:
+    """
+    Compiled exchangeInfo filters for every symbol.
+    - Loaded from `path` at startup when younger than max_age_s; otherwise fetched once
+      and persisted (atomic replace), so a boot doesn't pay the exchangeInfo download.
+    - start_refresh() re-fetches on a schedule in a daemon thread; lookups swap to the
+      new table in one assignment and never block.
+    """
+    def __init__(self, path=None, max_age_s=86400, logger=None):
+        self.path = path
+        self.max_age_s = max_age_s
+        self.logger = logger or logging.getLogger(__name__)
+        self.symbols = {}
+        self.fetched_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def compile(exchange_info):
+        """symbol -> raw filter dict from a get_exchange_info() response"""
+        raw = {}
+        for info in exchange_info.get('symbols', []):
+            filters = {f['filterType']: f for f in info.get('filters', [])}
+            filters['quotePrecision'] = info.get('quotePrecision', 8)
+            if 'ocoAllowed' in info:
+                filters['ocoAllowed'] = bool(info['ocoAllowed'])
+            raw[info['symbol']] = filters
+        return raw
+
+    def _install(self, raw, fetched_at):
+        self.symbols = {symbol: SymbolFilters(symbol, filters) for symbol, filters in raw.items()}
+        self.fetched_at = fetched_at
+
+    def load(self, client=None):
+        """Disk if fresh enough, else the exchange (falling back to a stale file if that fails)"""
+        cached = None
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    cached = json.load(f)
+            except Exception as e:
+                self.logger.error(f"Error reading filter table {self.path}: {e}")
+        if cached and time.time() - cached.get('fetched_at', 0) <= self.max_age_s:
+            self._install(cached['symbols'], cached['fetched_at'])
+            return self
+        if client is not None:
+            try:
+                return self.refresh(client)
+            except Exception as e:
+                self.logger.error(f"Error fetching exchange filters: {e}")
+        if cached:
+            self.logger.warning(f"Using stale filter table from {self.path}")
+            self._install(cached['symbols'], cached.get('fetched_at', 0))
+        return self
+
+    def refresh(self, client):
+        raw = self.compile(client.get_exchange_info())
+        self._install(raw, time.time())
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({'fetched_at': self.fetched_at, 'symbols': raw}, f)
+            os.replace(tmp, self.path)
+        self.logger.info(f"Exchange filters refreshed: {len(self.symbols)} symbols")
+        return self
+
+    def start_refresh(self, client, interval_s):
+        def loop():
+            while not self._stop.wait(interval_s):
+                try:
+                    self.refresh(client)
+                except Exception as e:
+                    self.logger.error(f"Error refreshing exchange filters: {e}")
+
+        self._thread = threading.Thread(target=loop, name="filter-refresh", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def get(self, symbol):
+        return self.symbols.get(symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self.symbols
+
+    def __getitem__(self, symbol):
+        return self.symbols[symbol]
+
+    def precision_map(self):
+        return {symbol: f.precision() for symbol, f in self.symbols.items()}
@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+import numpy as np
+
+# Seconds; wide enough for a sub-ms signal and a multi-second REST stall
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts plus sum/count (Prometheus histogram) and a bounded window of
+    recent samples for p50/p99. observe() is a bisect and three increments under a lock.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'recent', '_lock')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def quantiles(self, qs=(0.5, 0.99)):
+        with self._lock:
+            recent = np.array(self.recent)
+        if not len(recent):
+            return {q: 0.0 for q in qs}
+        return dict(zip(qs, np.quantile(recent, qs).tolist()))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Span:
+    __slots__ = ('hist', 't0')
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _num(x):
+    return repr(float(x)) if x == x and abs(x) != float('inf') else ('+Inf' if x > 0 else '-Inf' if x < 0 else 'NaN')
+
+
+class Metrics:
+    """
+    Process-wide registry rendered in the Prometheus text format at /metrics.
+    - histogram(name, help, labels) families hold one Histogram per label-value tuple;
+      span(stage, symbol) times a block into bot_stage_seconds{stage, symbol}.
+    - counters and gauges are plain numbers per label-value tuple.
+    Every histogram is exported twice: as a histogram (buckets, all-time) and as
+    <name>_recent, a summary with p50/p99 over the last `window` samples.
+    """
+    def __init__(self, window=1000, buckets=DEFAULT_BUCKETS):
+        self.window = window
+        self.buckets = tuple(buckets)
+        self._families = {}  # name -> {'type', 'help', 'labels', 'series': {values: Histogram | float}}
+        self._lock = threading.Lock()
+        self.histogram('bot_stage_seconds', "Engine stage latency", ('stage', 'symbol'))
+
+    def _family(self, name, type_, help_, labels):
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(name, {'type': type_, 'help': help_, 'labels': tuple(labels),
+                                                          'series': {}})
+        return family
+
+    def histogram(self, name, help_="", labels=()):
+        self._family(name, 'histogram', help_, labels)
+        return name
+
+    def _series(self, name, values):
+        series = self._families[name]['series']
+        hist = series.get(values)
+        if hist is None:
+            with self._lock:
+                hist = series.setdefault(values, Histogram(self.buckets, self.window))
+        return hist
+
+    def observe(self, name, value, *label_values):
+        self._series(name, label_values).observe(value)
+
+    def span(self, stage, symbol=""):
+        """with metrics.span("klines", symbol): ... records into bot_stage_seconds"""
+        return _Span(self._series('bot_stage_seconds', (stage, symbol)))
+
+    def timer(self, name, *label_values):
+        """Like span() for any histogram family"""
+        return _Span(self._series(name, label_values))
+
+    def inc(self, name, *label_values, amount=1, help_="", labels=()):
+        family = self._family(name, 'counter', help_, labels)
+        with self._lock:
+            family['series'][label_values] = family['series'].get(label_values, 0) + amount
+
+    def set(self, name, value, *label_values, help_="", labels=()):
+        family = self._family(name, 'gauge', help_, labels)
+        family['series'][label_values] = value
+
+    def quantiles(self, name='bot_stage_seconds'):
+        """{label values: {'p50_ms', 'p99_ms', 'count'}} for one histogram family"""
+        out = {}
+        for values, hist in list(self._families[name]['series'].items()):
+            q = hist.quantiles()
+            out[values] = {'p50_ms': q[0.5] * 1000, 'p99_ms': q[0.99] * 1000, 'count': hist.count}
+        return out
+
+    def render(self):
+        """All families in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            labels = family['labels']
+            series = sorted(family['series'].items(), key=lambda kv: tuple(map(str, kv[0])))
+            if family['type'] != 'histogram':
+                lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['type']}")
+                for values, value in series:
+                    lines.append(f"{name}{_labels(labels, values)} {_num(value)}")
+                continue
+
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} histogram")
+            summaries = []
+            for values, hist in series:
+                counts, total, count = hist.snapshot()
+                cumulative = 0
+                for bound, c in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{_labels(labels, values, ('le', _num(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels, values)} {_num(total)}")
+                lines.append(f"{name}_count{_labels(labels, values)} {count}")
+                summaries.append((values, hist.quantiles(), total, count))
+
+            lines.append(f"# HELP {name}_recent {family['help']}, last {self.window} samples")
+            lines.append(f"# TYPE {name}_recent summary")
+            for values, q, total, count in summaries:
+                for quantile, v in q.items():
+                    lines.append(f"{name}_recent{_labels(labels, values, ('quantile', quantile))} {_num(v)}")
+                lines.append(f"{name}_recent_sum{_labels(labels, values)} {_num(total)}")
+                lines.append(f"{name}_recent_count{_labels(labels, values)} {count}")
+        return "\n".join(lines) + "\n"
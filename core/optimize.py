@@ -0,0 +1,346 @@
+import argparse
+import copy
+import functools
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from core.backtest import (columns, ema_1d, load_archive, load_dir, resample, rolling_mean_1d, rolling_std_1d, run,
+                           synthetic_klines)
+from core.datafeed import KLINE_FIELDS
+
+# Swept parameters, as dotted paths into settings.yaml. The first five shape the indicators;
+# the exit multiples only move stops and targets, so they reuse the same indicator arrays.
+INDICATOR_KEYS = ('macd.fast', 'macd.slow', 'macd.signal', 'ema.len', 'atr_len')
+EXIT_KEYS = ('exits.atr_stop', 'exits.atr_tp')
+
+DEFAULT_GRID = {
+    'macd.fast': [8, 12, 16],
+    'macd.slow': [21, 26, 34],
+    'macd.signal': [7, 9],
+    'ema.len': [100, 200],
+    'atr_len': [14],
+    'exits.atr_stop': [1.0, 1.5, 2.0],
+    'exits.atr_tp': [1.5, 2.0, 3.0],
+}
+
+METRICS = {
+    'calmar': lambda r: r['return_pct'] / max(r['max_drawdown_pct'], 1.0),
+    'return': lambda r: r['return_pct'],
+    'profit_factor': lambda r: 0.0 if pd.isna(r['profit_factor']) else r['profit_factor'],
+}
+
+
+def get_param(params, dotted):
+    for key in dotted.split('.'):
+        params = params[key]
+    return params
+
+
+def set_param(params, dotted, value):
+    *path, last = dotted.split('.')
+    for key in path:
+        params = params.setdefault(key, {})
+    params[last] = value
+
+
+def parse_grid(items, base_grid=None):
+    """["macd.fast=8,12", ...] over a base grid; values are parsed as YAML scalars"""
+    grid = dict(base_grid or DEFAULT_GRID)
+    for item in items or []:
+        key, _, values = item.partition('=')
+        grid[key.strip()] = [yaml.safe_load(v) for v in values.split(',') if v.strip()]
+    return grid
+
+
+def combinations(grid):
+    """Every grid point as {dotted key: value}, dropping MACD fast >= slow"""
+    keys = [k for k in INDICATOR_KEYS + EXIT_KEYS if k in grid]
+    out = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        combo = dict(zip(keys, values))
+        if combo.get('macd.fast', 0) >= combo.get('macd.slow', float('inf')):
+            continue
+        out.append(combo)
+    return out
+
+
+# --- Shared dataset -----------------------------------------------------------
+
+def write_dataset(data, directory):
+    """One .npy per symbol and field, so workers can memory-map contiguous columns"""
+    os.makedirs(directory, exist_ok=True)
+    for symbol, klines in data.items():
+        for field, col in columns(klines).items():
+            np.save(os.path.join(directory, f"{symbol}.{field}.npy"), np.ascontiguousarray(col, dtype=np.float64))
+    return directory
+
+
+def open_dataset(directory, symbols):
+    """{symbol: {field: read-only memmap}}; pages are shared through the OS cache, not copied"""
+    return {s: {f: np.load(os.path.join(directory, f"{s}.{f}.npy"), mmap_mode='r') for f in KLINE_FIELDS}
+            for s in symbols}
+
+
+# --- Worker side: per-process dataset and indicator cache ------------------------
+
+_DATA = None
+_BASE = None
+_cache = None
+
+
+def _init_worker(directory, symbols, base_params, cache_size):
+    global _DATA, _BASE, _cache
+    _DATA = open_dataset(directory, symbols)
+    _BASE = base_params
+
+    @functools.lru_cache(maxsize=cache_size)
+    def component(symbol, kind, *args):
+        # Each array depends only on its own parameter subset, so e.g. every (signal, ema, atr)
+        # combination for one (fast, slow) pair shares the two EMAs behind the MACD line
+        d = _DATA[symbol]
+        if kind == 'ema':
+            return ema_1d(np.asarray(d['close']), args[0])
+        if kind == 'macd':
+            return component(symbol, 'ema', args[0]) - component(symbol, 'ema', args[1])
+        if kind == 'macd_sig':
+            return ema_1d(component(symbol, 'macd', args[0], args[1]), args[2])
+        if kind == 'atr':
+            high, low, close = (np.asarray(d[f]) for f in ('high', 'low', 'close'))
+            prev = np.concatenate(([np.nan], close[:-1]))
+            tr = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+            atrv = rolling_mean_1d(tr, args[0])
+            atrv[:args[0]] = np.nan
+            return atrv
+        if kind == 'volz':
+            volume = np.asarray(d['volume'])
+            return (volume - rolling_mean_1d(volume, 20)) / (rolling_std_1d(volume, 20) + 1e-9)
+        if kind == 'bounds':
+            open_time = np.asarray(d['open_time'])
+            return int(np.searchsorted(open_time, args[0])), int(np.searchsorted(open_time, args[1]))
+        raise ValueError(kind)
+
+    _cache = component
+
+
+def _indicators(symbol, fast, slow, signal, ema_len, atr_len):
+    return (_cache(symbol, 'macd', fast, slow), _cache(symbol, 'macd_sig', fast, slow, signal),
+            _cache(symbol, 'ema', ema_len), _cache(symbol, 'atr', atr_len), _cache(symbol, 'volz'))
+
+
+def _evaluate(task):
+    """(combos sharing one indicator key, windows, equity, fee_bps) -> result rows"""
+    combos, windows, equity, fee_bps = task
+    first = combos[0]
+    ind_args = [first.get(k, get_param(_BASE, k)) for k in INDICATOR_KEYS]
+    rows = []
+    for w, (start_ms, end_ms) in windows:
+        data, indicators = {}, {}
+        for symbol in _DATA:
+            a, b = _cache(symbol, 'bounds', start_ms, end_ms)
+            if b - a < 2:
+                continue
+            # Indicators come from the full history (no look-ahead), sliced to the window
+            data[symbol] = {f: col[a:b] for f, col in _DATA[symbol].items()}
+            indicators[symbol] = tuple(x[a:b] for x in _indicators(symbol, *ind_args))
+        for combo in combos:
+            params = copy.deepcopy(_BASE)
+            for key, value in combo.items():
+                set_param(params, key, value)
+            report, _ = run(data, params, equity=equity, fee_bps=fee_bps, indicators=indicators)
+            rows.append({**combo, 'window': w, 'return_pct': report['return_pct'],
+                         'max_drawdown_pct': report['max_drawdown_pct'], 'trades': report['trades'],
+                         'win_rate_pct': report['win_rate_pct'], 'profit_factor': report['profit_factor']})
+    return rows
+
+
+# --- Driver -------------------------------------------------------------------
+
+def walk_forward_windows(start_ms, end_ms, train_days, test_days):
+    """Rolling (train, test) windows of open-time ranges: train [s, s+train), test [s+train, s+train+test)"""
+    day = 86_400_000
+    out = []
+    s = start_ms
+    while s + (train_days + test_days) * day <= end_ms:
+        train = (s, s + train_days * day)
+        out.append((train, (train[1], train[1] + test_days * day)))
+        s += test_days * day
+    return out
+
+
+class Sweep:
+    """
+    Grid sweep over a memory-mapped dataset on a process pool.
+    Tasks group grid points by their indicator parameters, so one worker computes a set
+    of indicator arrays once and evaluates every exit multiple on them; contiguous tasks
+    share sub-results (EMAs, ATR, volume z) through each worker's cache.
+    """
+    def __init__(self, directory, symbols, base_params, workers=None, cache_size=64, equity=10_000.0,
+                 fee_bps=10.0, min_trades=10, metric='calmar'):
+        self.directory = directory
+        self.symbols = list(symbols)
+        self.base = base_params
+        self.workers = workers or os.cpu_count()
+        self.cache_size = cache_size
+        self.equity = equity
+        self.fee_bps = fee_bps
+        self.min_trades = min_trades
+        self.metric = metric
+
+    def score(self, df):
+        raw = df.apply(METRICS[self.metric], axis=1) if len(df) else pd.Series(dtype=float)
+        return raw.where(df['trades'] >= self.min_trades, -np.inf) if len(df) else raw
+
+    def evaluate(self, combos, windows, pool):
+        groups = {}
+        for combo in combos:
+            groups.setdefault(tuple(combo.get(k) for k in INDICATOR_KEYS), []).append(combo)
+        tasks = [(group, list(windows), self.equity, self.fee_bps) for _, group in sorted(groups.items(), key=str)]
+        chunksize = max(1, len(tasks) // (self.workers * 4))
+        rows = [row for result in pool.map(_evaluate, tasks, chunksize=chunksize) for row in result]
+        df = pd.DataFrame(rows)
+        if len(df):
+            df['score'] = self.score(df)
+        return df
+
+    def run(self, grid, windows=None, walk_forward=None):
+        """
+        windows: [(start_ms, end_ms)] for a plain sweep (default: everything).
+        walk_forward: [(train, test)] windows; each fold's best train point is re-run on its test window.
+        Returns (ranked DataFrame, folds DataFrame or None, best combo).
+        """
+        combos = combinations(grid)
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                 initargs=(self.directory, self.symbols, self.base, self.cache_size)) as pool:
+            if not walk_forward:
+                df = self.evaluate(combos, list(enumerate(windows or [(0, 2 ** 62)])), pool)
+                ranked = df.sort_values('score', ascending=False).reset_index(drop=True)
+                return ranked, None, _combo_of(ranked, 0) if len(ranked) else None
+
+            train = self.evaluate(combos, [(i, tr) for i, (tr, _) in enumerate(walk_forward)], pool)
+            keys = [k for k in combos[0]]
+            folds = []
+            for i, (_, test) in enumerate(walk_forward):
+                fold = train[train['window'] == i].sort_values('score', ascending=False)
+                if not len(fold):
+                    continue
+                best = _combo_of(fold, 0)
+                oos = self.evaluate([best], [(i, test)], pool)
+                folds.append({'fold': i, **best, 'train_score': fold.iloc[0]['score'],
+                              'test_return_pct': oos.iloc[0]['return_pct'],
+                              'test_max_drawdown_pct': oos.iloc[0]['max_drawdown_pct'],
+                              'test_trades': oos.iloc[0]['trades'], 'test_score': oos.iloc[0]['score']})
+            folds = pd.DataFrame(folds)
+            ranked = (train.groupby(keys)
+                      .agg(score=('score', 'mean'), return_pct=('return_pct', 'mean'),
+                           max_drawdown_pct=('max_drawdown_pct', 'max'), trades=('trades', 'sum'))
+                      .sort_values('score', ascending=False).reset_index())
+            # The most recent fold's choice is the one to trade next
+            best = _combo_of(folds, len(folds) - 1) if len(folds) else None
+            return ranked, folds, best
+
+
+def _combo_of(df, pos):
+    """Grid point at row `pos`, read column-wise so ints stay ints"""
+    return {k: df[k].iloc[pos].item() for k in INDICATOR_KEYS + EXIT_KEYS if k in df.columns}
+
+
+def candidate_settings(base_params, combo):
+    params = copy.deepcopy(base_params)
+    for key, value in combo.items():
+        set_param(params, key, value)
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep / walk-forward optimizer")
+    parser.add_argument("data", nargs="?", help="directory of <SYMBOL>*.csv / .npy kline files")
+    parser.add_argument("--config", default="settings.yaml")
+    parser.add_argument("--symbols", nargs="*")
+    parser.add_argument("--interval", help="default: timeframes.trade")
+    parser.add_argument("--synthetic", type=float, metavar="DAYS")
+    parser.add_argument("--archive", metavar="DIR", help="read klines from a kline archive (see core.archive)")
+    parser.add_argument("--archive-interval", default="1m", help="archived interval to resample from")
+    parser.add_argument("--grid", nargs="*", metavar="KEY=V1,V2", help="override grid axes, e.g. macd.fast=8,12")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--cache-size", type=int, default=64, help="indicator arrays kept per worker")
+    parser.add_argument("--metric", choices=sorted(METRICS), default="calmar")
+    parser.add_argument("--min-trades", type=int, default=10)
+    parser.add_argument("--walk-forward", nargs=2, type=float, metavar=("TRAIN_DAYS", "TEST_DAYS"))
+    parser.add_argument("--equity", type=float, default=10_000.0)
+    parser.add_argument("--fee-bps", type=float, default=10.0)
+    parser.add_argument("--workdir", help="where the memory-mapped dataset is written (default: temp dir)")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--out", default="optimize_results.csv")
+    parser.add_argument("--settings-out", default="settings.candidate.yaml")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r') as f:
+        base = yaml.safe_load(f)
+    interval = args.interval or base['timeframes']['trade']
+    symbols = args.symbols or base['symbols']
+
+    t0 = time.perf_counter()
+    if args.synthetic:
+        data = {s: resample(synthetic_klines(args.synthetic, seed=i), interval) for i, s in enumerate(symbols)}
+    elif args.archive:
+        data = load_archive(args.archive, symbols, interval, args.archive_interval)
+    elif args.data:
+        data = load_dir(args.data, set(symbols), interval)
+    else:
+        parser.error("give a data directory, --archive DIR or --synthetic DAYS")
+    missing = [s for s in symbols if s not in data]
+    if missing:
+        print(f"No klines for {', '.join(missing)}; sweeping without them", file=sys.stderr)
+    if not data:
+        parser.error("no klines for any symbol")
+    symbols = list(data)
+
+    tmp = None
+    if args.workdir:
+        directory = write_dataset(data, args.workdir)
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="optimize-")
+        directory = write_dataset(data, tmp.name)
+    start = min(int(columns(k)['open_time'][0]) for k in data.values())
+    end = max(int(columns(k)['open_time'][-1]) for k in data.values()) + 1
+    del data
+
+    sweep = Sweep(directory, symbols, base, workers=args.workers, cache_size=args.cache_size, equity=args.equity,
+                  fee_bps=args.fee_bps, min_trades=args.min_trades, metric=args.metric)
+    grid = parse_grid(args.grid)
+    windows = walk_forward_windows(start, end, *args.walk_forward) if args.walk_forward else None
+    if args.walk_forward and not windows:
+        parser.error("walk-forward windows do not fit in the data")
+    ranked, folds, best = sweep.run(grid, walk_forward=windows)
+    elapsed = time.perf_counter() - t0
+
+    ranked.to_csv(args.out, index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(ranked.head(args.top).to_string())
+        if folds is not None:
+            print("\nWalk-forward:")
+            print(folds.to_string(index=False))
+            oos = float(np.prod(1 + folds['test_return_pct'] / 100) - 1) * 100 if len(folds) else 0.0
+            print(f"Out-of-sample compounded return: {oos:.2f}%")
+    print(f"\n{len(combinations(grid))} grid points x {len(windows) if windows else 1} window(s) "
+          f"in {elapsed:.1f}s; ranked table -> {args.out}")
+
+    if best:
+        with open(args.settings_out, 'w') as f:
+            yaml.safe_dump(candidate_settings(base, best), f, sort_keys=False)
+        print(f"Candidate settings -> {args.settings_out}: {json.dumps(best)}")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
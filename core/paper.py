@@ -0,0 +1,310 @@
+import itertools
+import logging
+import threading
+
+from core.broker import LiveBroker
+from core.fake_exchange import api_error
+
+QUOTE_ASSETS = ('USDT', 'USDC', 'BUSD', 'USD', 'BTC', 'ETH')
+
+
+class PaperExchange:
+    """
+    Local matching engine behind the python-binance Client order and account surface.
+    - Everything it does not implement (klines, exchangeInfo, tickers, ...) is proxied to
+      `market`, a real, rate-limited or replaying client, so DataFeed, Account and the
+      filter table run unchanged on top of it.
+    - MARKET orders fill at once at the touch (bid/ask from the last quote, else the last
+      price) moved against us by slippage_bps plus impact_bps per 10k of quote notional.
+    - LIMIT / LIMIT_MAKER orders rest and fill at their price when a later bar trades through it.
+      STOP_LOSS_LIMIT orders trigger when a bar reaches stopPrice, then fill at the trigger
+      price (or the open on a gap) if that is within the limit, else rest as a plain limit.
+      A bar touching both legs of a bracket fills the stop, as in core.backtest.
+    - Filling one leg of an OCO cancels the other. Every fill and cancel is delivered as a
+      user-data executionReport to the subscribed callbacks (e.g. Engine.on_execution_report),
+      outside the book lock so handlers may cancel or place orders.
+    - Deterministic: ids come from counters and times from the market data fed in, so the
+      same data and orders always produce the same fills.
+    """
+    def __init__(self, market=None, balances=None, fee_bps=10.0, slippage_bps=2.0, impact_bps=0.0,
+                 logger=None):
+        self.market = market
+        self.balances = {a: float(q) for a, q in (balances or {'USD': 10_000.0}).items()}
+        self.fee_bps = fee_bps
+        self.slippage_bps = slippage_bps
+        self.impact_bps = impact_bps  # extra slippage per 10,000 of quote notional
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.orders = {}          # clientOrderId -> order dict
+        self.prices = {}          # symbol -> last traded price
+        self.quotes = {}          # symbol -> (bid, ask)
+        self.last_bar = {}        # symbol -> open_time of the last bar matched
+        self.now_ms = 0           # market time of the last price seen
+        self.fills = 0
+        self._assets = {}         # symbol -> (base, quote)
+        self._listeners = []
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        if name == 'market' or self.market is None:
+            raise AttributeError(name)
+        return getattr(self.market, name)
+
+    def subscribe(self, callback):
+        """callback(executionReport) for every fill and cancel"""
+        self._listeners.append(callback)
+
+    def _emit(self, events):
+        for event in events:
+            for callback in self._listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    self.logger.error(f"Error delivering paper {event['X']} for {event['c']}: {e}")
+
+    # --- market data ----------------------------------------------------
+
+    def quote(self, symbol, bid, ask, ts_ms=None):
+        """Top of book used for MARKET fills"""
+        with self._lock:
+            self.quotes[symbol] = (float(bid), float(ask))
+            self.prices.setdefault(symbol, (float(bid) + float(ask)) / 2)
+            if ts_ms is not None:
+                self.now_ms = max(self.now_ms, int(ts_ms))
+
+    def on_bar(self, symbol, open_time, open_, high, low, close, close_time=None):
+        """Match resting orders against one bar; returns the executionReports produced"""
+        with self._lock:
+            if open_time <= self.last_bar.get(symbol, -1):
+                return []
+            self.last_bar[symbol] = open_time
+            self.now_ms = max(self.now_ms, int(close_time if close_time is not None else open_time))
+            events = self._match(symbol, open_time, float(open_), float(high), float(low))
+            self.prices[symbol] = float(close)
+            self.quotes.pop(symbol, None)  # stale once a newer bar is in
+        self._emit(events)
+        return events
+
+    def sync(self, datafeed, symbols, interval='1m', lookback=30):
+        """Feed bars closed since the last sync from a DataFeed, then mark the forming bar's price"""
+        for symbol in symbols:
+            rows = datafeed.klines_array(symbol, interval, lookback)
+            if not len(rows):
+                continue
+            for row in rows[:-1]:
+                self.on_bar(symbol, int(row[0]), row[1], row[2], row[3], row[4], int(row[6]))
+            with self._lock:
+                self.prices[symbol] = float(rows[-1, 4])
+                self.now_ms = max(self.now_ms, int(rows[-1, 0]))  # orders placed now belong to the forming bar
+
+    # --- matching ---------------------------------------------------------
+
+    def _match(self, symbol, open_time, open_, high, low):
+        events = []
+        # Only bars opening after the order was placed (the placement bar's range may predate it);
+        # stops first so a bar touching both legs takes the stop
+        resting = sorted((o for o in self.orders.values() if o['symbol'] == symbol and o['status'] == 'NEW'
+                          and o['transactTime'] < open_time),
+                         key=lambda o: (o['type'] != 'STOP_LOSS_LIMIT', o['orderId']))
+        for order in resting:
+            if order['status'] != 'NEW':
+                continue  # cancelled by an OCO sibling filled earlier in this bar
+            if not self._funded(order):
+                continue  # emulated bracket: the sibling already sold the position; its cancel is on the way
+            sell = order['side'] == 'SELL'
+            price = float(order['price'])
+            if order['type'] == 'STOP_LOSS_LIMIT' and not order.get('triggered'):
+                stop = float(order['stopPrice'])
+                if not (low <= stop if sell else high >= stop):
+                    continue
+                order['triggered'] = True
+                trigger = min(open_, stop) if sell else max(open_, stop)
+                if trigger >= price if sell else trigger <= price:
+                    events += self._fill(order, self._slipped(symbol, order['side'], trigger, order['origQty']))
+                # Gapped through the limit: rest as a plain limit from the next bar on
+                continue
+            if high >= price if sell else low <= price:
+                fill_price = max(open_, price) if sell else min(open_, price)
+                events += self._fill(order, fill_price)
+        return events
+
+    def _slipped(self, symbol, side, price, qty):
+        bps = self.slippage_bps + self.impact_bps * float(qty) * price / 10_000
+        return price * (1 + bps / 10_000) if side == 'BUY' else price * (1 - bps / 10_000)
+
+    def _touch(self, symbol, side):
+        if symbol in self.quotes:
+            bid, ask = self.quotes[symbol]
+            return ask if side == 'BUY' else bid
+        if symbol not in self.prices and self.market is not None:
+            book = self.market.get_orderbook_ticker(symbol=symbol)
+            bid, ask = float(book['bidPrice']), float(book['askPrice'])
+            self.quotes[symbol] = (bid, ask)
+            return ask if side == 'BUY' else bid
+        if symbol not in self.prices:
+            raise api_error(-1121, "Invalid symbol.")
+        return self.prices[symbol]
+
+    def assets(self, symbol):
+        """(base, quote) asset of a symbol"""
+        if symbol not in self._assets:
+            info = None
+            if self.market is not None:
+                try:
+                    info = self.market.get_symbol_info(symbol)
+                except Exception:
+                    info = None
+            if info and info.get('baseAsset'):
+                self._assets[symbol] = (info['baseAsset'], info['quoteAsset'])
+            else:
+                quote = next((q for q in QUOTE_ASSETS if symbol.endswith(q) and len(symbol) > len(q)), 'USD')
+                self._assets[symbol] = (symbol[:-len(quote)], quote)
+        return self._assets[symbol]
+
+    def _fill(self, order, price):
+        qty = float(order['origQty'])
+        base, quote = self.assets(order['symbol'])
+        notional = qty * price
+        fee = notional * self.fee_bps / 10_000
+        sign = 1 if order['side'] == 'BUY' else -1
+        self.balances[base] = self.balances.get(base, 0.0) + sign * qty
+        self.balances[quote] = self.balances.get(quote, 0.0) - sign * notional - fee
+        order.update(status='FILLED', executedQty=str(qty), cummulativeQuoteQty=str(notional),
+                     updateTime=self.now_ms,
+                     fills=[{'price': str(price), 'qty': str(qty), 'commission': str(fee), 'commissionAsset': quote}])
+        self.fills += 1
+        events = [self._report(order, price)]
+        if order['orderListId'] != -1:
+            for other in self.orders.values():
+                if other['orderListId'] == order['orderListId'] and other is not order and other['status'] == 'NEW':
+                    other['status'] = 'CANCELED'
+                    events.append(self._report(other))
+        return events
+
+    def _report(self, order, price=0.0):
+        return {'e': 'executionReport', 'E': self.now_ms, 's': order['symbol'], 'S': order['side'],
+                'o': order['type'], 'c': order['clientOrderId'], 'i': order['orderId'], 'X': order['status'],
+                'q': order['origQty'], 'z': order['executedQty'], 'Z': order['cummulativeQuoteQty'],
+                'L': str(price), 'T': self.now_ms, 'paper': True}
+
+    def _new_order(self, symbol, side, type_, qty, price=None, stop_price=None, cid=None, list_id=-1):
+        if cid in self.orders:
+            raise api_error(-2010, "Duplicate order sent.")
+        order_id = next(self._ids)
+        order = {
+            'symbol': symbol, 'orderId': order_id, 'orderListId': list_id,
+            'clientOrderId': cid or f"paper-{order_id}", 'transactTime': self.now_ms,
+            'price': str(price or 0), 'origQty': str(qty), 'executedQty': '0',
+            'cummulativeQuoteQty': '0', 'status': 'NEW', 'type': type_, 'side': side,
+            'stopPrice': str(stop_price or 0), 'fills': [],
+        }
+        self.orders[order['clientOrderId']] = order
+        return order
+
+    def _funded(self, order):
+        try:
+            self._check_balance(order['symbol'], order['side'], float(order['origQty']),
+                                float(order['price']) or self.prices.get(order['symbol'], 0.0))
+            return True
+        except Exception:
+            return False
+
+    def _check_balance(self, symbol, side, qty, price):
+        base, quote = self.assets(symbol)
+        if side == 'BUY':
+            need = qty * price * (1 + self.fee_bps / 10_000)
+            if self.balances.get(quote, 0.0) + 1e-9 < need:
+                raise api_error(-2010, "Account has insufficient balance for requested action.")
+        elif self.balances.get(base, 0.0) + 1e-12 < qty:
+            raise api_error(-2010, "Account has insufficient balance for requested action.")
+
+    # --- client surface -------------------------------------------------
+
+    def create_order(self, symbol, side, type, quantity, newClientOrderId=None, price=None,
+                     stopPrice=None, timeInForce=None, **kwargs):
+        qty = float(quantity)
+        with self._lock:
+            events = []
+            if type == 'MARKET':
+                fill_price = self._slipped(symbol, side, self._touch(symbol, side), qty)
+                self._check_balance(symbol, side, qty, fill_price)
+                order = self._new_order(symbol, side, type, qty, cid=newClientOrderId)
+                events = self._fill(order, fill_price)
+            else:
+                self._check_balance(symbol, side, qty, float(price))
+                order = self._new_order(symbol, side, type, qty, float(price), stopPrice and float(stopPrice),
+                                        newClientOrderId)
+            resp = dict(order)
+        self._emit(events)
+        return resp
+
+    def create_oco_order(self, symbol, side, quantity, price, stopPrice, stopLimitPrice,
+                         listClientOrderId=None, limitClientOrderId=None, stopClientOrderId=None, **kwargs):
+        qty = float(quantity)
+        with self._lock:
+            self._check_balance(symbol, side, qty, float(price))
+            list_id = next(self._ids)
+            stop = self._new_order(symbol, side, 'STOP_LOSS_LIMIT', qty, float(stopLimitPrice),
+                                   float(stopPrice), stopClientOrderId, list_id)
+            limit = self._new_order(symbol, side, 'LIMIT_MAKER', qty, float(price), None, limitClientOrderId, list_id)
+            return {'orderListId': list_id, 'contingencyType': 'OCO', 'listClientOrderId': listClientOrderId,
+                    'transactionTime': self.now_ms, 'orderReports': [dict(stop), dict(limit)]}
+
+    def cancel_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        with self._lock:
+            order = self._find(orderId, origClientOrderId)
+            if order['status'] != 'NEW':
+                raise api_error(-2011, "Unknown order sent.")
+            order['status'] = 'CANCELED'
+            events = [self._report(order)]
+            resp = dict(order)
+        self._emit(events)
+        return resp
+
+    def get_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        with self._lock:
+            return dict(self._find(orderId, origClientOrderId))
+
+    def get_open_orders(self, symbol=None, **kwargs):
+        with self._lock:
+            return [dict(o) for o in self.orders.values()
+                    if o['status'] == 'NEW' and (symbol is None or o['symbol'] == symbol)]
+
+    def get_account(self, **kwargs):
+        with self._lock:
+            return {'canTrade': True, 'updateTime': self.now_ms,
+                    'balances': [{'asset': a, 'free': f"{q:.8f}", 'locked': '0.00000000'}
+                                 for a, q in self.balances.items()]}
+
+    def _find(self, order_id=None, client_order_id=None):
+        order = self.orders.get(client_order_id) if client_order_id is not None else \
+            next((o for o in self.orders.values() if o['orderId'] == order_id), None)
+        if order is None:
+            raise api_error(-2013, "Order does not exist.")
+        return order
+
+    def stats(self):
+        with self._lock:
+            return {'fills': self.fills, 'open_orders': sum(o['status'] == 'NEW' for o in self.orders.values()),
+                    'balances': {a: round(q, 8) for a, q in self.balances.items() if q}}
+
+
+class PaperBroker(LiveBroker):
+    """
+    LiveBroker over a PaperExchange: the same request builders, rounding, bracket book and
+    native/emulated OCO choice as live trading, but orders are matched locally and never
+    touch the REST order endpoints or their rate budget.
+    """
+    def __init__(self, exchange, symbol_precisions, native_oco="auto", latency_window=500, filters=None,
+                 metrics=None):
+        super().__init__(exchange, symbol_precisions, native_oco=native_oco, latency_window=latency_window,
+                         filters=filters, metrics=metrics)
+        self.exchange = exchange
+
+    def sync(self, datafeed, symbols, interval='1m'):
+        """Match resting orders against bars closed since the last call"""
+        self.exchange.sync(datafeed, symbols, interval)
+
+    def stats(self):
+        return self.exchange.stats()
@@ -0,0 +1,137 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class ProfilerBusy(RuntimeError):
+    """A profile is already running"""
+
+
+def _label(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(';', ':').replace(' ', '_')
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for one thread, started and stopped at runtime.
+    - start(seconds, thread_name) spawns a sampler that reads the target's stack from
+      sys._current_frames() every `interval_s` and counts identical stacks; it stops by
+      itself after `seconds` (capped at `max_seconds`).
+    - Nothing is hooked into the interpreter: when no profile is running the cost is zero,
+      while running it is one stack walk per interval on the sampler thread.
+    - Blocking time (REST calls, sleeps, locks) shows up as the frame it blocks in.
+    - collapsed() is Brendan Gregg's folded format ("a;b;c 42" per line) for flamegraph.pl
+      or speedscope; top(n) is per-function self/total samples.
+    The last profile is kept until the next start().
+    """
+    def __init__(self, interval_s=0.005, max_seconds=300, max_depth=128, logger=None):
+        self.interval_s = interval_s
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self.logger = logger or logging.getLogger(__name__)
+        self.stacks = Counter()
+        self.samples = 0
+        self.missed = 0               # ticks where the target thread had no frame (exited)
+        self.thread_name = None
+        self.started = None
+        self.stopped = None
+        self._labels = {}             # code object -> frame label
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=30, thread_name="trading-loop"):
+        target = next((t for t in threading.enumerate() if t.name == thread_name), None)
+        if target is None:
+            raise LookupError(f"no thread named {thread_name!r}")
+        with self._lock:
+            if self.running:
+                raise ProfilerBusy(f"already profiling {self.thread_name}")
+            self.stacks = Counter()
+            self.samples = 0
+            self.missed = 0
+            self.thread_name = thread_name
+            self.started = time.time()
+            self.stopped = None
+            self._stop.clear()
+            seconds = min(float(seconds), self.max_seconds)
+            self._thread = threading.Thread(target=self._run, args=(target.ident, seconds),
+                                            name="profiler", daemon=True)
+            self._thread.start()
+        self.logger.info(f"Profiling {thread_name} for {seconds:.0f}s")
+        return self.stats()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+        return self.stats()
+
+    def _run(self, ident, seconds):
+        deadline = time.monotonic() + seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                frame = sys._current_frames().get(ident)
+                if frame is None:
+                    self.missed += 1
+                else:
+                    stack = self._stack(frame)
+                    with self._lock:
+                        self.stacks[stack] += 1
+                        self.samples += 1
+                del frame
+                self._stop.wait(self.interval_s)
+        except Exception as e:
+            self.logger.error(f"Error sampling {self.thread_name}: {e}")
+        self.stopped = time.time()
+        self.logger.info(f"Profile of {self.thread_name} done: {self.samples} samples")
+
+    def _stack(self, frame):
+        labels = self._labels
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _label(code)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()               # root first, as the folded format expects
+        return ";".join(stack)
+
+    def collapsed(self):
+        """Folded stacks, one "frame;frame;... count" line per distinct stack"""
+        with self._lock:
+            stacks = sorted(self.stacks.items(), key=lambda kv: -kv[1])
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top(self, n=30):
+        """Functions by self samples (leaf of the stack), with total samples (anywhere on it)"""
+        own, total = Counter(), Counter()
+        with self._lock:
+            stacks = list(self.stacks.items())
+            samples = self.samples
+        for stack, count in stacks:
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for f in set(frames):
+                total[f] += count
+        pct = 100.0 / max(samples, 1)
+        ranked = sorted(total, key=lambda f: (-own[f], -total[f]))[:n]
+        return [{'function': f, 'self': own[f], 'total': total[f], 'self_pct': round(own[f] * pct, 2),
+                 'total_pct': round(total[f] * pct, 2)} for f in ranked]
+
+    def stats(self):
+        end = self.stopped or (time.time() if self.started else None)
+        return {'running': self.running, 'thread': self.thread_name, 'samples': self.samples,
+                'missed': self.missed, 'stacks': len(self.stacks), 'interval_ms': self.interval_s * 1000,
+                'started': self.started, 'elapsed_s': round(end - self.started, 3) if self.started else 0.0}
@@ -0,0 +1,217 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Request weight per endpoint (spot REST). Callables take the request params.
+# Estimates only: the X-MBX-USED-WEIGHT-1M header on every response is authoritative.
+def _klines_weight(p):
+    limit = int(p.get('limit', 500))
+    return 1 if limit <= 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+
+ENDPOINT_WEIGHTS = {
+    'klines': _klines_weight,
+    'aggTrades': 1,
+    'trades': 1,
+    'depth': lambda p: 1 if int(p.get('limit', 100)) <= 100 else 5 if int(p.get('limit')) <= 500 else 10,
+    'ticker/price': lambda p: 1 if 'symbol' in p else 2,
+    'ticker/bookTicker': lambda p: 1 if 'symbol' in p else 2,
+    'ticker/24hr': lambda p: 1 if 'symbol' in p else 40,
+    'exchangeInfo': 10,
+    'account': 10,
+    'openOrders': lambda p: 3 if 'symbol' in p else 40,
+    'allOrders': 10,
+    'order': 1,
+    'order/oco': 1,
+    'orderList': 1,
+    'userDataStream': 1,
+    'ping': 1,
+    'time': 1,
+}
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+# Order management must never queue behind market data. Ticker prices value the account
+# for the risk gate, so they are not shed with the rest of market data.
+ENDPOINT_PRIORITY = {
+    'order': HIGH, 'order/oco': HIGH, 'orderList': HIGH, 'openOrders': HIGH, 'userDataStream': HIGH,
+    'account': NORMAL, 'exchangeInfo': NORMAL, 'allOrders': NORMAL, 'ping': NORMAL, 'time': NORMAL,
+    'ticker/price': NORMAL,
+}
+
+_PATH = re.compile(r'/v\d+/(.+?)(?:\?|$)')
+
+
+class RateLimitShed(Exception):
+    """A low-priority request was dropped to keep weight in reserve for orders"""
+
+
+class RateLimitedClient:
+    """
+    Weight governor shared by every module that talks to the REST API.
+    - Wraps a python-binance Client and hooks its _request, so every HTTP call is
+      counted, including the pages inside get_historical_klines.
+    - A token bucket of `limit` weight per minute is spent before each request and
+      re-synced from X-MBX-USED-WEIGHT-1M after it.
+    - Priorities: order endpoints may use the whole budget; account/exchangeInfo leave
+      `order_reserve` of it untouched; market data leaves `data_reserve` and waits up to
+      `max_wait_s` for tokens before being shed with RateLimitShed.
+    - 429/418 responses close the gate until Retry-After for everything but orders.
+    - Headers are read from each thread's own HTTP response (the session is hooked too):
+      client.response is shared, and the gather pool makes calls concurrently.
+    - stats() exposes per-endpoint calls, weight, errors and latency percentiles; with
+      `metrics` every call is also observed into bot_exchange_seconds{endpoint}.
+    Calls made on another session (AsyncLiveBroker's orders) are budgeted with acquire()
+    and accounted with record(); their weight reaches used_weight on the next header re-sync.
+    """
+    def __init__(self, client, limit=1200, window_s=60.0, order_reserve=0.1, data_reserve=0.3,
+                 max_wait_s=5.0, latency_window=500, logger=None, metrics=None):
+        self.client = client
+        self.limit = limit
+        self.window_s = window_s
+        self.floors = {HIGH: 0.0, NORMAL: limit * order_reserve, LOW: limit * data_reserve}
+        self.max_wait_s = max_wait_s
+        self.latency_window = latency_window
+        self.logger = logger or logging.getLogger(__name__)
+        self.metrics = metrics        # optional core.metrics.Metrics: every call into bot_exchange_seconds
+        if metrics is not None:
+            metrics.histogram('bot_exchange_seconds', "REST call latency", ('endpoint',))
+
+        self.tokens = float(limit)
+        self.used_weight = 0          # last X-MBX-USED-WEIGHT-1M
+        self.blocked_until = 0.0      # monotonic; set by 429/418
+        self.shed = 0
+        self.delayed = 0
+        self.endpoints = {}           # "GET klines" -> counters + latency deque
+
+        self._refilled_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._local = threading.local()  # .response: this thread's last HTTP response
+        self._raw_request = client._request
+        client._request = self._request
+        session = getattr(client, 'session', None)
+        if session is not None:
+            self._raw_session_request = session.request
+            session.request = self._session_request
+
+    def _session_request(self, *args, **kwargs):
+        response = self._raw_session_request(*args, **kwargs)
+        self._local.response = response
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self._refilled_at) * self.limit / self.window_s)
+        self._refilled_at = now
+
+    @staticmethod
+    def _endpoint(uri):
+        m = _PATH.search(uri)
+        return m.group(1) if m else uri
+
+    def _acquire(self, endpoint, weight, priority):
+        floor = self.floors[priority]
+        deadline = time.monotonic() + self.max_wait_s
+        waited = False
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                blocked = priority != HIGH and now < self.blocked_until
+                if not blocked and self.tokens - weight >= floor:
+                    self.tokens -= weight
+                    if waited:
+                        self.delayed += 1
+                    return
+                if priority == LOW and (now >= deadline or self.blocked_until > deadline):
+                    self.shed += 1
+                    raise RateLimitShed(f"{endpoint} shed: {self.tokens:.0f}/{self.limit} weight left")
+                if blocked:
+                    wait = self.blocked_until - now
+                else:
+                    wait = (weight + floor - self.tokens) * self.window_s / self.limit
+                if priority == HIGH and wait > self.window_s:
+                    # A single order is never held longer than one window; let the exchange decide
+                    self.tokens -= weight
+                    return
+                waited = True
+                if priority == LOW:
+                    wait = min(wait, deadline - now)
+                self._cond.wait(max(0.01, wait))
+
+    def _observe(self, response, weight, now):
+        if response is None:
+            return
+        headers = getattr(response, 'headers', None) or {}
+        used = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('x-mbx-used-weight-1m')
+        status = getattr(response, 'status_code', 200)
+        with self._cond:
+            if used is not None:
+                self.used_weight = int(used)
+                self.tokens = min(self.tokens, float(self.limit - self.used_weight))
+            if status in (429, 418):
+                retry_after = float(headers.get('Retry-After') or (self.window_s if status == 429 else 120))
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                self.tokens = 0.0
+                self.logger.warning(f"REST rate limit hit ({status}); backing off {retry_after:.0f}s")
+            self._cond.notify_all()
+
+    def acquire(self, endpoint, params=None):
+        """Spend the weight of one call to `endpoint` (e.g. "order"), waiting as its priority allows"""
+        w = ENDPOINT_WEIGHTS.get(endpoint, 1)
+        weight = w(params or {}) if callable(w) else w
+        self._acquire(endpoint, weight, ENDPOINT_PRIORITY.get(endpoint, LOW))
+        return weight
+
+    def _request(self, method, uri, signed, force_params=False, **kwargs):
+        endpoint = self._endpoint(uri)
+        weight = self.acquire(endpoint, kwargs.get('data') or kwargs.get('params'))
+
+        t0 = time.perf_counter()
+        error = False
+        self._local.response = None
+        try:
+            return self._raw_request(method, uri, signed, force_params, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._observe(self._local.response, weight, time.monotonic())
+            self.record(f"{method.upper()} {endpoint}", weight, time.perf_counter() - t0, error)
+
+    def record(self, key, weight, elapsed, error=False):
+        """Count one call against `key` ("<VERB> <endpoint>") in the per-endpoint stats"""
+        with self._cond:
+            m = self.endpoints.get(key)
+            if m is None:
+                m = self.endpoints[key] = {'calls': 0, 'weight': 0, 'errors': 0,
+                                           'latency': deque(maxlen=self.latency_window)}
+            m['calls'] += 1
+            m['weight'] += weight
+            m['errors'] += error
+            m['latency'].append(elapsed)
+        if self.metrics is not None:
+            self.metrics.observe('bot_exchange_seconds', elapsed, key)
+            if error:
+                self.metrics.inc('bot_exchange_errors_total', key, help_="REST calls that raised",
+                                 labels=('endpoint',))
+
+    def stats(self):
+        """Budget state plus per-endpoint calls, weight, errors and p50/p99 latency"""
+        with self._cond:
+            self._refill(time.monotonic())
+            endpoints = {}
+            for key, m in self.endpoints.items():
+                lat = np.array(m['latency']) * 1000
+                endpoints[key] = {'calls': m['calls'], 'weight': m['weight'], 'errors': m['errors'],
+                                  'p50_ms': float(np.percentile(lat, 50)) if len(lat) else 0.0,
+                                  'p99_ms': float(np.percentile(lat, 99)) if len(lat) else 0.0}
+            return {'limit': self.limit, 'tokens': round(self.tokens, 1), 'used_weight_1m': self.used_weight,
+                    'blocked_s': max(0.0, round(self.blocked_until - time.monotonic(), 1)),
+                    'shed': self.shed, 'delayed': self.delayed, 'endpoints': endpoints}
@@ -0,0 +1,331 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+from binance.exceptions import BinanceAPIException
+
+from core.fake_exchange import api_error
+
+MAGIC = b'BREC\x01'
+# Frame header: wall-clock time of the response (epoch s), call latency (s), payload bytes.
+# Payload: zlib-compressed JSON [method, args, kwargs, result, error].
+FRAME = struct.Struct('<dfI')
+
+
+def _identity(method, args, kwargs):
+    """What a fallback match must agree on: method, symbol and interval (positional calls give them in that order)"""
+    positional = [a if isinstance(a, str) else None for a in args[:2]] + [None, None]
+    return method, kwargs.get('symbol', positional[0]), kwargs.get('interval', positional[1])
+
+
+def write_frame(f, ts, elapsed, method, args, kwargs, result=None, error=None):
+    payload = zlib.compress(json.dumps([method, list(args), kwargs, result, error], separators=(',', ':'),
+                                       default=str).encode())
+    f.write(FRAME.pack(ts, elapsed, len(payload)) + payload)
+    return FRAME.size + len(payload)
+
+
+def read_frames(path):
+    """Yield (ts, elapsed, method, args, kwargs, result, error); a torn last frame is ignored"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        while True:
+            head = f.read(FRAME.size)
+            if len(head) < FRAME.size:
+                return
+            ts, elapsed, size = FRAME.unpack(head)
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            method, args, kwargs, result, error = json.loads(zlib.decompress(payload))
+            yield ts, elapsed, method, args, kwargs, result, error
+
+
+def _error_record(e):
+    if isinstance(e, BinanceAPIException):
+        return {'code': e.code, 'msg': e.message, 'status': e.status_code}
+    return {'type': type(e).__name__, 'msg': str(e)}
+
+
+class RecordingClient:
+    """
+    Wraps a python-binance Client (or RateLimitedClient) and appends every public method
+    call it answers (klines, trades, tickers, account, order acks, errors) to a framed
+    binary log, with the response time and latency. Internal calls the client makes to
+    itself (e.g. get_historical_klines paging) are not recorded separately.
+    tap(name, handler) records websocket messages the same way, as method "ws:<name>".
+    """
+    def __init__(self, client, path, logger=None):
+        self.client = client
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self.frames = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, 'ab')
+        if fresh:
+            self._f.write(MAGIC)
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def recorded(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self.record(name, args, kwargs, time.perf_counter() - t0, error=_error_record(e))
+                raise
+            self.record(name, args, kwargs, time.perf_counter() - t0, result=result)
+            return result
+        return recorded
+
+    def record(self, method, args, kwargs, elapsed, result=None, error=None):
+        """Append one call; also used for calls made on another session (AsyncLiveBroker)"""
+        try:
+            with self._lock:
+                self.bytes += write_frame(self._f, time.time(), elapsed, method, args, kwargs, result, error)
+                self.frames += 1
+                self._f.flush()
+        except Exception as e:
+            self.logger.error(f"Error recording {method}: {e}")
+
+    def tap(self, name, handler):
+        """handler wrapped to record each message it is given"""
+        def recorded(msg):
+            self.record(f"ws:{name}", (msg,), {}, 0.0, result=None)
+            return handler(msg)
+        return recorded
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+    def stats(self):
+        return {'path': self.path, 'frames': self.frames, 'bytes': self.bytes}
+
+
+class ReplayExhausted(LookupError):
+    """The recording has no (more) responses for this call"""
+
+
+class ReplayClient:
+    """
+    Answers Client calls from a recording, so DataFeed, Account and LiveBroker run offline.
+    - A call gets the oldest unused response recorded with the same method and arguments;
+      failing that (new clientOrderIds, a moved startTime) the oldest unused one for the
+      same method, symbol and interval. clientOrderIds in order acks are rewritten to the
+      ones just sent.
+    - Recorded errors are raised again (BinanceAPIException with the recorded code).
+    - speed=1.0 replays on the recorded timeline (each response is held until its
+      recorded time, relative to the first call); speed=0 returns as fast as possible.
+    - clock() is the recorded time being replayed, for DataFeed, Engine and
+      BarScheduler(clock=...): trade windows and the risk day follow the recording.
+    - pump(handlers) delivers recorded websocket messages ("ws:<name>") in order.
+    """
+    def __init__(self, path, speed=0.0, logger=None):
+        self.path = path
+        self.speed = speed
+        self.logger = logger or logging.getLogger(__name__)
+        self.frames = list(read_frames(path))
+        self.used = np.zeros(len(self.frames), dtype=bool)
+        self.served = 0
+        self.misses = 0
+        self._exact = {}   # (method, args json) -> deque of frame indexes
+        self._by_method = {}  # websocket messages, "ws:<name>" -> frame indexes
+        self._by_identity = {}  # (method, symbol, interval) -> frame indexes
+        for i, (_, _, method, args, kwargs, _, _) in enumerate(self.frames):
+            if method.startswith('ws:'):
+                self._by_method.setdefault(method, deque()).append(i)
+                continue
+            self._exact.setdefault(self._key(method, args, kwargs), deque()).append(i)
+            self._by_identity.setdefault(_identity(method, args, kwargs), deque()).append(i)
+        self.t0 = self.frames[0][0] if self.frames else time.time()
+        self._now = self.t0
+        self._started = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(method, args, kwargs):
+        return method, json.dumps([list(args), kwargs], sort_keys=True, default=str)
+
+    def _take(self, queue):
+        while queue and self.used[queue[0]]:
+            queue.popleft()
+        if not queue:
+            return None
+        i = queue.popleft()
+        self.used[i] = True
+        return i
+
+    def clock(self):
+        return self._now
+
+    def _pace(self, ts):
+        if not self.speed:
+            return
+        if self._started is None:
+            self._started = time.monotonic()
+        delay = (ts - self.t0) / self.speed - (time.monotonic() - self._started)
+        if delay > 0:
+            time.sleep(delay)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def replayed(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        return replayed
+
+    def call(self, method, *args, **kwargs):
+        with self._lock:
+            i = self._take(self._exact.get(self._key(method, args, kwargs), deque()))
+            if i is None:
+                i = self._take(self._by_identity.get(_identity(method, args, kwargs), deque()))
+                self.misses += i is not None
+            if i is None:
+                raise ReplayExhausted(f"no recorded response left for {method}")
+            self.served += 1
+            ts, _, _, _, rec_kwargs, result, error = self.frames[i]
+            self._now = max(self._now, ts)
+        self._pace(ts)
+        if error is not None:
+            if 'code' in error:
+                raise api_error(error['code'], error['msg'], error.get('status', 400))
+            raise ConnectionError(f"{error.get('type')}: {error.get('msg')}")
+        return self._rewrite_ids(result, rec_kwargs, kwargs)
+
+    @staticmethod
+    def _rewrite_ids(result, recorded, sent):
+        """Recorded clientOrderIds in `result` replaced by the ones in this request"""
+        ids = {recorded[k]: sent[k] for k in recorded
+               if k.endswith('ClientOrderId') and sent.get(k) and recorded[k] and recorded[k] != sent[k]}
+        if not ids:
+            return result
+        text = json.dumps(result)
+        for old, new in ids.items():
+            text = text.replace(json.dumps(old), json.dumps(new))
+        return json.loads(text)
+
+    def pump(self, handlers, until=None):
+        """Deliver recorded websocket messages up to recorded time `until` to handlers[name]; returns the count"""
+        delivered = 0
+        for name, handler in handlers.items():
+            queue = self._by_method.get(f"ws:{name}", deque())
+            while queue:
+                with self._lock:
+                    while queue and self.used[queue[0]]:
+                        queue.popleft()
+                    if not queue or (until is not None and self.frames[queue[0]][0] > until):
+                        break
+                    i = queue.popleft()
+                    self.used[i] = True
+                    ts, msg = self.frames[i][0], self.frames[i][3][0]
+                    self._now = max(self._now, ts)
+                self._pace(ts)
+                handler(msg)
+                delivered += 1
+        return delivered
+
+    def remaining(self):
+        return int(len(self.frames) - self.used.sum())
+
+    def stats(self):
+        return {'frames': len(self.frames), 'served': self.served, 'fallback_matches': self.misses,
+                'remaining': self.remaining()}
+
+
+class _NullStorage:
+    """Storage stand-in for offline replays: accepts every log call, keeps nothing"""
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: []
+
+
+def summarize(path):
+    """method -> {'calls', 'errors', 'bytes'} plus the time span of a recording"""
+    methods, first, last = {}, None, None
+    with open(path, 'rb') as f:
+        f.read(len(MAGIC))
+        while True:
+            head = f.read(FRAME.size)
+            if len(head) < FRAME.size:
+                break
+            ts, _, size = FRAME.unpack(head)
+            payload = f.read(size)
+            if len(payload) < size:
+                break
+            method, _, _, _, error = json.loads(zlib.decompress(payload))
+            m = methods.setdefault(method, {'calls': 0, 'errors': 0, 'bytes': 0})
+            m['calls'] += 1
+            m['errors'] += error is not None
+            m['bytes'] += FRAME.size + size
+            first = ts if first is None else first
+            last = ts
+    return {'methods': methods, 'start': first, 'end': last, 'bytes': os.path.getsize(path)}
+
+
+def main(argv=None):
+    import yaml
+    from core.account import Account
+    from core.broker import LiveBroker
+    from core.datafeed import DataFeed
+    from core.engine import Engine
+
+    parser = argparse.ArgumentParser(description="Inspect or replay a recorded market-data/order log")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_info = sub.add_parser("info", help="calls, errors and bytes per method")
+    p_info.add_argument("path")
+    p_replay = sub.add_parser("replay", help="run Engine.scan over a recording until it is exhausted")
+    p_replay.add_argument("path")
+    p_replay.add_argument("--config", default="settings.yaml")
+    p_replay.add_argument("--speed", type=float, default=0.0, help="1 = recorded pace, 0 = as fast as possible")
+    p_replay.add_argument("--max-scans", type=int)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "info":
+        print(json.dumps(summarize(args.path), indent=2))
+        return
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger("replay")
+    with open(args.config, 'r') as f:
+        params = yaml.safe_load(f)
+    client = ReplayClient(args.path, speed=args.speed, logger=logger)
+    account = Account(client, logger)
+    datafeed = DataFeed(client, logger, account=account,
+                        whale_windows_min=params['whales'].get('windows_min', [params['whales']['window_min']]),
+                        clock=client.clock)
+    broker = LiveBroker(client, account.precision_map(), native_oco=params.get('orders', {}).get('native_oco', 'auto'),
+                        filters=account.filters())
+    engine = Engine(broker, datafeed, account, params, _NullStorage(), logger, clock=client.clock)
+
+    scans = []
+    while client.remaining() and (args.max_scans is None or len(scans) < args.max_scans):
+        account.invalidate()
+        served = client.served
+        t0 = time.perf_counter()
+        errors = engine.scan(params['symbols'])
+        scans.append(time.perf_counter() - t0)
+        if errors == len(params['symbols']) or client.served == served:
+            break  # nothing left this scan can use
+    ms = np.array(scans) * 1000
+    print(json.dumps({'scans': len(ms), 'scan_p50_ms': float(np.percentile(ms, 50)) if len(ms) else 0.0,
+                      'scan_p99_ms': float(np.percentile(ms, 99)) if len(ms) else 0.0,
+                      'total_s': round(float(ms.sum()) / 1000, 3), **client.stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import logging
+import threading
+from urllib.parse import parse_qs, urlparse
+
+
+class ReplayServer:
+    """
+    Local stand-in for the exchange's combined-stream websocket.
+    Replays recorded {'stream': ..., 'data': ...} messages, filtered to the streams in the
+    client's ?streams= query, so MarketStream can be exercised offline.
+    - The messages are one live timeline: a (re)connecting client picks up at `position`,
+      not at the start, as on the real stream.
+    - interval: seconds between messages (0 = as fast as possible)
+    - drop_after: close each connection after this many messages to exercise reconnects
+    - gap: messages that go by unseen between a drop and the next connection, which the
+      client has to backfill over REST
+    """
+    def __init__(self, messages, host="127.0.0.1", port=0, interval=0.0, drop_after=None, gap=0, logger=None):
+        self.messages = list(messages)
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.drop_after = drop_after
+        self.gap = gap
+        self.logger = logger or logging.getLogger(__name__)
+        self.connections = 0
+        self.position = 0  # index of the next message on the timeline
+
+        self._ready = threading.Event()
+        self._loop = None
+        self._stop = None
+        self._thread = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Messages from a JSONL file, one combined-stream message per line"""
+        with open(path, "r") as f:
+            return cls([json.loads(line) for line in f if line.strip()], **kwargs)
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def _handler(self, ws, path=None):
+        # Legacy servers (websockets <= 12, the pinned version) keep it on ws.path; newer ones on ws.request
+        path = path or getattr(ws, 'path', None) or ws.request.path
+        wanted = set()
+        for streams in parse_qs(urlparse(path).query).get("streams", []):
+            wanted.update(streams.split("/"))
+
+        self.connections += 1
+        sent = 0
+        while self.position < len(self.messages):
+            msg = self.messages[self.position]
+            self.position += 1
+            if wanted and msg.get("stream") not in wanted:
+                continue
+            await ws.send(json.dumps(msg))
+            sent += 1
+            if self.drop_after is not None and sent >= self.drop_after:
+                # The gap goes by as of the drop, before the client can reconnect and backfill
+                self.position = min(len(self.messages), self.position + self.gap)
+                await ws.close()
+                return
+            if self.interval:
+                await asyncio.sleep(self.interval)
+        await self._stop.wait()  # keep the socket open like the real stream
+
+    async def _serve(self):
+        import websockets
+
+        self._stop = asyncio.Event()
+        async with websockets.serve(self._handler, self.host, self.port) as server:
+            self.port = next(iter(server.sockets)).getsockname()[1]
+            self._ready.set()
+            await self._stop.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="replay-server", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded market-stream messages over a local websocket")
+    parser.add_argument("path", help="JSONL file of combined-stream messages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument("--interval", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = ReplayServer.from_file(args.path, host=args.host, port=args.port, interval=args.interval).start()
+    server.logger.info(f"Replaying {len(server.messages)} messages on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,11 +18,12 @@ class RiskEngine:
         self.cooldown_until = 0
         self.daily_realized = 0.0
 
-    def record_trade_pnl(self, pnl):
+    def record_trade_pnl(self, pnl, now_ts=None):
         self.daily_realized += pnl
         self.loss_streak = self.loss_streak + 1 if pnl < 0 else 0
         if self.loss_streak >= self.params['limits']['max_consecutive_losses']:
-            self.cooldown_until = time.time() + 60 * self.params['cooldown_minutes_after_loss_streak']
+            now_ts = time.time() if now_ts is None else now_ts  # backtests pass the simulated clock
+            self.cooldown_until = now_ts + 60 * self.params['cooldown_minutes_after_loss_streak']
 
     def can_trade_now(self, now_ts, live_equity):
         if self.day_start_equity is None:
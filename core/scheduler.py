@@ -0,0 +1,87 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from core.datafeed import INTERVAL_MS
+
+
+class BarScheduler:
+    """
+    Wakes on bar-close boundaries (UTC, exchange-aligned) for a set of intervals.
+    - wait() blocks until the next boundary of any interval plus close_delay_s (time
+      for the exchange to publish the closed bar) and a random 0..jitter_s spread, then
+      returns the intervals whose bar closed since they last fired; [] only on stop().
+    - After a stall (GC pause, slow scan) boundaries already passed fire immediately,
+      once per interval however many were missed, so a late scan is never skipped and
+      never run twice for the same bar. Missed closes are counted.
+    - Wake lateness against the target is kept for stats().
+    """
+    def __init__(self, intervals, close_delay_s=1.0, jitter_s=0.0, clock=time.time, logger=None,
+                 latency_window=500):
+        self.intervals = list(dict.fromkeys(intervals))
+        self.close_delay_s = close_delay_s
+        self.jitter_s = jitter_s
+        self.clock = clock
+        self.logger = logger or logging.getLogger(__name__)
+        self.missed = 0
+        self.lateness = deque(maxlen=latency_window)
+
+        now_ms = int((self.clock() - close_delay_s) * 1000)
+        # Last close already handled per interval: start from the most recent boundary so the
+        # first wait() lands on the next close instead of firing at startup
+        self.last_close = {i: now_ms - now_ms % INTERVAL_MS[i] for i in self.intervals}
+        self._stop = threading.Event()
+
+    def next_close(self, interval):
+        """Epoch ms of the next close of `interval` after the last one handled"""
+        return self.last_close[interval] + INTERVAL_MS[interval]
+
+    def due(self, now_ms=None):
+        """Intervals with a close not yet handled at now_ms (minus close delay); marks them handled"""
+        now_ms = int(self.clock() * 1000) if now_ms is None else now_ms
+        ready_ms = now_ms - int(self.close_delay_s * 1000)
+        closed = []
+        for interval in self.intervals:
+            step = INTERVAL_MS[interval]
+            latest = ready_ms - ready_ms % step
+            if latest > self.last_close[interval]:
+                skipped = (latest - self.last_close[interval]) // step - 1
+                if skipped > 0:
+                    self.missed += skipped
+                    self.logger.warning(f"Scheduler fell behind: {skipped} {interval} close(s) coalesced")
+                self.last_close[interval] = latest
+                closed.append(interval)
+        return closed
+
+    def wait(self):
+        """Block until at least one interval closes; returns those intervals ([] if stopped)"""
+        while not self._stop.is_set():
+            closed = self.due()
+            if closed:
+                return closed
+            target_s = min(self.next_close(i) for i in self.intervals) / 1000 + self.close_delay_s
+            if self.jitter_s:
+                target_s += random.uniform(0, self.jitter_s)
+            # Sleep in one go, then re-check: Event.wait may return early or late
+            delay = target_s - self.clock()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            closed = self.due()
+            if closed:
+                self.lateness.append(max(0.0, self.clock() - target_s))
+                return closed
+        return []
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        lat = np.array(self.lateness) * 1000
+        return {'missed': self.missed, 'wakes': len(lat),
+                'late_p50_ms': float(np.percentile(lat, 50)) if len(lat) else 0.0,
+                'late_p99_ms': float(np.percentile(lat, 99)) if len(lat) else 0.0,
+                'next': {i: self.next_close(i) for i in self.intervals}}
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from collections import deque
 
 def ema(series, length):
     return series.ewm(span=length, adjust=False).mean()
@@ -16,20 +17,23 @@ def compute_indicators(df, macd_fast=12, macd_slow=26, macd_signal=9, ema_len=20
     volz      = (df['volume'] - df['volume'].rolling(20).mean()) / (df['volume'].rolling(20).std() + 1e-9)
     return macd_line, macd_sig, ema200, atrv, volz
 
-def generate_signal(df, whale_flag, params):
-    macd_fast = params['macd']['fast']; macd_slow = params['macd']['slow']; macd_signal = params['macd']['signal']
-    ema_len = params['ema']['len']; atr_len = params['atr_len']
-    macd_line, macd_sig, ema200, atrv, volz = compute_indicators(df, macd_fast, macd_slow, macd_signal, ema_len, atr_len)
+def entry_rule(close, macd_line, macd_sig, ema_long, atr_value, volz, whale_flag):
+    """The entry conditions; scalars for the latest bar, or aligned arrays for a whole series (backtest)"""
+    with np.errstate(invalid='ignore'):
+        cond_trend = (macd_line > macd_sig) & (close > ema_long)
+        cond_vol   = (volz >= 2.0) | whale_flag
+        return cond_trend & cond_vol & (atr_value > 0)  # no stop distance without a finite ATR
 
-    c = df['close'].iloc[-1]
-    cond_trend = (macd_line.iloc[-1] > macd_sig.iloc[-1]) and (c > ema200.iloc[-1])
-    cond_vol   = (volz.iloc[-1] >= 2.0) or whale_flag
+def exit_levels(entry, atr_value, params):
+    """(stop, take-profit) for an entry at `entry`"""
+    return entry - params['exits']['atr_stop'] * atr_value, entry + params['exits']['atr_tp'] * atr_value
 
-    if cond_trend and cond_vol:
-        a = float(atrv.iloc[-1])
-        entry = float(c)
-        stop  = float(entry - params['exits']['atr_stop'] * a)
-        tp    = float(entry + params['exits']['atr_tp'] * a)
+def signal_from_indicators(close, macd_line, macd_sig, ema_long, atr_value, volz, whale_flag, params):
+    """Entry rules on the latest indicator values; shared by every indicator path"""
+    if entry_rule(close, macd_line, macd_sig, ema_long, atr_value, volz, whale_flag):
+        a = float(atr_value)
+        entry = float(close)
+        stop, tp = exit_levels(entry, a, params)
         return {
             "symbol_side": "BUY",
             "entry": entry,
@@ -40,3 +44,209 @@ def generate_signal(df, whale_flag, params):
         }
     return None
 
+def generate_signal(df, whale_flag, params):
+    macd_fast = params['macd']['fast']; macd_slow = params['macd']['slow']; macd_signal = params['macd']['signal']
+    ema_len = params['ema']['len']; atr_len = params['atr_len']
+    macd_line, macd_sig, ema200, atrv, volz = compute_indicators(df, macd_fast, macd_slow, macd_signal, ema_len, atr_len)
+
+    return signal_from_indicators(df['close'].iloc[-1], macd_line.iloc[-1], macd_sig.iloc[-1], ema200.iloc[-1],
+                                  atrv.iloc[-1], volz.iloc[-1], whale_flag, params)
+
+
+
+# --- Vectorized multi-symbol path: arrays are (symbols, bars), left-padded with NaN ---
+
+def ema_2d(x, length):
+    """ema() along axis 1 for every row at once; each row starts at its first non-NaN value"""
+    a = 2.0 / (length + 1)
+    out = np.empty_like(x)
+    prev = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        xt = x[:, t]
+        prev = np.where(np.isnan(prev), xt, prev + a * (xt - prev))
+        out[:, t] = prev
+    return out
+
+def rolling_2d(x, length, fn, **kwargs):
+    """Trailing-window reduction along axis 1; NaN until a full window is available (pandas rolling)"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= length:
+        windows = np.lib.stride_tricks.sliding_window_view(x, length, axis=1)
+        out[:, length - 1:] = fn(windows, axis=-1, **kwargs)
+    return out
+
+def compute_indicators_2d(close, high, low, volume, macd_fast=12, macd_slow=26, macd_signal=9, ema_len=200, atr_len=14):
+    """compute_indicators over stacked (symbols, bars) arrays in one pass"""
+    macd_line = ema_2d(close, macd_fast) - ema_2d(close, macd_slow)
+    macd_sig  = ema_2d(macd_line, macd_signal)
+    ema_long  = ema_2d(close, ema_len)
+
+    prev = np.empty_like(close)
+    prev[:, 0] = np.nan
+    prev[:, 1:] = close[:, :-1]
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev), np.abs(low - prev)))
+    atrv = rolling_2d(tr, atr_len, np.mean)
+
+    volz = (volume - rolling_2d(volume, 20, np.mean)) / (rolling_2d(volume, 20, np.std, ddof=1) + 1e-9)
+    return macd_line, macd_sig, ema_long, atrv, volz
+
+def stack_frames(frames, columns=('close', 'high', 'low', 'volume')):
+    """{symbol: kline DataFrame} -> (symbols, {column: (symbols, bars) array}) right-aligned on the last bar"""
+    symbols = [s for s, df in frames.items() if df is not None and len(df)]
+    width = max((len(frames[s]) for s in symbols), default=0)
+    arrays = {c: np.full((len(symbols), width), np.nan) for c in columns}
+    for i, s in enumerate(symbols):
+        df = frames[s]
+        for c in columns:
+            arrays[c][i, width - len(df):] = df[c].to_numpy(dtype=float)
+    return symbols, arrays
+
+def generate_signals_batch(frames, whale_flags, params):
+    """
+    generate_signal for many symbols with one vectorized indicator pass.
+    frames: {symbol: kline DataFrame}; whale_flags: {symbol: bool}. Returns {symbol: signal or None}.
+    """
+    symbols, a = stack_frames(frames)
+    results = {s: None for s in frames}
+    if not symbols:
+        return results
+
+    macd_line, macd_sig, ema_long, atrv, volz = compute_indicators_2d(
+        a['close'], a['high'], a['low'], a['volume'],
+        params['macd']['fast'], params['macd']['slow'], params['macd']['signal'],
+        params['ema']['len'], params['atr_len'])
+
+    for i, s in enumerate(symbols):
+        results[s] = signal_from_indicators(a['close'][i, -1], macd_line[i, -1], macd_sig[i, -1], ema_long[i, -1],
+                                            atrv[i, -1], volz[i, -1], whale_flags.get(s, False), params)
+    return results
+
+class StreamingIndicators:
+    """
+    O(1)-per-bar version of compute_indicators.
+    Holds the EMA recursions, a running-sum ATR window and a sliding Welford
+    mean/variance for volume, so each new bar costs a handful of float ops.
+    update() commits a closed bar; peek() evaluates a still-forming bar without
+    committing it. Values match compute_indicators over the same history.
+    """
+    def __init__(self, macd_fast=12, macd_slow=26, macd_signal=9, ema_len=200, atr_len=14, vol_len=20):
+        self.a_fast = 2.0 / (macd_fast + 1)
+        self.a_slow = 2.0 / (macd_slow + 1)
+        self.a_sig = 2.0 / (macd_signal + 1)
+        self.a_long = 2.0 / (ema_len + 1)
+        self.atr_len = atr_len
+        self.vol_len = vol_len
+
+        self.ema_fast = self.ema_slow = self.macd_sig = self.ema_long = None
+        self.prev_close = None
+        self.tr_window = deque(maxlen=atr_len)
+        self.tr_sum = 0.0
+        self.vol_window = deque(maxlen=vol_len)
+        self.vol_mean = 0.0
+        self.vol_m2 = 0.0
+        self.last_time = None  # open time of the last committed bar, set by callers
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(params['macd']['fast'], params['macd']['slow'], params['macd']['signal'],
+                   params['ema']['len'], params['atr_len'])
+
+    @classmethod
+    def from_history(cls, df, params):
+        """Warm-start from a history DataFrame (all rows treated as closed bars)"""
+        st = cls.from_params(params)
+        if len(df) == 0:
+            return st
+        macd_line, macd_sig, ema_long, _, _ = compute_indicators(
+            df, params['macd']['fast'], params['macd']['slow'], params['macd']['signal'],
+            params['ema']['len'], params['atr_len'])
+        ema_fast = ema(df['close'], params['macd']['fast'])
+
+        st.ema_fast = float(ema_fast.iloc[-1])
+        st.ema_slow = float(ema_fast.iloc[-1] - macd_line.iloc[-1])
+        st.macd_sig = float(macd_sig.iloc[-1])
+        st.ema_long = float(ema_long.iloc[-1])
+        st.prev_close = float(df['close'].iloc[-1])
+
+        high = df['high'].to_numpy(dtype=float); low = df['low'].to_numpy(dtype=float)
+        close = df['close'].to_numpy(dtype=float)
+        tail = slice(max(1, len(df) - st.atr_len), len(df))
+        prev = close[tail.start - 1:tail.stop - 1]
+        tr = np.maximum(high[tail] - low[tail], np.maximum(np.abs(high[tail] - prev), np.abs(low[tail] - prev)))
+        st.tr_window.extend(tr.tolist())
+        st.tr_sum = float(tr.sum())
+
+        vols = df['volume'].to_numpy(dtype=float)[-st.vol_len:]
+        st.vol_window.extend(vols.tolist())
+        st.vol_mean = float(vols.mean())
+        st.vol_m2 = float(((vols - st.vol_mean) ** 2).sum())
+        return st
+
+    def _step(self, high, low, close, volume):
+        """Next state and indicator values for one bar, without mutating self"""
+        if self.ema_fast is None:
+            ema_fast = ema_slow = ema_long = close
+            macd_line = 0.0
+            macd_sig = 0.0
+        else:
+            ema_fast = self.ema_fast + self.a_fast * (close - self.ema_fast)
+            ema_slow = self.ema_slow + self.a_slow * (close - self.ema_slow)
+            ema_long = self.ema_long + self.a_long * (close - self.ema_long)
+            macd_line = ema_fast - ema_slow
+            macd_sig = self.macd_sig + self.a_sig * (macd_line - self.macd_sig)
+
+        # ATR: simple mean of the last atr_len true ranges (first bar has none)
+        tr_sum = self.tr_sum
+        n_tr = len(self.tr_window)
+        tr = None
+        if self.prev_close is not None:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+            tr_sum += tr
+            if n_tr == self.atr_len:
+                tr_sum -= self.tr_window[0]
+            else:
+                n_tr += 1
+        atr_value = tr_sum / self.atr_len if n_tr == self.atr_len else float('nan')
+
+        # Volume z-score: sliding-window Welford (sample std, ddof=1)
+        n, mean, m2 = len(self.vol_window), self.vol_mean, self.vol_m2
+        if n == self.vol_len:
+            old = self.vol_window[0]
+            n -= 1
+            if n:
+                delta = old - mean
+                mean -= delta / n
+                m2 -= delta * (old - mean)
+            else:
+                mean, m2 = 0.0, 0.0
+        n += 1
+        delta = volume - mean
+        mean += delta / n
+        m2 += delta * (volume - mean)
+        if n == self.vol_len:
+            std = (max(m2, 0.0) / (n - 1)) ** 0.5
+            volz = (volume - mean) / (std + 1e-9)
+        else:
+            volz = float('nan')
+
+        state = (ema_fast, ema_slow, macd_sig, ema_long, close, tr, tr_sum, volume, mean, m2)
+        return state, (macd_line, macd_sig, ema_long, atr_value, volz)
+
+    def update(self, high, low, close, volume):
+        """Commit a closed bar; returns (macd_line, macd_sig, ema_long, atr, volz)"""
+        state, values = self._step(high, low, close, volume)
+        (self.ema_fast, self.ema_slow, self.macd_sig, self.ema_long, self.prev_close,
+         tr, self.tr_sum, volume, self.vol_mean, self.vol_m2) = state
+        if tr is not None:
+            self.tr_window.append(tr)
+        self.vol_window.append(volume)
+        return values
+
+    def peek(self, high, low, close, volume):
+        """Indicator values if this (forming) bar closed now; state is unchanged"""
+        return self._step(high, low, close, volume)[1]
+
+    def signal(self, high, low, close, volume, whale_flag, params):
+        """generate_signal for a forming bar on top of the committed history"""
+        macd_line, macd_sig, ema_long, atr_value, volz = self.peek(high, low, close, volume)
+        return signal_from_indicators(close, macd_line, macd_sig, ema_long, atr_value, volz, whale_flag, params)
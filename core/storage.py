@@ -1,20 +1,561 @@
+import argparse
+import atexit
+import fcntl
+import glob
 import json
 import os
+import shutil
+import threading
+import time
 from datetime import datetime
 import logging
 
+import numpy as np
+
+
+# Sidecar index entry, one per record: where the line lives, when it was written, which symbol
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('ts', '<i8'), ('symbol', 'S16')])
+
+
+def _to_ms(value):
+    """datetime / epoch seconds / ISO string -> epoch milliseconds"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(float(value) * 1000)
+
+
+class SegmentLog:
+    """
+    Append-only, line-delimited JSON log.
+    - One record per line, so a write costs the same no matter how much history exists.
+    - Segments rotate when they exceed max_segment_bytes or the day changes.
+    - fsync is batched: every fsync_every records or fsync_interval seconds, whichever comes first.
+    - Each segment has a fixed-width .idx sidecar (offset, length, ts, symbol) so recent-N,
+      time-range and per-symbol reads touch only the index and the matching lines.
+    """
+    def __init__(self, directory, name, max_segment_bytes=64 * 1024 * 1024,
+                 fsync_every=50, fsync_interval=2.0, logger=None):
+        self.directory = directory
+        self.name = name
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._fh = None
+        self._idx_fh = None
+        self._path = None
+        self._day = None
+        self._size = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._index_cache = {}  # closed segment path -> (data size, index array)
+        self._open_index = np.zeros(0, dtype=INDEX_DTYPE)  # in-memory index of the open segment
+        self._open_count = 0
+        lock = self._compaction_lock(blocking=False)
+        if lock is not None:  # otherwise a compaction is running and settles its own journal
+            try:
+                self._finish_compactions()
+            finally:
+                lock.close()
+
+    def segments(self):
+        """Segment paths, oldest first (names sort chronologically)"""
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.name}-*.jsonl")))
+
+    def _segment_path(self, day, seq):
+        return os.path.join(self.directory, f"{self.name}-{day}-{seq:04d}.jsonl")
+
+    @staticmethod
+    def _index_path(path):
+        return path[:-len(".jsonl")] + ".idx"
+
+    @staticmethod
+    def _segment_key(path):
+        # orders-20240131-0003.jsonl -> ("20240131", 3)
+        stem = os.path.basename(path)[:-len(".jsonl")]
+        day, seq = stem.rsplit("-", 2)[-2:]
+        return day, int(seq)
+
+    def _open_segment(self, day, seq=None):
+        """Open segment `seq` of `day`; by default resume the newest one if it has room"""
+        self._close_segment()
+
+        if seq is None:
+            day_segments = [p for p in self.segments() if self._segment_key(p)[0] == day]
+            seq = 0
+            if day_segments:
+                last = day_segments[-1]
+                seq = self._segment_key(last)[1]
+                if os.path.getsize(last) >= self.max_segment_bytes:
+                    seq += 1
+                else:
+                    self._repair_tail(last)
+
+        path = self._segment_path(day, seq)
+        # Loading also rebuilds the sidecar if a crash left it behind
+        existing = self._load_index(path) if os.path.exists(path) else np.zeros(0, dtype=INDEX_DTYPE)
+        self._index_cache.pop(path, None)
+        self._open_index = np.zeros(max(1024, 2 * len(existing)), dtype=INDEX_DTYPE)
+        self._open_index[:len(existing)] = existing
+        self._open_count = len(existing)
+
+        self._path = path
+        self._fh = open(self._path, "ab")
+        self._idx_fh = open(self._index_path(self._path), "ab")
+        self._size = self._fh.tell()
+        self._day = day
+
+    @staticmethod
+    def _repair_tail(path):
+        """Drop a torn final line left behind by a crash mid-write"""
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = end
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                nl = chunk.rfind(b"\n")
+                if nl != -1:
+                    f.truncate(pos + nl + 1)
+                    return
+            f.truncate(0)
+
+    def _close_segment(self):
+        for fh in (self._fh, self._idx_fh):
+            if fh is not None:
+                fh.flush()
+                os.fsync(fh.fileno())
+                fh.close()
+        self._fh = None
+        self._idx_fh = None
+        self._path = None
+        self._day = None
+        self._size = 0
+        self._unsynced = 0
+
+    @staticmethod
+    def _index_entry(record, offset, length):
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry['offset'] = offset
+        entry['length'] = length
+        ts = record.get('timestamp') if isinstance(record, dict) else None
+        try:
+            entry['ts'] = _to_ms(ts) if ts else int(time.time() * 1000)
+        except (TypeError, ValueError):
+            entry['ts'] = int(time.time() * 1000)
+        symbol = record.get('symbol') if isinstance(record, dict) else None
+        entry['symbol'] = str(symbol or "").encode("ascii", "ignore")[:16]
+        return entry
+
+    def append(self, record, day=None):
+        """Append one record; `day` (YYYYMMDD) defaults to today"""
+        line = (json.dumps(record, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+        day = day or datetime.now().strftime("%Y%m%d")
+
+        with self._lock:
+            if self._fh is None or day != self._day:
+                self._open_segment(day)
+            elif self._size >= self.max_segment_bytes:
+                self._open_segment(day, self._segment_key(self._path)[1] + 1)
+
+            entry = self._index_entry(record, self._size, len(line))
+            self._fh.write(line)
+            self._fh.flush()  # visible to readers immediately; durability is batched below
+            self._idx_fh.write(entry.tobytes())
+            self._idx_fh.flush()
+            if self._open_count == len(self._open_index):
+                grown = np.zeros(2 * len(self._open_index), dtype=INDEX_DTYPE)
+                grown[:self._open_count] = self._open_index[:self._open_count]
+                self._open_index = grown
+            self._open_index[self._open_count] = entry[0]
+            self._open_count += 1
+            self._size += len(line)
+            self._unsynced += 1
+
+            now = time.monotonic()
+            if self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                os.fsync(self._fh.fileno())
+                os.fsync(self._idx_fh.fileno())
+                self._unsynced = 0
+                self._last_sync = now
+
+    def sync(self):
+        """Force pending writes to disk"""
+        with self._lock:
+            if self._fh is not None and self._unsynced:
+                for fh in (self._fh, self._idx_fh):
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _build_index(self, path):
+        """Rebuild a segment's sidecar index from its data (after a crash or compaction)"""
+        entries = []
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None  # torn or partial line: keep it out of the index
+                if record is not None:
+                    entries.append(self._index_entry(record, offset, len(line)))
+                offset += len(line)
+        index = np.concatenate(entries) if entries else np.zeros(0, dtype=INDEX_DTYPE)
+        tmp = self._index_path(path) + ".tmp"
+        index.tofile(tmp)
+        os.replace(tmp, self._index_path(path))
+        return index
+
+    def _load_index(self, path):
+        """Index array for a segment, rebuilt if it does not cover the data file"""
+        with self._lock:
+            return self._load_index_locked(path)
+
+    def _load_index_locked(self, path):
+        if path == self._path:
+            return self._open_index[:self._open_count]
+
+        size = os.path.getsize(path)
+        cached = self._index_cache.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+
+        idx_path = self._index_path(path)
+        index = None
+        if os.path.exists(idx_path):
+            index = np.fromfile(idx_path, dtype=INDEX_DTYPE)
+            covered = int(index['offset'][-1]) + int(index['length'][-1]) if len(index) else 0
+            if covered != size:
+                index = None
+        if index is None:
+            self.logger.warning(f"Rebuilding index for {path}")
+            index = self._build_index(path)
+
+        self._index_cache[path] = (size, index)
+        return index
+
+    def _read_lines(self, path, entries):
+        """Decode the records at the given index entries (ascending offsets)"""
+        if len(entries) == 0:
+            return []
+        records = []
+        with open(path, "rb") as f:
+            start = int(entries['offset'][0])
+            end = int(entries['offset'][-1]) + int(entries['length'][-1])
+            if end - start <= 4 * int(entries['length'].sum()):
+                # Mostly contiguous: one read, slice lines out of the buffer
+                f.seek(start)
+                buf = f.read(end - start)
+                for off, n in zip(entries['offset'], entries['length']):
+                    off = int(off) - start
+                    records.append(json.loads(buf[off:off + int(n)]))
+            else:
+                for off, n in zip(entries['offset'], entries['length']):
+                    f.seek(int(off))
+                    records.append(json.loads(f.read(int(n))))
+        return records
+
+    def _snapshot(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                self._idx_fh.flush()
+            return self.segments()
+
+    def tail(self, limit, symbol=None):
+        """Last `limit` records (optionally for one symbol), oldest first; O(limit) reads"""
+        if limit <= 0:
+            return []
+        symbol_b = symbol.encode("ascii") if symbol else None
+
+        out = []
+        for path in reversed(self._snapshot()):
+            index = self._load_index(path)
+            need = limit - len(out)
+            if symbol_b is None:
+                entries = index[-need:]
+            else:
+                # Walk the index backwards in chunks so a recent-N lookup stays O(N)
+                found, stop, chunk = [], len(index), 4 * need
+                while stop > 0 and sum(len(f) for f in found) < need:
+                    part = index[max(0, stop - chunk):stop]
+                    found.insert(0, part[part['symbol'] == symbol_b])
+                    stop -= chunk
+                    chunk *= 2
+                entries = np.concatenate(found)[-need:] if found else index[:0]
+            out = self._read_lines(path, entries) + out
+            if len(out) >= limit:
+                break
+        return out
+
+    def query(self, start=None, end=None, symbol=None, limit=None):
+        """
+        Records with start <= timestamp < end (datetime, epoch seconds or ISO string),
+        optionally for one symbol, oldest first. With `limit`, the newest `limit` matches.
+        Segments outside the day range are skipped by name; the rest are filtered on the index.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        first_day = datetime.fromtimestamp(start_ms / 1000).strftime("%Y%m%d") if start_ms is not None else None
+        last_day = datetime.fromtimestamp(end_ms / 1000).strftime("%Y%m%d") if end_ms is not None else None
+        symbol_b = symbol.encode("ascii") if symbol else None
+
+        out = []
+        for path in reversed(self._snapshot()):
+            day = self._segment_key(path)[0]
+            if last_day is not None and day > last_day:
+                continue
+            if first_day is not None and day < first_day:
+                break
+
+            index = self._load_index(path)
+            mask = np.ones(len(index), dtype=bool)
+            if start_ms is not None:
+                mask &= index['ts'] >= start_ms
+            if end_ms is not None:
+                mask &= index['ts'] < end_ms
+            if symbol_b is not None:
+                mask &= index['symbol'] == symbol_b
+            entries = index[mask]
+            if limit is not None:
+                entries = entries[-(limit - len(out)):]
+            out = self._read_lines(path, entries) + out
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def __len__(self):
+        return sum(len(self._load_index(p)) for p in self._snapshot())
+
+    def __iter__(self):
+        for path in self._snapshot():
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # torn or partial line
+
+    def _journal_path(self, day):
+        return os.path.join(self.directory, f"{self.name}-{day}.compacting")
+
+    def _compaction_lock(self, blocking=True):
+        """Exclusive lock held by whichever process compacts or recovers this log; None if busy"""
+        fh = open(os.path.join(self.directory, f".{self.name}.compact.lock"), "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            fh.close()
+            return None
+        return fh
+
+    def _finish_compactions(self):
+        """
+        Settle compactions a crash interrupted: if every merged segment landed the sources go,
+        otherwise the merged ones do. Either way each record is left exactly once.
+        """
+        for journal in glob.glob(os.path.join(self.directory, f"{self.name}-*.compacting")):
+            with open(journal, "r") as f:
+                entries = [line.rstrip("\n").split(" ", 1) for line in f if line.strip()]
+            sources = [path for kind, path in entries if kind == "src"]
+            outputs = [path for kind, path in entries if kind == "out"]
+            landed = all(os.path.exists(path) for path in outputs)
+            for path in (sources if landed else outputs):
+                for p in (path, self._index_path(path), path + ".compact"):
+                    if os.path.exists(p):
+                        os.remove(p)
+                self._index_cache.pop(path, None)
+            if not landed:
+                self.logger.warning(f"Rolled back an interrupted compaction of {journal}")
+            os.remove(journal)
+        # Merged segments a crash left before their journal was written
+        for tmp in glob.glob(os.path.join(self.directory, f"{self.name}-*.jsonl.compact")):
+            os.remove(tmp)
+
+    def compact(self):
+        """
+        Merge each closed day's segments into as few segments as max_segment_bytes allows.
+        Today and the segment open for writing are never touched: the bot may be appending
+        to them from another process. Merged segments take new sequence numbers, and a
+        journal names sources and outputs before anything is renamed, so a crash at any
+        point settles to either the old or the new segments (see _finish_compactions).
+        """
+        lock = self._compaction_lock()
+        try:
+            with self._lock:
+                self._finish_compactions()
+                return self._compact(datetime.now().strftime("%Y%m%d"))
+        finally:
+            lock.close()
+
+    def _compact(self, today):
+        by_day = {}
+        for path in self.segments():
+            if path == self._path:
+                continue
+            by_day.setdefault(self._segment_key(path)[0], []).append(path)
+
+        merged = 0
+        for day, paths in by_day.items():
+            if len(paths) < 2 or day == self._day or day >= today:
+                continue
+
+            seq = self._segment_key(paths[-1])[1] + 1
+            tmp_paths = []
+            out, out_size = None, 0
+            for path in paths:
+                with open(path, "rb") as src:
+                    for line in src:
+                        if not line.endswith(b"\n"):
+                            continue
+                        if out is None or out_size >= self.max_segment_bytes:
+                            if out is not None:
+                                out.flush()
+                                os.fsync(out.fileno())
+                                out.close()
+                            tmp = self._segment_path(day, seq + len(tmp_paths)) + ".compact"
+                            tmp_paths.append(tmp)
+                            out, out_size = open(tmp, "wb"), 0
+                        out.write(line)
+                        out_size += len(line)
+            if out is not None:
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+
+            outputs = [tmp[:-len(".compact")] for tmp in tmp_paths]
+            journal = self._journal_path(day)
+            with open(journal + ".tmp", "w") as f:
+                f.write("".join(f"src {p}\n" for p in paths) + "".join(f"out {p}\n" for p in outputs))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(journal + ".tmp", journal)
+            self._fsync_dir()
+            for tmp, path in zip(tmp_paths, outputs):
+                os.replace(tmp, path)
+                self._build_index(path)
+            self._fsync_dir()
+            self._finish_compactions()  # every output landed: drops the sources
+            merged += len(paths) - len(tmp_paths)
+
+        return merged
+
+    def _fsync_dir(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def migrate_json_array(json_path, log, logger=None):
+    """
+    Move a legacy JSON-array file (orders.json etc.) into a SegmentLog, all or nothing.
+    Records are written to a staging log beside it (<log dir>.migrating); once every one is
+    on disk a COMPLETE marker is written, then the segments are moved in and the source is
+    renamed to <name>.migrated. A crash before the marker leaves the log untouched and the
+    next call starts over; a crash after it is finished by the next call.
+    """
+    logger = logger or logging.getLogger(__name__)
+    staging = log.directory.rstrip(os.sep) + ".migrating"
+    marker = os.path.join(staging, "COMPLETE")
+    if not os.path.exists(json_path):
+        return 0
+
+    if not os.path.exists(marker):
+        if os.path.isdir(staging):
+            logger.warning(f"Restarting interrupted migration of {json_path}")
+            shutil.rmtree(staging)
+        with open(json_path, "r") as f:
+            try:
+                records = json.load(f)
+            except ValueError as e:
+                logger.error(f"Cannot migrate {json_path}: {e}")
+                return 0
+
+        staged = SegmentLog(staging, log.name, max_segment_bytes=log.max_segment_bytes, logger=logger)
+        for record in records:
+            day = None
+            ts = record.get("timestamp") if isinstance(record, dict) else None
+            if ts:
+                try:
+                    day = datetime.fromisoformat(ts).strftime("%Y%m%d")
+                except ValueError:
+                    pass
+            staged.append(record, day=day)
+        staged.sync()
+        staged.close()
+        with open(marker, "w") as f:
+            f.write(f"{len(records)}\n")
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        logger.warning(f"Finishing interrupted migration of {json_path}")
+
+    with open(marker, "r") as f:
+        count = int(f.read().strip() or 0)
+    with log._lock:
+        log.close()
+        for path in glob.glob(os.path.join(staging, f"{log.name}-*")):
+            os.replace(path, os.path.join(log.directory, os.path.basename(path)))
+        log._index_cache.clear()
+    log._fsync_dir()
+    os.replace(json_path, json_path + ".migrated")
+    shutil.rmtree(staging)
+    logger.info(f"Migrated {count} records from {json_path}")
+    return count
+
+
 class Storage:
-    def __init__(self, data_dir="data", logger=None):
+    def __init__(self, data_dir="data", logger=None, max_segment_bytes=64 * 1024 * 1024,
+                 fsync_every=50, fsync_interval=2.0):
         self.data_dir = data_dir
         self.logger = logger or logging.getLogger(__name__)
-        
+
         # Create data directory if it doesn't exist
         os.makedirs(data_dir, exist_ok=True)
-        
-        self.orders_file = os.path.join(data_dir, "orders.json")
-        self.trades_file = os.path.join(data_dir, "trades.json")
-        self.signals_file = os.path.join(data_dir, "signals.json")
-        
+
+        log_opts = dict(max_segment_bytes=max_segment_bytes, fsync_every=fsync_every,
+                        fsync_interval=fsync_interval, logger=self.logger)
+        self.orders = SegmentLog(os.path.join(data_dir, "orders"), "orders", **log_opts)
+        self.trades = SegmentLog(os.path.join(data_dir, "trades"), "trades", **log_opts)
+        self.signals = SegmentLog(os.path.join(data_dir, "signals"), "signals", **log_opts)
+
+        # One-time import of the old read-modify-write JSON arrays
+        for log in (self.orders, self.trades, self.signals):
+            legacy = os.path.join(data_dir, f"{log.name}.json")
+            resuming = os.path.exists(os.path.join(log.directory + ".migrating", "COMPLETE"))
+            if os.path.exists(legacy) and (resuming or not log.segments()):
+                try:
+                    migrate_json_array(legacy, log, self.logger)
+                except Exception as e:
+                    self.logger.error(f"Error migrating {legacy}: {e}")
+
+        atexit.register(self.close)
+
     def log_order(self, symbol, entry_resp, sl_resp, tp_resp, signal, qty):
         """Log order placement"""
         try:
@@ -27,13 +568,13 @@ class Storage:
                 'stop_loss_order': sl_resp,
                 'take_profit_order': tp_resp
             }
-            
-            self._append_to_file(self.orders_file, order_data)
+
+            self._append(self.orders, order_data)
             self.logger.info(f"Logged order for {symbol}: {qty} @ {signal['entry']}")
-            
+
         except Exception as e:
             self.logger.error(f"Error logging order: {e}")
-    
+
     def log_trade_close(self, fill_event):
         """Log trade closure"""
         try:
@@ -47,13 +588,13 @@ class Storage:
                 'pnl': fill_event.get('pnl', 0.0),
                 'client_order_id': fill_event.get('clientOrderId')
             }
-            
-            self._append_to_file(self.trades_file, trade_data)
+
+            self._append(self.trades, trade_data)
             self.logger.info(f"Logged trade close: {fill_event['symbol']} PnL: {fill_event.get('pnl', 0.0)}")
-            
+
         except Exception as e:
             self.logger.error(f"Error logging trade close: {e}")
-    
+
     def log_signal(self, symbol, signal_data):
         """Log trading signal"""
         try:
@@ -62,55 +603,100 @@ class Storage:
                 'symbol': symbol,
                 'signal': signal_data
             }
-            
-            self._append_to_file(self.signals_file, signal_entry)
-            
+
+            self._append(self.signals, signal_entry)
+
         except Exception as e:
             self.logger.error(f"Error logging signal: {e}")
-    
-    def _append_to_file(self, filename, data):
-        """Append data to JSON file"""
+
+    def _append(self, log, data):
+        """Append one record to a segment log"""
         try:
-            # Read existing data
-            if os.path.exists(filename):
-                with open(filename, 'r') as f:
-                    existing_data = json.load(f)
-            else:
-                existing_data = []
-            
-            # Append new data
-            existing_data.append(data)
-            
-            # Write back to file
-            with open(filename, 'w') as f:
-                json.dump(existing_data, f, indent=2)
-                
+            log.append(data)
         except Exception as e:
-            self.logger.error(f"Error writing to {filename}: {e}")
-    
-    def get_recent_trades(self, limit=50):
+            self.logger.error(f"Error writing to {log.name}: {e}")
+
+    def get_recent_trades(self, limit=50, symbol=None):
         """Get recent trades"""
         try:
-            if os.path.exists(self.trades_file):
-                with open(self.trades_file, 'r') as f:
-                    trades = json.load(f)
-                return trades[-limit:] if len(trades) > limit else trades
-            return []
-            
+            return self.trades.tail(limit, symbol=symbol)
+
         except Exception as e:
             self.logger.error(f"Error reading trades: {e}")
             return []
-    
-    def get_recent_orders(self, limit=50):
+
+    def get_recent_orders(self, limit=50, symbol=None):
         """Get recent orders"""
         try:
-            if os.path.exists(self.orders_file):
-                with open(self.orders_file, 'r') as f:
-                    orders = json.load(f)
-                return orders[-limit:] if len(orders) > limit else orders
-            return []
-            
+            return self.orders.tail(limit, symbol=symbol)
+
         except Exception as e:
             self.logger.error(f"Error reading orders: {e}")
             return []
 
+    def get_trades(self, start=None, end=None, symbol=None, limit=None):
+        """Get trades in [start, end), optionally for one symbol"""
+        try:
+            return self.trades.query(start, end, symbol=symbol, limit=limit)
+
+        except Exception as e:
+            self.logger.error(f"Error querying trades: {e}")
+            return []
+
+    def get_orders(self, start=None, end=None, symbol=None, limit=None):
+        """Get orders in [start, end), optionally for one symbol"""
+        try:
+            return self.orders.query(start, end, symbol=symbol, limit=limit)
+
+        except Exception as e:
+            self.logger.error(f"Error querying orders: {e}")
+            return []
+
+    def compact(self):
+        """Merge small closed segments of every log"""
+        return sum(log.compact() for log in (self.orders, self.trades, self.signals))
+
+    def close(self):
+        for log in (self.orders, self.trades, self.signals):
+            try:
+                log.close()
+            except Exception as e:
+                self.logger.error(f"Error closing {log.name}: {e}")
+
+
+def open_storage(params, logger=None):
+    """Build the storage backend selected by the `storage` section of settings.yaml"""
+    opts = params.get('storage', {}) or {}
+    backend = opts.get('backend', 'jsonl')
+    data_dir = opts.get('data_dir', 'data')
+
+    if backend == 'sqlite':
+        from core.storage_sqlite import SqliteStorage
+        return SqliteStorage(data_dir, logger,
+                             batch_size=opts.get('batch_size', 200),
+                             flush_interval=opts.get('flush_interval_s', 0.5))
+    if backend != 'jsonl':
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    return Storage(data_dir, logger,
+                   max_segment_bytes=int(opts.get('segment_max_mb', 64) * 1024 * 1024),
+                   fsync_every=opts.get('fsync_every', 50),
+                   fsync_interval=opts.get('fsync_interval_s', 2.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintenance for the bot's JSONL storage")
+    parser.add_argument("command", choices=["migrate", "compact"])
+    parser.add_argument("data_dir", nargs="?", default="data")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    storage = Storage(args.data_dir)  # migrates legacy arrays on open
+    if args.command == "compact":
+        merged = storage.compact()
+        storage.logger.info(f"Compaction removed {merged} segment files")
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import logging
+
+from core.storage import SegmentLog, _to_ms
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    symbol TEXT,
+    client_order_id TEXT,
+    quantity REAL,
+    data TEXT NOT NULL,
+    record_key TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_symbol_ts ON orders (symbol, ts);
+CREATE INDEX IF NOT EXISTS orders_client_order_id ON orders (client_order_id);
+CREATE INDEX IF NOT EXISTS orders_ts ON orders (ts);
+
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    symbol TEXT,
+    client_order_id TEXT,
+    side TEXT,
+    role TEXT,
+    pnl REAL,
+    data TEXT NOT NULL,
+    record_key TEXT
+);
+CREATE INDEX IF NOT EXISTS trades_symbol_ts ON trades (symbol, ts);
+CREATE INDEX IF NOT EXISTS trades_client_order_id ON trades (client_order_id);
+CREATE INDEX IF NOT EXISTS trades_ts ON trades (ts);
+
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    symbol TEXT,
+    data TEXT NOT NULL,
+    record_key TEXT
+);
+CREATE INDEX IF NOT EXISTS signals_symbol_ts ON signals (symbol, ts);
+"""
+
+TABLES = ("orders", "trades", "signals")
+
+# After SCHEMA, and after record_key is added to tables created before it existed
+KEY_INDEXES = "".join(f"CREATE UNIQUE INDEX IF NOT EXISTS {t}_record_key ON {t} (record_key);\n" for t in TABLES)
+
+_STOP = object()
+
+
+def _record_key(record):
+    """Content hash of a record: a second insert of the same record (e.g. a re-import) is ignored"""
+    return hashlib.sha1(json.dumps(record, default=str, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _order_row(record):
+    entry = record.get('entry_order') or {}
+    cid = entry.get('clientOrderId') if isinstance(entry, dict) else None
+    return ("INSERT OR IGNORE INTO orders (ts, symbol, client_order_id, quantity, data, record_key) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (_to_ms(record['timestamp']), record.get('symbol'), cid, record.get('quantity'),
+             json.dumps(record, default=str), _record_key(record)))
+
+
+def _trade_row(record):
+    return ("INSERT OR IGNORE INTO trades (ts, symbol, client_order_id, side, role, pnl, data, record_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (_to_ms(record['timestamp']), record.get('symbol'), record.get('client_order_id'),
+             record.get('side'), record.get('role'), record.get('pnl'),
+             json.dumps(record, default=str), _record_key(record)))
+
+
+def _signal_row(record):
+    return ("INSERT OR IGNORE INTO signals (ts, symbol, data, record_key) VALUES (?, ?, ?, ?)",
+            (_to_ms(record['timestamp']), record.get('symbol'), json.dumps(record, default=str),
+             _record_key(record)))
+
+
+def _migrate(conn):
+    """Add and fill record_key on tables created before it existed"""
+    for table in TABLES:
+        columns = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        if 'record_key' in columns:
+            continue
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN record_key TEXT")
+        rows = conn.execute(f"SELECT id, data FROM {table}").fetchall()
+        # Rows that were already duplicated keep a NULL key rather than failing the unique index
+        conn.executemany(f"UPDATE OR IGNORE {table} SET record_key = ? WHERE id = ?",
+                         [(_record_key(json.loads(data)), rid) for rid, data in rows])
+
+
+class SqliteStorage:
+    """
+    Drop-in alternative to core.storage.Storage backed by SQLite in WAL mode.
+    - log_* calls only enqueue; a writer thread commits them in batched transactions,
+      so the trading thread never waits on disk.
+    - Each reading thread (Flask workers) gets its own read-only connection; under WAL
+      readers never block the writer or each other.
+    - Every row carries a content hash under a unique index, so inserting a record twice
+      is a no-op. A batch that still fails after `retries` is appended to <db>.spill.jsonl
+      and replayed on the next start.
+    """
+    def __init__(self, data_dir="data", logger=None, filename="bot.sqlite3",
+                 batch_size=200, flush_interval=0.5, retries=3, retry_backoff_s=0.1):
+        self.data_dir = data_dir
+        self.logger = logger or logging.getLogger(__name__)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff_s = retry_backoff_s
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.path = os.path.join(data_dir, filename)
+        self.spill_path = self.path + ".spill.jsonl"
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+            conn.executescript(KEY_INDEXES)
+        self._writer_conn = conn
+        self._replay_spill()
+
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+        atexit.register(self.close)
+
+    def _connect(self, readonly=False):
+        if readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: durable at checkpoint, no fsync per commit
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(readonly=True)
+            self._local.conn = conn
+        return conn
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Drain whatever else is already waiting, up to batch_size
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval if len(batch) == 1 else 0))
+            except queue.Empty:
+                pass
+
+            stop = any(b is _STOP for b in batch)
+            rows = [b for b in batch if b is not _STOP]
+            try:
+                self._write_batch(rows)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                return
+
+    def _write_batch(self, rows):
+        for attempt in range(self.retries + 1):
+            try:
+                with self._writer_conn:
+                    for sql, params in rows:
+                        self._writer_conn.execute(sql, params)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    self.logger.error(f"Error writing {len(rows)} rows to {self.path}: {e}; "
+                                      f"spilling to {self.spill_path}")
+                    self._spill(rows)
+                    return
+                self.logger.warning(f"Error writing {len(rows)} rows to {self.path} ({e}); "
+                                    f"retry {attempt + 1}/{self.retries}")
+                time.sleep(self.retry_backoff_s * 2 ** attempt)
+
+    def _spill(self, rows):
+        try:
+            with open(self.spill_path, "a") as f:
+                f.write("".join(json.dumps({'sql': sql, 'params': list(params)}) + "\n" for sql, params in rows))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            self.logger.error(f"Error spilling {len(rows)} rows to {self.spill_path}; they are lost: {e}")
+
+    def _replay_spill(self):
+        """Insert rows a failed batch left in the spill file (a no-op for any that did land)"""
+        if not os.path.exists(self.spill_path):
+            return
+        try:
+            rows = []
+            with open(self.spill_path, "r") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn final line
+            with self._writer_conn:
+                for row in rows:
+                    self._writer_conn.execute(row['sql'], row['params'])
+            os.remove(self.spill_path)
+            self.logger.info(f"Replayed {len(rows)} spilled rows into {self.path}")
+        except Exception as e:
+            self.logger.error(f"Error replaying {self.spill_path}: {e}")
+
+    def _enqueue(self, row):
+        self._queue.put(row)
+
+    def log_order(self, symbol, entry_resp, sl_resp, tp_resp, signal, qty):
+        """Log order placement"""
+        try:
+            order_data = {
+                'timestamp': datetime.now().isoformat(),
+                'symbol': symbol,
+                'quantity': qty,
+                'signal': signal,
+                'entry_order': entry_resp,
+                'stop_loss_order': sl_resp,
+                'take_profit_order': tp_resp
+            }
+
+            self._enqueue(_order_row(order_data))
+            self.logger.info(f"Logged order for {symbol}: {qty} @ {signal['entry']}")
+
+        except Exception as e:
+            self.logger.error(f"Error logging order: {e}")
+
+    def log_trade_close(self, fill_event):
+        """Log trade closure"""
+        try:
+            trade_data = {
+                'timestamp': datetime.now().isoformat(),
+                'symbol': fill_event['symbol'],
+                'side': fill_event['side'],
+                'role': fill_event.get('role'),
+                'quantity': fill_event.get('quantity'),
+                'price': fill_event.get('price'),
+                'pnl': fill_event.get('pnl', 0.0),
+                'client_order_id': fill_event.get('clientOrderId')
+            }
+
+            self._enqueue(_trade_row(trade_data))
+            self.logger.info(f"Logged trade close: {fill_event['symbol']} PnL: {fill_event.get('pnl', 0.0)}")
+
+        except Exception as e:
+            self.logger.error(f"Error logging trade close: {e}")
+
+    def log_signal(self, symbol, signal_data):
+        """Log trading signal"""
+        try:
+            signal_entry = {
+                'timestamp': datetime.now().isoformat(),
+                'symbol': symbol,
+                'signal': signal_data
+            }
+
+            self._enqueue(_signal_row(signal_entry))
+
+        except Exception as e:
+            self.logger.error(f"Error logging signal: {e}")
+
+    def _select(self, table, start=None, end=None, symbol=None, limit=None):
+        where, params = [], []
+        if symbol:
+            where.append("symbol = ?")
+            params.append(symbol)
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(_to_ms(start))
+        if end is not None:
+            where.append("ts < ?")
+            params.append(_to_ms(end))
+
+        sql = f"SELECT data FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        rows = self._reader().execute(sql, params).fetchall()
+        return [json.loads(r['data']) for r in reversed(rows)]
+
+    def get_recent_trades(self, limit=50, symbol=None):
+        """Get recent trades"""
+        try:
+            return self._select("trades", symbol=symbol, limit=limit)
+
+        except Exception as e:
+            self.logger.error(f"Error reading trades: {e}")
+            return []
+
+    def get_recent_orders(self, limit=50, symbol=None):
+        """Get recent orders"""
+        try:
+            return self._select("orders", symbol=symbol, limit=limit)
+
+        except Exception as e:
+            self.logger.error(f"Error reading orders: {e}")
+            return []
+
+    def get_trades(self, start=None, end=None, symbol=None, limit=None):
+        """Get trades in [start, end), optionally for one symbol"""
+        try:
+            return self._select("trades", start, end, symbol=symbol, limit=limit)
+
+        except Exception as e:
+            self.logger.error(f"Error querying trades: {e}")
+            return []
+
+    def get_orders(self, start=None, end=None, symbol=None, limit=None):
+        """Get orders in [start, end), optionally for one symbol"""
+        try:
+            return self._select("orders", start, end, symbol=symbol, limit=limit)
+
+        except Exception as e:
+            self.logger.error(f"Error querying orders: {e}")
+            return []
+
+    def _count(self, table):
+        return self._reader().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def flush(self):
+        """Block until every queued write is committed"""
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer_conn.close()
+
+
+def import_legacy(storage, data_dir, logger=None):
+    """
+    Copy legacy JSON arrays (orders.json, ...) and JSONL segment logs from `data_dir`
+    into a SqliteStorage. Returns the number of records added per table; records already
+    in the database are skipped by their record_key, so running it again is safe.
+    """
+    logger = logger or logging.getLogger(__name__)
+    builders = {"orders": _order_row, "trades": _trade_row, "signals": _signal_row}
+    counts = {}
+
+    for table, build in builders.items():
+        records = []
+        # <table>.json.migrated is already mirrored in the segment log, so it is not read again
+        legacy = os.path.join(data_dir, f"{table}.json")
+        if os.path.exists(legacy):
+            with open(legacy, "r") as f:
+                records.extend(json.load(f))
+        segment_dir = os.path.join(data_dir, table)
+        if os.path.isdir(segment_dir):
+            records.extend(SegmentLog(segment_dir, table, logger=logger))
+
+        before = storage._count(table)
+        read = 0
+        for record in records:
+            if not isinstance(record, dict) or 'timestamp' not in record:
+                continue
+            storage._enqueue(build(record))
+            read += 1
+        storage.flush()
+        counts[table] = storage._count(table) - before
+        logger.info(f"Imported {counts[table]} of {read} {table} records into {storage.path}")
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import legacy JSON/JSONL history into SQLite storage")
+    parser.add_argument("command", choices=["import"])
+    parser.add_argument("data_dir", nargs="?", default="data")
+    parser.add_argument("--db-dir", default=None, help="Directory for the SQLite file (default: data_dir)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    storage = SqliteStorage(args.db_dir or args.data_dir)
+    import_legacy(storage, args.data_dir, storage.logger)
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+BINANCE_US_WS = "wss://stream.binance.us:9443"
+
+
+class MarketStream:
+    """
+    Streaming market data for DataFeed.
+    - Subscribes to <symbol>@kline_<interval>, <symbol>@aggTrade and <symbol>@bookTicker
+      on one combined stream, on a private asyncio loop in a daemon thread.
+    - Klines are merged into the DataFeed's KlineBuffers and aggTrades into its
+      WhaleDetectors; the top of book is kept here. DataFeed reads them without any
+      network call while the stream is live.
+    - On every (re)connect, klines and trades are backfilled over REST before the socket
+      is consumed, so a disconnect leaves no gap.
+    """
+    def __init__(self, datafeed, symbols, intervals, lookback=300, url=BINANCE_US_WS,
+                 reconnect_max_s=60, logger=None):
+        self.datafeed = datafeed
+        self.symbols = list(symbols)
+        self.intervals = list(intervals)
+        self.lookback = lookback
+        self.url = url.rstrip("/")
+        self.reconnect_max_s = reconnect_max_s
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.book = {}  # symbol -> best bid/ask
+        self.reconnects = 0
+        self.messages = 0
+
+        self._live = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+
+    def streams(self):
+        names = []
+        for s in self.symbols:
+            low = s.lower()
+            names += [f"{low}@kline_{i}" for i in self.intervals]
+            names += [f"{low}@aggTrade", f"{low}@bookTicker"]
+        return names
+
+    def is_live(self):
+        """True while connected and backfilled; DataFeed falls back to REST otherwise"""
+        return self._live.is_set()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._live.clear()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wait_live(self, timeout=None):
+        return self._live.wait(timeout)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._consume_forever())
+        finally:
+            self._loop.close()
+
+    async def _consume_forever(self):
+        import websockets
+
+        url = f"{self.url}/stream?streams={'/'.join(self.streams())}"
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                async with websockets.connect(url, max_queue=None) as ws:
+                    # Messages queue up inside the socket while we backfill over REST
+                    await self._loop.run_in_executor(None, self.backfill)
+                    self._live.set()
+                    delay = 1.0
+                    self.logger.info(f"Market stream live: {len(self.symbols)} symbols")
+                    while not self._stop.is_set():
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), timeout=1.0)
+                        except asyncio.TimeoutError:
+                            continue
+                        self.handle_message(json.loads(raw))
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.logger.warning(f"Market stream disconnected ({e}); reconnecting in {delay:.0f}s")
+            finally:
+                self._live.clear()
+
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_s)
+
+    def backfill(self):
+        """Fill klines and trades missed while disconnected (blocking REST)"""
+        for symbol in self.symbols:
+            for interval in self.intervals:
+                try:
+                    self.datafeed.klines_array(symbol, interval, self.lookback, refresh=True)
+                except Exception as e:
+                    self.logger.error(f"Kline backfill failed for {symbol} {interval}: {e}")
+            try:
+                detector = self.datafeed.whale_detector(symbol)
+                self.datafeed.poll_trades(symbol, horizon_ms=detector.horizon_ms or 60_000)
+            except Exception as e:
+                self.logger.error(f"Trade backfill failed for {symbol}: {e}")
+
+    def handle_message(self, msg):
+        """Apply one combined-stream message ({'stream': ..., 'data': ...})"""
+        self.messages += 1
+        stream = msg.get('stream', '')
+        data = msg.get('data', msg)
+
+        if '@kline_' in stream or data.get('e') == 'kline':
+            k = data['k']
+            row = np.array([[k['t'], k['o'], k['h'], k['l'], k['c'], k['v'], k['T']]], dtype=np.float64)
+            # Updates for the forming bar arrive every couple of seconds; the archive only needs closes
+            self.datafeed.merge_klines(k['s'], k['i'], row, closed=k['x'])
+        elif stream.endswith('@aggTrade') or data.get('e') == 'aggTrade':
+            self.datafeed.whale_detector(data['s']).add(data['a'], data['T'], float(data['p']),
+                                                        float(data['q']), data['m'])
+        elif stream.endswith('@bookTicker') or ('b' in data and 'a' in data and 'u' in data):
+            self.book[data['s']] = {
+                'bid': float(data['b']), 'bid_qty': float(data['B']),
+                'ask': float(data['a']), 'ask_qty': float(data['A']),
+                'update_id': data['u'],
+            }
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from core.stream import BINANCE_US_WS
+
+
+class UserDataStream:
+    """
+    User-data websocket: delivers our own executionReport events as they happen.
+    - Obtains a listenKey over REST and keeps it alive every keepalive_s.
+    - Calls on_execution(event) for each executionReport, on the stream thread.
+    - After every (re)connect calls on_resync() so fills missed while disconnected
+      can be recovered over REST.
+    """
+    def __init__(self, client, on_execution, on_resync=None, url=BINANCE_US_WS,
+                 keepalive_s=1800, reconnect_max_s=60, logger=None):
+        self.client = client
+        self.on_execution = on_execution
+        self.on_resync = on_resync
+        self.url = url.rstrip("/")
+        self.keepalive_s = keepalive_s
+        self.reconnect_max_s = reconnect_max_s
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.listen_key = None
+        self.events = 0
+        self.reconnects = 0
+
+        self._live = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_live(self):
+        return self._live.is_set()
+
+    def wait_live(self, timeout=None):
+        return self._live.wait(timeout)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="user-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._live.clear()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.listen_key:
+            try:
+                self.client.stream_close(self.listen_key)
+            except Exception:
+                pass
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._consume_forever())
+        finally:
+            loop.close()
+
+    async def _consume_forever(self):
+        import websockets
+
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                self.listen_key = await loop.run_in_executor(None, self.client.stream_get_listen_key)
+                async with websockets.connect(f"{self.url}/ws/{self.listen_key}", max_queue=None) as ws:
+                    if self.on_resync:
+                        await loop.run_in_executor(None, self.on_resync)
+                    self._live.set()
+                    delay = 1.0
+                    last_keepalive = time.monotonic()
+                    while not self._stop.is_set():
+                        if time.monotonic() - last_keepalive >= self.keepalive_s:
+                            await loop.run_in_executor(None, self.client.stream_keepalive, self.listen_key)
+                            last_keepalive = time.monotonic()
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), timeout=1.0)
+                        except asyncio.TimeoutError:
+                            continue
+                        if not self.handle_message(json.loads(raw)):
+                            break  # listen key expired: reconnect with a fresh one
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.logger.warning(f"User data stream disconnected ({e}); reconnecting in {delay:.0f}s")
+            finally:
+                self._live.clear()
+
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_s)
+
+    def handle_message(self, msg):
+        """Dispatch one event; returns False when the stream must be re-established"""
+        event_type = msg.get('e')
+        if event_type == 'executionReport':
+            self.events += 1
+            try:
+                self.on_execution(msg)
+            except Exception as e:
+                self.logger.error(f"Error handling execution report {msg.get('c')}: {e}")
+        elif event_type == 'listenKeyExpired':
+            self.logger.warning("User data listenKey expired")
+            return False
+        return True
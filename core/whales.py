@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import deque
+
+
+class _Window:
+    """Running aggregates for one window length"""
+    __slots__ = ('length_ms', 'buckets', 'total', 'buy', 'maxq')
+
+    def __init__(self, length_ms):
+        self.length_ms = length_ms
+        self.buckets = deque()  # [bucket_start_ms, total_notional, buy_notional]
+        self.total = 0.0
+        self.buy = 0.0
+        self.maxq = deque()     # (time_ms, notional), notional strictly decreasing
+
+
+class WhaleDetector:
+    """
+    Incremental whale detection for one symbol.
+    - Trades are pushed once (deduplicated by trade id) from REST polling or the websocket.
+    - Each window keeps time-bucketed total/buy notional with running sums and a monotonic
+      deque for the largest trade, so a flag check is O(1) amortized however many trades
+      arrived. Several window lengths can be tracked at once.
+    - Windows end at clock() (epoch seconds, default time.time); a replay passes its own.
+    """
+    def __init__(self, windows_s=(60,), bucket_ms=1000, clock=None):
+        self.bucket_ms = bucket_ms
+        self.clock = clock or time.time
+        self.windows = {}
+        self.last_id = None
+        self.trades_seen = 0
+        self._lock = threading.Lock()
+        for w in windows_s:
+            self.add_window(w)
+
+    @property
+    def horizon_ms(self):
+        """Longest window tracked; how much history a cold start needs"""
+        return max(w.length_ms for w in self.windows.values()) if self.windows else 0
+
+    def add_window(self, window_s):
+        """Track another window length; it fills from trades arriving from now on"""
+        with self._lock:
+            if window_s not in self.windows:
+                self.windows[window_s] = _Window(int(window_s * 1000))
+
+    def add(self, trade_id, time_ms, price, qty, is_buyer_maker):
+        """Push one trade; returns False if it was already seen"""
+        notional = price * qty
+        bucket = time_ms - time_ms % self.bucket_ms
+        buy = 0.0 if is_buyer_maker else notional  # buyer is taker -> market buy
+
+        with self._lock:
+            if self.last_id is not None and trade_id <= self.last_id:
+                return False
+            self.last_id = trade_id
+            self.trades_seen += 1
+
+            for w in self.windows.values():
+                if w.buckets and w.buckets[-1][0] >= bucket:
+                    b = w.buckets[-1]
+                    b[1] += notional
+                    b[2] += buy
+                else:
+                    w.buckets.append([bucket, notional, buy])
+                w.total += notional
+                w.buy += buy
+
+                while w.maxq and w.maxq[-1][1] <= notional:
+                    w.maxq.pop()
+                w.maxq.append((time_ms, notional))
+                self._expire(w, time_ms)
+        return True
+
+    def _expire(self, w, now_ms):
+        cutoff = now_ms - w.length_ms
+        while w.buckets and w.buckets[0][0] + self.bucket_ms <= cutoff:
+            _, total, buy = w.buckets.popleft()
+            w.total -= total
+            w.buy -= buy
+        if not w.buckets:
+            w.total = w.buy = 0.0  # shed accumulated float error
+        while w.maxq and w.maxq[0][0] < cutoff:
+            w.maxq.popleft()
+
+    def stats(self, window_s, now_ms=None):
+        """(total notional, buy notional, largest trade) over the last window_s seconds"""
+        now_ms = int(self.clock() * 1000) if now_ms is None else now_ms
+        with self._lock:
+            w = self.windows[window_s]
+            self._expire(w, now_ms)
+            largest = w.maxq[0][1] if w.maxq else 0.0
+            return w.total, w.buy, largest
+
+    def flag(self, window_s, single_trade, window_notional, imbalance, now_ms=None):
+        """Returns (flag, reason) using the same rules as the original whale_flag"""
+        total, buy, largest = self.stats(window_s, now_ms)
+        if largest >= single_trade:
+            return True, f"Whale trade detected: {largest:,.2f} USD"
+        if total >= window_notional and total > 0:
+            buy_ratio = buy / total
+            if buy_ratio >= imbalance or buy_ratio <= (1 - imbalance):
+                return True, f"Whale activity detected: {total:,.2f} USD volume with {buy_ratio:.2%} buy ratio"
+        return False, ""
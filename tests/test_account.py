@@ -0,0 +1,34 @@
+from core.account import Account
+from core.fake_exchange import FakeExchange
+
+
+def _exchange():
+    ex = FakeExchange({'BTCUSD': 50000.0, 'ETHUSD': 3000.0})
+    for symbol, price in (('BTCUSD', 40000), ('ETHUSD', 2000)):
+        ex.create_order(symbol=symbol, side='BUY', type='LIMIT', quantity=0.1, price=price, timeInForce='GTC')
+    ex.calls.clear()
+    return ex
+
+
+def _fetches(ex):
+    return [kwargs['symbol'] for method, kwargs in ex.calls if method == 'get_open_orders']
+
+
+def test_stale_snapshot_fetches_only_the_symbol():
+    ex = _exchange()
+    account = Account(ex, snapshot_ttl=10)
+    assert [o['symbol'] for o in account.open_orders('BTCUSD')] == ['BTCUSD']
+    assert [o['symbol'] for o in account.open_orders('BTCUSD')] == ['BTCUSD']
+    assert _fetches(ex) == ['BTCUSD', 'BTCUSD']
+
+
+def test_fresh_snapshot_serves_every_symbol():
+    ex = _exchange()
+    account = Account(ex, snapshot_ttl=10)
+    assert len(account.open_orders()) == 2
+    assert [o['symbol'] for o in account.open_orders('ETHUSD')] == ['ETHUSD']
+    assert _fetches(ex) == [None]
+
+    account.invalidate()
+    account.open_orders('ETHUSD')
+    assert _fetches(ex) == [None, 'ETHUSD']
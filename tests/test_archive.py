@@ -0,0 +1,59 @@
+import threading
+import time
+
+import numpy as np
+
+from core.archive import KlineArchive
+from core.datafeed import INTERVAL_MS
+from core.fake_exchange import FakeMarket
+
+STEP = INTERVAL_MS['1m']
+
+
+class _SlowMarket(FakeMarket):
+    """FakeMarket whose range fetches wait until released"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def get_klines(self, *args, **kwargs):
+        if kwargs.get('endTime') is not None:
+            self.release.wait(5)
+        return super().get_klines(*args, **kwargs)
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_gap_is_backfilled_in_the_background(tmp_path):
+    market = _SlowMarket(['BTCUSD'], bars=300)
+    bars = np.array(market.get_klines(symbol='BTCUSD', interval='1m', limit=300))
+    archive = KlineArchive(str(tmp_path), client=market)
+    assert archive.append_nowait('BTCUSD', '1m', bars[:100]) == 100
+
+    # 150 bars later (downtime): the live path must not wait for the REST backfill
+    t0 = time.perf_counter()
+    assert archive.append_nowait('BTCUSD', '1m', bars[250:]) == 0
+    assert time.perf_counter() - t0 < 0.5
+    assert archive.length('BTCUSD', '1m') == 100
+
+    market.release.set()
+    assert _wait(lambda: not archive._backfilling)
+    archive.append_nowait('BTCUSD', '1m', bars[250:])
+    opens = archive.load('BTCUSD', '1m')['open_time']
+    assert int(opens[-1]) == int(bars[-2, 0])  # everything closed, the forming bar excluded
+    assert np.all(np.diff(opens) == STEP)
+    assert np.array_equal(archive.tail('BTCUSD', '1m', 10)[:, 4], bars[-11:-1, 4])
+
+
+def test_contiguous_rows_are_written_without_the_exchange(tmp_path):
+    market = _SlowMarket(['BTCUSD'], bars=50)
+    bars = np.array(market.get_klines(symbol='BTCUSD', interval='1m', limit=50))
+    archive = KlineArchive(str(tmp_path), client=market)
+    archive.append_nowait('BTCUSD', '1m', bars[:20])
+    assert archive.append_nowait('BTCUSD', '1m', bars[10:30]) == 10
+    assert not archive._backfilling
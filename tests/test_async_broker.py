@@ -0,0 +1,69 @@
+import logging
+
+from core.async_broker import AsyncLiveBroker
+from core.engine import Engine
+from core.fake_exchange import FakeAsyncExchange, FakeExchange
+from core.recorder import RecordingClient, read_frames
+
+PRICES = {"BTCUSD": 50000.0}
+PRECISIONS = {"BTCUSD": {"qty": 6, "price": 2}}
+QUIET = logging.getLogger("test")
+QUIET.disabled = True
+
+
+class _Limiter:
+    def __init__(self):
+        self.acquired, self.recorded = [], []
+
+    def acquire(self, endpoint, params=None):
+        self.acquired.append(endpoint)
+        return 1
+
+    def record(self, key, weight, elapsed, error=False):
+        self.recorded.append((key, error))
+
+
+class _PartialFills(FakeExchange):
+    """MARKET orders fill half their quantity and stay PARTIALLY_FILLED"""
+    def _fill(self, order, price):
+        super()._fill(order, price)
+        half = float(order['origQty']) / 2
+        order.update(status='PARTIALLY_FILLED', executedQty=str(half), cummulativeQuoteQty=str(half * price))
+
+
+def _broker(ex, **kwargs):
+    return AsyncLiveBroker(ex, PRECISIONS, native_oco=False, retry_backoff_s=0.0, fill_timeout_s=0.05,
+                           aclient=FakeAsyncExchange(ex), logger=QUIET, **kwargs)
+
+
+def _bracket(broker, qty=0.01):
+    return broker.place_bracket("BTCUSD", "BUY", qty, stop_price=49000, limit_price=48950, tp_price=52000)
+
+
+def test_orders_are_budgeted_and_recorded(tmp_path):
+    ex = FakeExchange(PRICES)
+    limiter = _Limiter()
+    recorder = RecordingClient(ex, str(tmp_path / "orders.brec"), logger=QUIET)
+    broker = _broker(ex, limiter=limiter, recorder=recorder)
+    try:
+        ex.fail('create_order', lost_response=True)  # entry accepted, response lost: retried
+        _bracket(broker)
+    finally:
+        broker.close()
+        recorder.close()
+    assert limiter.acquired.count('order') == len(limiter.recorded)
+    assert ('POST order', True) in limiter.recorded
+    methods = [frame[2] for frame in read_frames(str(tmp_path / "orders.brec"))]
+    assert methods.count('create_order') == 3  # lost entry (found by get_order, not resent), SL, TP
+    assert 'get_order' in methods
+
+
+def test_partial_entry_fill_protects_and_registers_the_filled_quantity():
+    ex = _PartialFills(PRICES)
+    broker = _broker(ex)
+    try:
+        entry, sl, tp, _ = _bracket(broker, qty=0.02)
+    finally:
+        broker.close()
+    assert float(sl['origQty']) == float(tp['origQty']) == 0.01
+    assert Engine._filled_qty(entry, 0.02) == 0.01
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from core.backtest import candidates, synthetic_klines
+from core.datafeed import KLINE_FIELDS
+from core.signals import generate_signals_batch
+
+PARAMS = {'macd': {'fast': 12, 'slow': 26, 'signal': 9}, 'ema': {'len': 50}, 'atr_len': 14,
+          'exits': {'atr_stop': 1.5, 'atr_tp': 3.0, 'time_bars': 120}}
+
+
+def test_backtest_entries_match_the_batch_signal_path():
+    klines = synthetic_klines(0.5, seed=3)
+    df = pd.DataFrame(klines, columns=KLINE_FIELDS)
+    cands = candidates("BTCUSD", klines, PARAMS)
+
+    # The live path sees each bar as the last row of its history: one batch "symbol" per bar
+    frames = {i: df.iloc[:i + 1] for i in range(len(df))}
+    signals = generate_signals_batch(frames, {}, PARAMS)
+    live = sorted(i for i, sig in signals.items() if sig is not None)
+
+    idx = np.searchsorted(klines[:, 6], cands['time'])
+    assert len(live) > 5
+    assert idx.tolist() == live
+    np.testing.assert_allclose(cands['entry'], [signals[i]['entry'] for i in live])
+    np.testing.assert_allclose(cands['stop'], [signals[i]['stop'] for i in live], rtol=1e-9)
+    np.testing.assert_allclose(cands['tp'], [signals[i]['tp'] for i in live], rtol=1e-9)
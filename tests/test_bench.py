@@ -0,0 +1,20 @@
+import io
+
+from core import bench
+
+
+def test_every_benchmark_runs_at_its_smallest_size():
+    out = io.StringIO()
+    results = bench.run_all(bench.load_config(), sample_time=0.001, repeat=1, max_time=0.1, out=out,
+                            smallest=True)
+    assert len(results) == len(bench.BENCHMARKS)
+    assert not {k: r['error'] for k, r in results.items() if 'error' in r}
+    assert all(r['median_s'] > 0 for r in results.values())
+
+
+def test_compare_flags_regressions():
+    baseline = {'results': {'a[1]': {'median_s': 1.0}, 'b[1]': {'median_s': 1.0}, 'c[1]': {'median_s': 1.0}}}
+    results = {'a[1]': {'median_s': 1.5}, 'b[1]': {'median_s': 1.1}, 'c[1]': {'median_s': 0.5},
+               'd[1]': {'median_s': 1.0}}
+    verdicts = {key: verdict for key, _, _, _, verdict in bench.compare(results, baseline, 0.25)}
+    assert verdicts == {'a[1]': 'REGRESSION', 'b[1]': 'ok', 'c[1]': 'faster'}
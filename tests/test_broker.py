@@ -0,0 +1,142 @@
+import logging
+
+import pytest
+
+from core.broker import LiveBroker
+from core.fake_exchange import FakeExchange, api_error
+
+PRICES = {"BTCUSD": 50000.0}
+PRECISIONS = {"BTCUSD": {"qty": 6, "price": 2}}
+QUIET = logging.getLogger("test")
+QUIET.disabled = True
+
+
+def _broker(supports_oco=True, native_oco="auto"):
+    ex = FakeExchange(PRICES, supports_oco=supports_oco)
+    return ex, LiveBroker(ex, PRECISIONS, native_oco=native_oco)
+
+
+def _bracket(broker):
+    return broker.place_bracket("BTCUSD", "BUY", 0.01, stop_price=49000, limit_price=48950, tp_price=52000)
+
+
+def _live_exits(ex):
+    return [o for o in ex.orders.values() if o['side'] == 'SELL' and o['status'] == 'NEW']
+
+
+def test_native_oco_places_one_exit_set():
+    ex, broker = _broker()
+    entry, sl, tp, native = _bracket(broker)
+    assert native
+    assert entry['status'] == 'FILLED'
+    assert '-SL-' in sl['clientOrderId'] and '-TP-' in tp['clientOrderId']
+    assert len(_live_exits(ex)) == 2
+    assert [m for m, _ in ex.calls].count('create_oco_order') == 1
+
+
+def test_oco_unsupported_falls_back_and_is_remembered():
+    ex, broker = _broker(supports_oco=False, native_oco=True)
+    _, sl, tp, native = _bracket(broker)
+    assert not native
+    assert {o['type'] for o in _live_exits(ex)} == {'STOP_LOSS_LIMIT', 'LIMIT'}
+    _bracket(broker)
+    assert [m for m, _ in ex.calls].count('create_oco_order') == 1  # not retried for the symbol
+
+
+def test_filter_rejection_falls_back_without_disabling_oco():
+    ex, broker = _broker()
+    ex.fail('create_oco_order', api_error(-1013, "Filter failure: PRICE_FILTER"))
+    _, _, _, native = _bracket(broker)
+    assert not native
+    assert len(_live_exits(ex)) == 2
+    _, _, _, native = _bracket(broker)
+    assert native
+
+
+def test_lost_oco_response_recovers_the_placed_legs():
+    ex, broker = _broker()
+    ex.fail('create_oco_order', lost_response=True)  # accepted, then the response times out
+    _, sl, tp, native = _bracket(broker)
+    assert native
+    assert sl['status'] == 'NEW' and sl['type'] == 'STOP_LOSS_LIMIT'
+    assert len(_live_exits(ex)) == 2  # no second exit set on top of the OCO
+
+
+def test_oco_timeout_before_acceptance_falls_back():
+    ex, broker = _broker()
+    ex.fail('create_oco_order', api_error(-1007, "Timeout waiting for response", status=408))
+    _, _, _, native = _bracket(broker)
+    assert not native
+    assert len(_live_exits(ex)) == 2
+    assert broker.supports_oco("BTCUSD")
+
+
+def test_unknown_outcome_places_no_separate_exits():
+    ex, broker = _broker()
+    ex.fail('create_oco_order', api_error(-1001, "Internal error", status=500))
+    ex.fail('get_order', ConnectionError("reset"), times=2)
+    with pytest.raises(RuntimeError, match="outcome unknown"):
+        _bracket(broker)
+    assert _live_exits(ex) == []
+    assert broker.supports_oco("BTCUSD")
+
+
+class _PartialFills(FakeExchange):
+    """MARKET orders fill a third of their quantity and stay PARTIALLY_FILLED"""
+    def _fill(self, order, price):
+        super()._fill(order, price)
+        part = float(order['origQty']) / 3
+        order.update(status='PARTIALLY_FILLED', executedQty=str(part), cummulativeQuoteQty=str(part * price))
+
+
+def test_partial_entry_fill_protects_the_filled_quantity_on_the_lot_step():
+    from core.engine import Engine
+    from core.filters import FilterTable
+
+    ex = _PartialFills(PRICES, supports_oco=False)
+    filters = FilterTable()
+    filters._install({"BTCUSD": {'LOT_SIZE': {'minQty': '0.00001', 'maxQty': '9000', 'stepSize': '0.00001'},
+                                 'PRICE_FILTER': {'tickSize': '0.01'}}}, 0)
+    broker = LiveBroker(ex, PRECISIONS, native_oco=False, filters=filters)
+    entry, sl, tp, native = broker.place_bracket("BTCUSD", "BUY", 0.02, stop_price=49000, limit_price=48950,
+                                                 tp_price=52000)
+    assert float(sl['origQty']) == float(tp['origQty']) == 0.00666  # 0.02 / 3 floored to the step
+    assert Engine._filled_qty(sl, 0.02, field='origQty') == 0.00666
+
+
+def test_unfilled_entry_gets_no_exits():
+    class _NoFill(FakeExchange):
+        def _fill(self, order, price):
+            order.update(status='EXPIRED')
+
+    ex = _NoFill(PRICES)
+    broker = LiveBroker(ex, PRECISIONS, native_oco=False)
+    entry, sl, tp, native = _bracket(broker)
+    assert sl is None and tp is None
+    assert _live_exits(ex) == []
+
+
+def test_auto_oco_reads_the_filter_table_without_symbol_lookups():
+    from core.fake_exchange import FakeMarket
+    from core.filters import FilterTable
+
+    for allowed in (True, False):
+        ex = FakeMarket(["BTCUSD"], bars=50, supports_oco=allowed)
+        filters = FilterTable().load(ex)
+        broker = LiveBroker(ex, PRECISIONS, filters=filters)
+        _, _, _, native = _bracket(broker)
+        assert native is allowed
+        assert 'get_symbol_info' not in [m for m, _ in ex.calls]
+
+
+def test_failed_oco_lookup_is_not_remembered():
+    ex = FakeExchange(PRICES)
+    broker = LiveBroker(ex, PRECISIONS, logger=QUIET)
+    ex.fail('get_symbol_info', ConnectionError("reset"))
+    _, _, _, native = _bracket(broker)
+    assert not native  # separate exits while ocoAllowed is unknown
+    _, _, _, native = _bracket(broker)
+    assert native
+    assert [m for m, _ in ex.calls].count('get_symbol_info') == 2
+    _bracket(broker)
+    assert [m for m, _ in ex.calls].count('get_symbol_info') == 2  # a real answer is kept
@@ -0,0 +1,53 @@
+import logging
+import threading
+
+from core.bench import load_config
+from core.engine import Engine
+from core.metrics import Metrics
+
+QUIET = logging.getLogger("test")
+QUIET.setLevel(logging.CRITICAL)
+
+
+class _Feed:
+    def get_equity_usd(self):
+        return 1000.0
+
+
+class _Account:
+    def open_positions(self):
+        return []
+
+
+class _HangingEngine(Engine):
+    """Gathers for HANG block until released, like a REST call with no timeout"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+        self.calls = []
+
+    def _gather(self, symbol):
+        self.calls.append(symbol)
+        if symbol == "HANG":
+            self.release.wait(5)
+        return None, False
+
+
+def test_running_gather_is_not_reported_as_cancelled_or_resubmitted():
+    params = load_config()
+    params['execution'] = {'workers': 2, 'symbol_timeout_s': 0.1}
+    metrics = Metrics()
+    engine = _HangingEngine(None, _Feed(), _Account(), params, None, QUIET, metrics=metrics)
+    try:
+        assert engine.scan(["HANG", "BTCUSD"]) == 1
+        assert "HANG" in engine._overrun
+
+        # Still running: not queued again, so a hung call can't eat the whole pool
+        assert engine.scan(["HANG", "BTCUSD"]) == 1
+        assert engine.calls.count("HANG") == 1
+        assert metrics.render().count('bot_gather_overrun_total{symbol="HANG"} 1') == 1
+    finally:
+        engine.release.set()
+    engine._overrun["HANG"].result(5)
+    assert engine.scan(["HANG", "BTCUSD"]) == 0
+    assert engine.calls.count("HANG") == 2
@@ -0,0 +1,77 @@
+import pytest
+
+from core.filters import FilterTable, SymbolFilters
+
+
+def _filters(step='0.00001', min_qty=None, max_qty='9000', tick='0.01', min_notional='10', apply_to_market=True):
+    return SymbolFilters('BTCUSD', {
+        'LOT_SIZE': {'minQty': min_qty or step, 'maxQty': max_qty, 'stepSize': step},
+        'PRICE_FILTER': {'minPrice': tick, 'maxPrice': '1000000', 'tickSize': tick},
+        'MIN_NOTIONAL': {'minNotional': min_notional, 'applyToMarket': apply_to_market},
+    })
+
+
+def test_scientific_notation_step():
+    f = _filters(step='1e-05')
+    assert f.qty_decimals == 5
+    assert f.quantize_qty(0.123456789) == "0.12345"
+    assert f.quantize_qty(0.00001) == "0.00001"
+    assert 'e' not in f.quantize_qty(0.00002)
+
+
+@pytest.mark.parametrize("step, qty, expected", [
+    ('0.5', 3.74, "3.5"),
+    ('0.50000000', 0.99, "0.5"),
+    ('10', 127.0, "120"),
+    ('10.00000000', 9.99, "0"),   # below minQty (the step)
+])
+def test_coarse_steps_floor(step, qty, expected):
+    assert _filters(step=step).quantize_qty(qty) == expected
+
+
+def test_floor_never_rounds_up_on_float_noise():
+    f = _filters(step='0.001')
+    assert f.quantize_qty(0.3) == "0.300"         # 0.3 * 1000 = 299.99999999999994
+    assert f.quantize_qty(0.0029999) == "0.002"
+
+
+@pytest.mark.parametrize("tick, price, expected", [
+    ('0.01', 49999.994, "49999.99"),
+    ('0.01', 49999.996, "50000.00"),
+    ('0.05', 1.2376, "1.25"),
+    ('1e-08', 0.000012345678, "0.00001235"),
+    ('10', 12346.0, "12350"),
+    ('10', 12344.0, "12340"),
+])
+def test_price_rounds_to_tick(tick, price, expected):
+    assert _filters(tick=tick).quantize_price(price) == expected
+
+
+def test_rejections():
+    f = _filters(step='0.001', min_qty='0.01', max_qty='5', min_notional='10')
+    assert "below minQty" in f.check(0.009, 50000.0)
+    assert f.check(0.01, 50000.0) is None
+    assert "below minNotional" in f.check(0.01, 900.0)
+    # maxQty caps the quantity instead of rejecting it; the capped notional is what gets checked
+    assert f.quantize_qty(7.5) == "5.000"
+    assert f.check(7.5, 50000.0) is None
+    assert "outside" in _filters(tick='0.01').check(1.0, 0.001)
+
+
+def test_min_notional_on_market_orders_follows_apply_to_market():
+    assert _filters().check(0.0001, 50000.0, market=True) is not None
+    assert _filters(apply_to_market=False).check(0.0001, 50000.0, market=True) is None
+
+
+def test_table_compiles_exchange_info_and_persists(tmp_path):
+    from core.fake_exchange import FakeMarket
+    path = tmp_path / "filters.json"
+    market = FakeMarket(['BTCUSD', 'ETHUSD'], bars=10)
+    table = FilterTable(str(path)).load(market)
+    assert set(table.symbols) == {'BTCUSD', 'ETHUSD'}
+    assert table.precision_map()['BTCUSD'] == {'qty': 5, 'price': 2}
+
+    calls = len(market.calls)
+    again = FilterTable(str(path)).load(market)  # fresh file: no download
+    assert len(market.calls) == calls
+    assert again['ETHUSD'].quantize_qty(1.234567) == "1.23456"
@@ -0,0 +1,87 @@
+import re
+
+from core.metrics import Metrics
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{([a-zA-Z_][a-zA-Z0-9_]*="(\\.|[^"\\])*",?)*\})? (\S+)$')
+
+
+def _parse(text):
+    """{family: type} and [(name, labels, value)] from Prometheus text, checking every line's syntax"""
+    assert text.endswith("\n")
+    types, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, type_ = line.split(" ")
+            assert name not in types
+            types[name] = type_
+        elif line.startswith("# HELP "):
+            continue
+        else:
+            m = SAMPLE.match(line)
+            assert m, line
+            name, labels, value = m.group(1), m.group(2) or "", m.group(5)
+            family = re.sub(r'_(bucket|sum|count)$', '', name)
+            assert name in types or family in types, f"{name} has no TYPE line before it"
+            float(value)  # +Inf / NaN included
+            samples.append((name, labels, value))
+    return types, samples
+
+
+def _metrics():
+    m = Metrics(window=100)
+    for seconds in (0.0002, 0.003, 0.003, 0.2, 30.0):
+        m.observe('bot_stage_seconds', seconds, 'signal', 'BTCUSD')
+    with m.span("klines", "SOLUSD"):
+        pass
+    m.histogram('bot_exchange_seconds', "REST call latency", ('endpoint',))
+    m.observe('bot_exchange_seconds', 0.05, 'GET klines')
+    m.inc('bot_exchange_errors_total', 'GET klines', help_="REST calls that raised", labels=('endpoint',))
+    m.inc('bot_gather_overrun_total', 'BTCUSD', amount=2, help_="Gathers past their deadline", labels=('symbol',))
+    m.set('bot_errors', 3, help_="Errors since start")
+    m.set('bot_odd_label', 1, 'a "quoted"\\path', labels=('tag',))
+    return m
+
+
+def test_render_is_prometheus_text():
+    types, samples = _parse(_metrics().render())
+    assert types == {
+        'bot_stage_seconds': 'histogram', 'bot_stage_seconds_recent': 'summary',
+        'bot_exchange_seconds': 'histogram', 'bot_exchange_seconds_recent': 'summary',
+        'bot_exchange_errors_total': 'counter', 'bot_gather_overrun_total': 'counter',
+        'bot_errors': 'gauge', 'bot_odd_label': 'gauge',
+    }
+    values = {name + labels: value for name, labels, value in samples}
+    assert values['bot_gather_overrun_total{symbol="BTCUSD"}'] == '2.0'
+    assert values['bot_exchange_errors_total{endpoint="GET klines"}'] == '1.0'
+    assert values['bot_errors'] == '3.0'
+    assert values['bot_odd_label{tag="a \\"quoted\\"\\\\path"}'] == '1.0'
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_count():
+    _, samples = _parse(_metrics().render())
+    series = 'stage="signal",symbol="BTCUSD"'
+    buckets = [(labels, int(v)) for name, labels, v in samples
+               if name == 'bot_stage_seconds_bucket' and series in labels]
+    counts = [c for _, c in buckets]
+    assert counts == sorted(counts)
+    assert buckets[-1][0].endswith('le="+Inf"}') and counts[-1] == 5
+    assert dict(buckets)['{' + series + ',le="0.005"}'] == 3
+    values = {name + labels: v for name, labels, v in samples}
+    assert values['bot_stage_seconds_count{' + series + '}'] == '5'
+    assert float(values['bot_stage_seconds_sum{' + series + '}']) == 0.0002 + 0.003 + 0.003 + 0.2 + 30.0
+    assert float(values['bot_stage_seconds_recent{' + series + ',quantile="0.5"}']) == 0.003
+    assert values['bot_stage_seconds_count{stage="klines",symbol="SOLUSD"}'] == '1'
+
+
+def test_metrics_endpoint(monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, 'metrics', _metrics())
+    resp = app.app.test_client().get("/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain' and 'version=0.0.4' in resp.content_type
+    types, samples = _parse(resp.get_data(as_text=True))
+    assert types['bot_stage_seconds'] == 'histogram' and types['bot_exchange_errors_total'] == 'counter'
+    names = {name for name, _, _ in samples}
+    assert {'bot_portfolio_value_usd', 'bot_trade_enabled', 'bot_stage_seconds_bucket',
+            'bot_exchange_seconds_count', 'bot_gather_overrun_total'} <= names
@@ -0,0 +1,122 @@
+import logging
+
+import pytest
+
+from core.paper import PaperBroker, PaperExchange
+
+PRECISIONS = {"BTCUSD": {"qty": 6, "price": 2}}
+MINUTE = 60_000
+QUIET = logging.getLogger("test")
+QUIET.disabled = True
+
+
+def _exchange(**kwargs):
+    ex = PaperExchange(balances={'USD': 100_000.0, 'BTC': 1.0}, logger=QUIET, **kwargs)
+    ex.on_bar("BTCUSD", 0, 50000, 50000, 50000, 50000, MINUTE - 1)
+    return ex
+
+
+def _bar(ex, n, open_, high, low, close):
+    return ex.on_bar("BTCUSD", n * MINUTE, open_, high, low, close, (n + 1) * MINUTE - 1)
+
+
+def test_market_fill_pays_slippage_and_fee_at_the_touch():
+    ex = _exchange(fee_bps=10.0, slippage_bps=2.0)
+    ex.quote("BTCUSD", 49990, 50010)
+    events = []
+    ex.subscribe(events.append)
+    order = ex.create_order("BTCUSD", "BUY", "MARKET", 0.1, newClientOrderId="m1")
+    price = 50010 * (1 + 2 / 10_000)
+    fee = 0.1 * price * 10 / 10_000
+    assert order['status'] == 'FILLED'
+    assert float(order['fills'][0]['price']) == pytest.approx(price)
+    assert float(order['fills'][0]['commission']) == pytest.approx(fee)
+    assert ex.balances['BTC'] == pytest.approx(1.1)
+    assert ex.balances['USD'] == pytest.approx(100_000 - 0.1 * price - fee)
+    assert [(e['c'], e['X']) for e in events] == [("m1", 'FILLED')]
+
+
+def test_market_order_beyond_balance_is_rejected():
+    ex = _exchange()
+    with pytest.raises(Exception, match="insufficient balance"):
+        ex.create_order("BTCUSD", "SELL", "MARKET", 2.0)
+    assert ex.balances == {'USD': 100_000.0, 'BTC': 1.0}
+
+
+def test_stop_limit_triggers_at_the_stop_and_slips():
+    ex = _exchange(fee_bps=0.0, slippage_bps=2.0)
+    ex.create_order("BTCUSD", "SELL", "STOP_LOSS_LIMIT", 0.5, newClientOrderId="sl", price=48950, stopPrice=49000)
+    assert _bar(ex, 1, 49500, 49800, 49100, 49200) == []  # stop not reached
+    events = _bar(ex, 2, 49200, 49300, 48900, 49000)
+    assert [(e['c'], e['X']) for e in events] == [("sl", 'FILLED')]
+    price = 49000 * (1 - 2 / 10_000)
+    assert float(events[0]['L']) == pytest.approx(price)
+    assert ex.balances['BTC'] == pytest.approx(0.5)
+    assert ex.balances['USD'] == pytest.approx(100_000 + 0.5 * price)
+
+
+def test_stop_limit_gapped_through_rests_as_a_limit():
+    ex = _exchange(fee_bps=0.0, slippage_bps=0.0)
+    ex.create_order("BTCUSD", "SELL", "STOP_LOSS_LIMIT", 0.5, newClientOrderId="sl", price=48950, stopPrice=49000)
+    assert _bar(ex, 1, 48800, 48900, 48700, 48850) == []  # opened below the limit: triggered, unfilled
+    assert ex.get_order("BTCUSD", origClientOrderId="sl")['status'] == 'NEW'
+    events = _bar(ex, 2, 48850, 49000, 48800, 48990)
+    assert [(e['c'], e['X'], float(e['L'])) for e in events] == [("sl", 'FILLED', 48950.0)]
+
+
+def test_take_profit_limit_fills_at_its_price_or_a_better_open():
+    ex = _exchange(fee_bps=10.0)
+    ex.create_order("BTCUSD", "SELL", "LIMIT", 0.25, newClientOrderId="tp1", price=52000)
+    ex.create_order("BTCUSD", "SELL", "LIMIT", 0.25, newClientOrderId="tp2", price=51000)
+    assert _bar(ex, 1, 50000, 50900, 49900, 50500) == []
+    events = _bar(ex, 2, 51500, 52100, 51400, 52000)
+    assert {e['c']: float(e['L']) for e in events} == {"tp1": 52000.0, "tp2": 51500.0}
+    proceeds = 0.25 * 52000 + 0.25 * 51500
+    assert ex.balances['BTC'] == pytest.approx(0.5)
+    assert ex.balances['USD'] == pytest.approx(100_000 + proceeds * (1 - 10 / 10_000))
+
+
+def test_orders_only_match_bars_after_placement():
+    ex = _exchange()
+    _bar(ex, 1, 50000, 50000, 50000, 50000)
+    ex.create_order("BTCUSD", "SELL", "LIMIT", 0.25, price=50500)
+    assert _bar(ex, 1, 50000, 51000, 49000, 50000) == []  # replayed bar: ignored
+    assert len(_bar(ex, 2, 50000, 51000, 49000, 50000)) == 1
+
+
+def test_oco_fill_cancels_the_sibling():
+    ex = _exchange(fee_bps=0.0)
+    events = []
+    ex.subscribe(events.append)
+    ex.create_oco_order("BTCUSD", "SELL", 0.5, price=52000, stopPrice=49000, stopLimitPrice=48950,
+                        limitClientOrderId="tp", stopClientOrderId="sl")
+    _bar(ex, 1, 51000, 52100, 50900, 52000)
+    assert [(e['c'], e['X']) for e in events] == [("tp", 'FILLED'), ("sl", 'CANCELED')]
+    assert ex.get_open_orders("BTCUSD") == []
+    assert _bar(ex, 2, 52000, 52000, 48000, 48500) == []  # the cancelled stop stays dead
+    assert ex.balances == {'USD': pytest.approx(100_000 + 0.5 * 52000), 'BTC': pytest.approx(0.5)}
+
+
+def test_oco_bar_touching_both_legs_takes_the_stop():
+    ex = _exchange(fee_bps=0.0, slippage_bps=0.0)
+    ex.create_oco_order("BTCUSD", "SELL", 0.5, price=52000, stopPrice=49000, stopLimitPrice=48950,
+                        limitClientOrderId="tp", stopClientOrderId="sl")
+    events = _bar(ex, 1, 50000, 52500, 48500, 50000)
+    assert [(e['c'], e['X']) for e in events] == [("sl", 'FILLED'), ("tp", 'CANCELED')]
+    assert ex.balances['USD'] == pytest.approx(100_000 + 0.5 * 49000)
+    assert ex.stats() == {'fills': 1, 'open_orders': 0, 'balances': {'USD': 124_500.0, 'BTC': 0.5}}
+
+
+def test_paper_broker_bracket_matches_locally():
+    ex = _exchange(fee_bps=0.0, slippage_bps=0.0)
+    ex.quote("BTCUSD", 50000, 50000)
+    broker = PaperBroker(ex, PRECISIONS, native_oco=True)
+    entry, sl, tp, native = broker.place_bracket("BTCUSD", "BUY", 0.01, stop_price=49000, limit_price=48950,
+                                                 tp_price=52000)
+    assert entry['status'] == 'FILLED' and native
+    assert ex.balances['BTC'] == pytest.approx(1.01)
+    _bar(ex, 1, 50000, 52000, 49500, 51900)
+    assert ex.get_order("BTCUSD", origClientOrderId=tp['clientOrderId'])['status'] == 'FILLED'
+    assert ex.get_order("BTCUSD", origClientOrderId=sl['clientOrderId'])['status'] == 'CANCELED'
+    assert ex.balances['BTC'] == pytest.approx(1.0)
+    assert ex.balances['USD'] == pytest.approx(100_000 + 0.01 * (52000 - 50000))
@@ -0,0 +1,99 @@
+import re
+import threading
+import time
+
+import pytest
+
+from core.profiler import ProfilerBusy, SamplingProfiler
+
+
+def _spin(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def _busy(stop):
+    while not stop.is_set():
+        _spin(10_000)
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy, args=(stop,), name="busy-loop", daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join(5)
+
+
+def test_start_stop_and_folded_output(busy_thread):
+    profiler = SamplingProfiler(interval_s=0.002)
+    with pytest.raises(LookupError):
+        profiler.start(1, thread_name="no-such-thread")
+
+    assert profiler.start(5, thread_name="busy-loop")['running']
+    with pytest.raises(ProfilerBusy):
+        profiler.start(5, thread_name="busy-loop")
+    time.sleep(0.3)
+    stats = profiler.stop()
+    assert not stats['running'] and stats['thread'] == "busy-loop"
+    assert stats['samples'] > 10
+
+    lines = profiler.collapsed().splitlines()
+    assert all(re.fullmatch(r"\S+ \d+", line) for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == stats['samples']
+    # Root first, leaf last: the loop's frames in call order
+    assert any("test_profiler:_busy;test_profiler:_spin" in line for line in lines)
+
+    top = profiler.top(3)
+    assert top[0]['function'] == "test_profiler:_spin"
+    assert top[0]['self_pct'] > 50
+
+
+def test_profile_ends_by_itself():
+    stop = threading.Event()
+    thread = threading.Thread(target=_busy, args=(stop,), name="busy-short", daemon=True)
+    thread.start()
+    try:
+        profiler = SamplingProfiler(interval_s=0.002, max_seconds=0.2)
+        profiler.start(60, thread_name="busy-short")  # capped at max_seconds
+        time.sleep(0.6)
+        stats = profiler.stats()
+        assert not stats['running']
+        assert stats['elapsed_s'] < 0.5
+    finally:
+        stop.set()
+        thread.join(5)
+
+
+def test_sampling_overhead_is_small():
+    def timed(profiler):
+        done = threading.Event()
+        elapsed = []
+
+        def work():
+            t0 = time.perf_counter()
+            for _ in range(150):
+                _spin(10_000)
+            elapsed.append(time.perf_counter() - t0)
+            done.set()
+
+        thread = threading.Thread(target=work, name="overhead-loop", daemon=True)
+        thread.start()
+        if profiler is not None:
+            profiler.start(30, thread_name="overhead-loop")
+        done.wait(30)
+        if profiler is not None:
+            profiler.stop()
+        thread.join(5)
+        return elapsed[0]
+
+    timed(None)  # warm-up
+    base = min(timed(None) for _ in range(3))
+    profiler = SamplingProfiler(interval_s=0.005)
+    profiled = min(timed(profiler) for _ in range(3))
+    assert profiler.samples > 0
+    assert profiled < base * 1.5
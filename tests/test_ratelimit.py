@@ -0,0 +1,92 @@
+import json
+import logging
+import threading
+
+import pytest
+import requests
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+
+from core.datafeed import DataFeed
+from core.ratelimit import ENDPOINT_WEIGHTS, RateLimitedClient, RateLimitShed
+
+QUIET = logging.getLogger("test")
+QUIET.disabled = True
+URL = "https://api.binance.us/api/v3/"
+
+
+def _response(status=200, used=None, retry_after=None, body=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = json.dumps(body if body is not None else {}).encode()
+    if used is not None:
+        r.headers['X-MBX-USED-WEIGHT-1M'] = str(used)
+    if retry_after is not None:
+        r.headers['Retry-After'] = str(retry_after)
+    return r
+
+
+def _client(respond):
+    """A python-binance Client whose HTTP session answers with respond(url, query string)"""
+    client = Client.__new__(Client)
+    client.API_KEY, client.API_SECRET, client._requests_params = 'k', 's', None
+    client.session = requests.Session()
+    client.session.request = lambda method, url, **kw: respond(url, str(kw.get('params') or ''))
+    return client
+
+
+def test_headers_come_from_each_threads_own_response():
+    fast_done = threading.Event()
+    client = _client(lambda url, params: _response(used=900 if 'SLOW' in params else 10))
+    handle = client._handle_response
+
+    def handle_response(response):
+        if response.headers['X-MBX-USED-WEIGHT-1M'] == '900':
+            fast_done.wait(5)  # the fast call overwrites client.response meanwhile
+        return handle(response)
+
+    client._handle_response = handle_response
+    rl = RateLimitedClient(client, logger=QUIET)
+    slow = threading.Thread(target=rl._request, args=('get', URL + 'klines', False),
+                            kwargs={'data': {'symbol': 'SLOW'}})
+    slow.start()
+    rl._request('get', URL + 'klines', False, data={'symbol': 'FAST'})
+    fast_done.set()
+    slow.join(5)
+    assert rl.used_weight == 900
+    assert rl.tokens <= 1200 - 900
+
+
+def test_429_closes_the_gate_for_market_data():
+    client = _client(lambda url, params: _response(status=429, retry_after=30, body={'code': -1003, 'msg': 'x'}))
+    rl = RateLimitedClient(client, max_wait_s=0.05, logger=QUIET)
+    with pytest.raises(BinanceAPIException):
+        rl._request('get', URL + 'klines', False, data={'symbol': 'BTCUSD'})
+    assert rl.stats()['blocked_s'] > 0
+    with pytest.raises(RateLimitShed):  # market data is shed while blocked
+        rl._request('get', URL + 'aggTrades', False, data={'symbol': 'BTCUSD'})
+
+
+class _ShedTickers:
+    def get_account(self):
+        return {'balances': [{'asset': 'BTC', 'free': '1', 'locked': '0'}]}
+
+    def get_all_tickers(self):
+        raise RateLimitShed("ticker/price shed")
+
+
+def test_failed_valuation_skips_the_scan_instead_of_halting():
+    from core.engine import Engine
+    from core.bench import load_config
+
+    feed = DataFeed(_ShedTickers(), QUIET)
+    assert feed.get_equity_usd() is None
+    engine = Engine(None, feed, None, load_config(), None, QUIET)
+    assert engine.scan(['BTCUSD']) == 0
+    assert not engine.risk.day_loss_halt
+    assert engine.risk.day_start_equity is None
+
+
+@pytest.mark.parametrize("limit, weight", [(1, 1), (99, 1), (100, 1), (101, 2), (499, 2), (500, 5), (1000, 5), (1001, 10)])
+def test_klines_weight_follows_the_limit_brackets(limit, weight):
+    assert ENDPOINT_WEIGHTS['klines']({'limit': limit}) == weight
@@ -0,0 +1,89 @@
+import logging
+
+from core.datafeed import DataFeed
+from core.fake_exchange import FakeMarket
+from core.recorder import RecordingClient, ReplayClient, read_frames, write_frame, MAGIC
+
+SYMBOLS = ['BTCUSD', 'ETHUSD']
+QUIET = logging.getLogger("test")
+QUIET.disabled = True
+DAY_S = 86_400
+
+
+def _record(path, calls):
+    client = RecordingClient(FakeMarket(SYMBOLS, bars=50, trades_per_s=600), str(path), logger=QUIET)
+    out = calls(client)
+    client.close()
+    return out
+
+
+def _shift(path, seconds):
+    """Rewrite a recording as if it had been made `seconds` later (trade times included)"""
+    frames = list(read_frames(path))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for ts, elapsed, method, args, kwargs, result, error in frames:
+            if method == 'get_aggregate_trades':
+                result = [dict(t, T=t['T'] + seconds * 1000) for t in result]
+            write_frame(f, ts + seconds, elapsed, method, args, kwargs, result, error)
+
+
+def test_fallback_match_keeps_the_symbol(tmp_path):
+    path = tmp_path / "session.brec"
+    recorded = _record(path, lambda c: {s: c.get_aggregate_trades(symbol=s, startTime=1, limit=1000)
+                                        for s in SYMBOLS})
+    replay = ReplayClient(str(path))
+    # Different startTime: no exact match, and ETH asked for first
+    eth = replay.get_aggregate_trades(symbol='ETHUSD', startTime=2, limit=1000)
+    btc = replay.get_aggregate_trades(symbol='BTCUSD', startTime=2, limit=1000)
+    assert eth == recorded['ETHUSD'] and btc == recorded['BTCUSD']
+    assert replay.stats()['fallback_matches'] == 2
+
+
+def _flags(client, clock=None):
+    feed = DataFeed(client, QUIET, whale_windows_min=[1], clock=clock)
+    return {s: feed.whale_flag(s, window_min=1, single_trade=15_000, window_notional=1e12) for s in SYMBOLS}
+
+
+def test_replay_reproduces_whale_flags_on_the_recorded_clock(tmp_path):
+    path = tmp_path / "session.brec"
+    live = _record(path, _flags)
+    assert all(live.values())  # trade #500 is whale-sized
+    _shift(path, -DAY_S)  # replayed a day after it was recorded
+    replay = ReplayClient(str(path))
+    assert _flags(replay, clock=replay.clock) == live
+
+
+class _Broker:
+    def reconcile_oco(self, *args, **kwargs):
+        pass
+
+
+def test_replay_loss_streak_cooldown_runs_on_the_recorded_clock(tmp_path):
+    from core.bench import load_config
+    from core.engine import Engine
+    from core.recorder import _NullStorage
+
+    params = load_config()
+    cooldown_s = 60 * params['cooldown_minutes_after_loss_streak']
+    path = tmp_path / "session.brec"
+    _record(path, lambda c: [c.get_all_tickers() for _ in range(3)])
+    # Recorded a day ago: tickers at t, t + 1 minute and just past the cooldown
+    frames = list(read_frames(path))
+    t = frames[0][0] - DAY_S
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for (ts, *rest), at in zip(frames, (t, t + 60, t + cooldown_s + 60)):
+            write_frame(f, at, *rest)
+
+    replay = ReplayClient(str(path))
+    engine = Engine(_Broker(), None, None, params, _NullStorage(), QUIET, clock=replay.clock)
+    replay.get_all_tickers()
+    assert engine._risk_ok("replay", 1000.0)
+    for _ in range(params['limits']['max_consecutive_losses']):
+        engine.on_fill({'symbol': 'BTCUSD', 'side': 'SELL', 'role': 'SL', 'pnl': -1.0})
+    assert not engine._risk_ok("replay", 1000.0)
+    replay.get_all_tickers()
+    assert not engine._risk_ok("replay", 1000.0)
+    replay.get_all_tickers()
+    assert engine._risk_ok("replay", 1000.0)
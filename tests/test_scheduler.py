@@ -0,0 +1,87 @@
+import logging
+
+from core.bench import load_config
+from core.datafeed import DataFeed, INTERVAL_MS
+from core.engine import Engine
+from core.fake_exchange import FakeMarket
+from core.scheduler import BarScheduler
+
+QUIET = logging.getLogger("test")
+QUIET.setLevel(logging.CRITICAL)
+
+MIN = INTERVAL_MS['1m'] / 1000
+BAR_5M = 1_699_999_800_000  # a 5m (and 1m) boundary
+T0 = BAR_5M / 1000 + 10     # 10s into that bar
+
+
+class _Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class _Sleep:
+    """Stands in for the scheduler's stop event: waiting advances the fake clock"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.waits = []
+
+    def wait(self, delay):
+        self.waits.append(delay)
+        self.clock.now += delay
+        return False
+
+    def is_set(self):
+        return False
+
+
+def _scheduler(clock, intervals=('1m', '5m')):
+    scheduler = BarScheduler(list(intervals), close_delay_s=1.0, clock=clock, logger=QUIET)
+    scheduler._stop = _Sleep(clock)
+    return scheduler
+
+
+def test_next_close_is_the_coming_boundary():
+    clock = _Clock(T0)
+    scheduler = _scheduler(clock)
+    assert scheduler.next_close('1m') == BAR_5M + 60_000
+    assert scheduler.next_close('5m') == BAR_5M + 300_000
+    assert scheduler.due() == []
+
+
+def test_wait_sleeps_to_close_plus_delay_and_reports_closed_intervals():
+    clock = _Clock(T0)
+    scheduler = _scheduler(clock)
+    first_1m = scheduler.next_close('1m')
+
+    assert scheduler.wait() == ['1m']
+    assert clock.now == first_1m / 1000 + 1.0
+    assert scheduler.next_close('1m') == first_1m + 60_000
+
+    fired = [scheduler.wait() for _ in range(4)]
+    assert fired == [['1m'], ['1m'], ['1m'], ['1m', '5m']]
+    assert clock.now == (BAR_5M + 300_000) / 1000 + 1.0
+
+
+def test_stall_coalesces_missed_closes():
+    clock = _Clock(T0)
+    scheduler = _scheduler(clock)
+    clock.now += 10 * MIN
+    assert scheduler.wait() == ['1m', '5m']
+    assert scheduler.missed > 0
+    assert len(scheduler._stop.waits) == 0  # fired at once, no sleep
+
+
+def test_scan_on_close_evaluates_the_bar_that_just_closed():
+    market = FakeMarket(['BTCUSD'], bars=400)
+    last_open = market._klines('BTCUSD', '5m')[-1, 0]  # the forming bar
+    clock = _Clock(last_open / 1000 + 1.0)             # one second into it, as a scan on close runs
+    params = load_config()
+    feed = DataFeed(market, QUIET, clock=clock)
+    engine = Engine(None, feed, None, params, None, QUIET, clock=clock)
+
+    df, _ = engine._gather('BTCUSD')
+    assert df['close_time'].iloc[-1] == last_open - 1
+    assert (df['close_time'] < clock.now * 1000).all()
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from core.signals import StreamingIndicators, compute_indicators, generate_signal
+
+PARAMS = {'macd': {'fast': 12, 'slow': 26, 'signal': 9}, 'ema': {'len': 50}, 'atr_len': 14,
+          'exits': {'atr_stop': 1.5, 'atr_tp': 3.0}}
+NAMES = ('macd_line', 'macd_sig', 'ema_long', 'atr', 'volz')
+
+
+def _bars(n=600, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    spread = np.abs(rng.normal(0, 0.005, n)) * close
+    volume = rng.lognormal(3, 0.5, n)
+    volume[rng.random(n) < 0.05] *= 8  # spikes, so volz >= 2 and signals do occur
+    return pd.DataFrame({'open': close, 'high': close + spread, 'low': close - spread,
+                         'close': close, 'volume': volume})
+
+
+def _stream(st, df):
+    rows = df[['high', 'low', 'close', 'volume']].to_numpy()
+    return np.array([st.update(*row) for row in rows])
+
+
+def _assert_matches(streamed, df, first=0):
+    expected = compute_indicators(df, PARAMS['macd']['fast'], PARAMS['macd']['slow'], PARAMS['macd']['signal'],
+                                  PARAMS['ema']['len'], PARAMS['atr_len'])
+    for name, got, want in zip(NAMES, streamed.T, expected):
+        np.testing.assert_allclose(got, want.to_numpy()[first:], rtol=1e-6, atol=1e-6, equal_nan=True,
+                                   err_msg=name)
+
+
+def test_streaming_matches_batch_from_first_bar():
+    df = _bars()
+    _assert_matches(_stream(StreamingIndicators.from_params(PARAMS), df), df)
+
+
+def test_warm_start_matches_batch():
+    df = _bars()
+    for k in (1, 15, 25, 200):
+        st = StreamingIndicators.from_history(df.iloc[:k], PARAMS)
+        _assert_matches(_stream(st, df.iloc[k:]), df, first=k)
+
+
+def test_signal_matches_generate_signal():
+    df = _bars()
+    st = StreamingIndicators.from_history(df.iloc[:100], PARAMS)
+    fired = 0
+    for i in range(100, len(df)):
+        bar = df.iloc[i]
+        whale = i % 50 == 0
+        got = st.signal(bar['high'], bar['low'], bar['close'], bar['volume'], whale, PARAMS)
+        want = generate_signal(df.iloc[:i + 1], whale, PARAMS)
+        assert (got is None) == (want is None), i
+        if want is not None:
+            fired += 1
+            for key in ('entry', 'stop', 'tp', 'atr'):
+                assert abs(got[key] - want[key]) <= 1e-6 * abs(want[key]), (i, key)
+        st.update(bar['high'], bar['low'], bar['close'], bar['volume'])
+    assert fired > 0
+
+
+def test_batch_matches_generate_signal_per_symbol():
+    from core.signals import compute_indicators_2d, generate_signals_batch, stack_frames
+
+    # Different lengths, so shorter symbols are NaN-padded on the left of the stacked arrays
+    frames = {f"S{i}USD": _bars(n, seed=i) for i, n in enumerate((60, 120, 250, 400, 600))}
+    symbols, a = stack_frames(frames)
+    assert np.isnan(a['close'][0, :-60]).all()
+
+    batch_ind = compute_indicators_2d(a['close'], a['high'], a['low'], a['volume'], 12, 26, 9, 50, 14)
+    fired = 0
+    for cut in range(0, 200, 7):  # the batch at many points in time, trimming every frame alike
+        sub = {s: df.iloc[:max(1, len(df) - cut)] for s, df in frames.items()}
+        for whale in (False, True):
+            flags = {s: whale for s in sub}
+            got = generate_signals_batch(sub, flags, PARAMS)
+            for s, df in sub.items():
+                want = generate_signal(df, whale, PARAMS)
+                assert (got[s] is None) == (want is None), (s, cut, whale)
+                if want is not None:
+                    fired += 1
+                    for key in ('entry', 'stop', 'tp', 'atr'):  # NaN on both sides until ATR has a window
+                        assert np.isclose(got[s][key], want[key], rtol=1e-6, equal_nan=True), (s, cut, key)
+    assert fired > 0
+
+    for i, s in enumerate(symbols):
+        df = frames[s]
+        expected = compute_indicators(df, 12, 26, 9, 50, 14)
+        for name, got, want in zip(NAMES, batch_ind, expected):
+            np.testing.assert_allclose(got[i, -len(df):], want.to_numpy(), rtol=1e-6, atol=1e-6,
+                                       equal_nan=True, err_msg=f"{s} {name}")
@@ -0,0 +1,128 @@
+import json
+import os
+from datetime import datetime
+
+from core.storage import SegmentLog
+
+
+def _fill(log, day, n, per_segment):
+    for i in range(n):
+        ts = datetime.strptime(day, "%Y%m%d").replace(hour=12, minute=i).isoformat()
+        log.append({'symbol': 'BTCUSD', 'i': i, 'timestamp': ts}, day=day)
+        if (i + 1) % per_segment == 0:
+            log._open_segment(day, log._segment_key(log._path)[1] + 1)
+    log.close()
+
+
+def _records(log):
+    return sorted(r['i'] for r in log)
+
+
+def test_compact_merges_closed_days_only(tmp_path):
+    today = datetime.now().strftime("%Y%m%d")
+    log = SegmentLog(str(tmp_path), "orders")
+    _fill(log, "20200101", 9, 3)
+    _fill(log, today, 9, 3)
+    before_today = [p for p in log.segments() if log._segment_key(p)[0] == today]
+
+    assert log.compact() > 0
+    old = [p for p in log.segments() if log._segment_key(p)[0] == "20200101"]
+    assert len(old) == 1
+    assert [p for p in log.segments() if log._segment_key(p)[0] == today] == before_today
+    assert len(log) == 18
+    assert [r['i'] for r in log.query(end=datetime(2020, 1, 2))] == list(range(9))
+
+
+def test_interrupted_compaction_keeps_every_record(tmp_path):
+    log = SegmentLog(str(tmp_path), "orders")
+    _fill(log, "20200101", 9, 3)
+    sources = log.segments()
+
+    # Crash after the journal, before any merged segment was renamed into place
+    out = log._segment_path("20200101", 10)
+    with open(out + ".compact", "wb") as f:
+        f.write(b'{"i": 0}\n')
+    with open(log._journal_path("20200101"), "w") as f:
+        f.write("".join(f"src {p}\n" for p in sources) + f"out {out}\n")
+
+    recovered = SegmentLog(str(tmp_path), "orders")
+    assert recovered.segments() == sources
+    assert _records(recovered) == list(range(9))
+    assert not [p for p in os.listdir(tmp_path) if p.endswith((".compact", ".compacting"))]
+
+    # Same crash after the rename: the sources are the ones to go
+    log.compact()
+    merged = log.segments()
+    with open(log._journal_path("20200101"), "w") as f:
+        f.write("".join(f"src {p}\n" for p in sources) + "".join(f"out {p}\n" for p in merged))
+    for p in sources:
+        with open(p, "w") as f:
+            f.write(json.dumps({'i': -1}) + "\n")
+    recovered = SegmentLog(str(tmp_path), "orders")
+    assert _records(recovered) == list(range(9))
+
+
+def test_query_zero_limit(tmp_path):
+    log = SegmentLog(str(tmp_path), "orders")
+    _fill(log, "20200101", 3, 10)
+    assert log.query(limit=0) == []
+    assert log.tail(0) == []
+    assert [r['i'] for r in log.query(limit=2)] == [1, 2]
+
+
+def _legacy(tmp_path, n=20):
+    records = [{'symbol': 'BTCUSD', 'i': i, 'timestamp': f"2020-01-{1 + i % 3:02d}T12:00:00"} for i in range(n)]
+    with open(tmp_path / "trades.json", "w") as f:
+        json.dump(records, f)
+
+
+def test_interrupted_migration_starts_over(tmp_path, monkeypatch):
+    from core.storage import Storage
+
+    _legacy(tmp_path)
+    real_append = SegmentLog.append
+    calls = []
+
+    def crash_midway(self, record, day=None):
+        calls.append(1)
+        if len(calls) == 8:
+            raise OSError("disk full")
+        return real_append(self, record, day)
+
+    monkeypatch.setattr(SegmentLog, "append", crash_midway)
+    Storage(str(tmp_path)).close()
+    assert (tmp_path / "trades.json").exists()
+    assert len(SegmentLog(str(tmp_path / "trades"), "trades")) == 0  # nothing half-imported
+
+    monkeypatch.setattr(SegmentLog, "append", real_append)
+    storage = Storage(str(tmp_path))
+    assert sorted(t['i'] for t in storage.get_trades()) == list(range(20))
+    assert (tmp_path / "trades.json.migrated").exists()
+    assert not (tmp_path / "trades.migrating").exists()
+    storage.close()
+
+
+def test_migration_interrupted_while_moving_is_finished(tmp_path, monkeypatch):
+    from core import storage as storage_mod
+
+    _legacy(tmp_path)
+    real_replace = os.replace
+    moved = []
+
+    def crash_on_second_segment(src, dst):
+        if src.endswith(".jsonl") and ".migrating" in src:
+            moved.append(src)
+            if len(moved) == 2:
+                raise OSError("power cut")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(storage_mod.os, "replace", crash_on_second_segment)
+    storage_mod.Storage(str(tmp_path)).close()
+    assert (tmp_path / "trades.json").exists()
+    assert (tmp_path / "trades.migrating" / "COMPLETE").exists()
+
+    monkeypatch.setattr(storage_mod.os, "replace", real_replace)
+    storage = storage_mod.Storage(str(tmp_path))
+    assert sorted(t['i'] for t in storage.get_trades()) == list(range(20))
+    assert not (tmp_path / "trades.migrating").exists()
+    storage.close()
@@ -0,0 +1,76 @@
+import json
+import logging
+import sqlite3
+
+from core.storage import Storage
+from core.storage_sqlite import SqliteStorage, _signal_row, import_legacy
+
+QUIET = logging.getLogger("test")
+QUIET.setLevel(logging.CRITICAL)
+
+
+def _fill_jsonl(data_dir):
+    storage = Storage(str(data_dir), logger=QUIET)
+    for i in range(5):
+        storage.log_trade_close({'symbol': 'BTCUSD', 'side': 'SELL', 'role': 'TP', 'pnl': i,
+                                 'clientOrderId': f"cid-{i}"})
+        storage.log_signal('BTCUSD', {'entry': 100.0 + i})
+    storage.close()
+
+
+def test_import_legacy_twice_adds_nothing(tmp_path):
+    _fill_jsonl(tmp_path / "legacy")
+    storage = SqliteStorage(str(tmp_path / "db"), logger=QUIET)
+    try:
+        assert import_legacy(storage, str(tmp_path / "legacy"), QUIET) == {'orders': 0, 'trades': 5, 'signals': 5}
+        assert import_legacy(storage, str(tmp_path / "legacy"), QUIET) == {'orders': 0, 'trades': 0, 'signals': 0}
+        assert [t['pnl'] for t in storage.get_trades()] == [0, 1, 2, 3, 4]
+    finally:
+        storage.close()
+
+
+def test_existing_database_gets_record_keys(tmp_path):
+    path = tmp_path / "bot.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE signals (id INTEGER PRIMARY KEY, ts INTEGER NOT NULL, symbol TEXT, data TEXT NOT NULL)")
+    record = {'timestamp': '2024-01-01T00:00:00', 'symbol': 'BTCUSD', 'signal': {'entry': 1.0}}
+    conn.execute("INSERT INTO signals (ts, symbol, data) VALUES (?, ?, ?)", (1, 'BTCUSD', json.dumps(record)))
+    conn.commit()
+    conn.close()
+
+    storage = SqliteStorage(str(tmp_path), logger=QUIET)
+    try:
+        storage._enqueue(_signal_row(record))  # the same record again
+        storage.flush()
+        assert storage._count('signals') == 1
+    finally:
+        storage.close()
+
+
+def test_failed_batch_is_spilled_and_replayed(tmp_path):
+    storage = SqliteStorage(str(tmp_path), logger=QUIET, retries=1, retry_backoff_s=0.0)
+
+    class _Broken:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, *args):
+            raise sqlite3.OperationalError("disk I/O error")
+
+    real = storage._writer_conn
+    storage._writer_conn = _Broken()
+    storage.log_signal('BTCUSD', {'entry': 1.0})
+    storage.flush()
+    storage._writer_conn = real
+    storage.close()
+    assert (tmp_path / "bot.sqlite3.spill.jsonl").exists()
+
+    storage = SqliteStorage(str(tmp_path), logger=QUIET)
+    try:
+        assert storage._count('signals') == 1
+        assert not (tmp_path / "bot.sqlite3.spill.jsonl").exists()
+    finally:
+        storage.close()
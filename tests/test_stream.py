@@ -0,0 +1,105 @@
+import logging
+
+import numpy as np
+
+from core.datafeed import DataFeed, INTERVAL_MS
+from core.fake_exchange import FakeMarket
+from core.stream import MarketStream
+
+QUIET = logging.getLogger("test")
+QUIET.setLevel(logging.CRITICAL)
+
+
+class _Archive:
+    def __init__(self):
+        self.appends = 0
+
+    def append_nowait(self, symbol, interval, bars, now_ms=None):
+        self.appends += 1
+        return 0
+
+
+def _kline(open_ms, close, closed):
+    return {'stream': 'btcusd@kline_1m', 'data': {'e': 'kline', 'k': {
+        's': 'BTCUSD', 'i': '1m', 't': open_ms, 'T': open_ms + INTERVAL_MS['1m'] - 1,
+        'o': close, 'h': close, 'l': close, 'c': close, 'v': '1', 'x': closed}}}
+
+
+def test_archive_is_written_on_bar_close_only():
+    archive = _Archive()
+    feed = DataFeed(FakeMarket(['BTCUSD'], bars=100), QUIET, archive=archive)
+    last_open = int(feed.klines_array('BTCUSD', '1m', 60)[-1, 0])
+    archive.appends = 0
+
+    stream = MarketStream(feed, ['BTCUSD'], ['1m'], logger=QUIET)
+    next_open = last_open + INTERVAL_MS['1m']
+    for price in ('100.1', '100.2', '100.3'):
+        stream.handle_message(_kline(next_open, price, False))
+    assert archive.appends == 0
+    assert feed.kline_buffers[('BTCUSD', '1m')].view()[-1, 4] == 100.3
+
+    stream.handle_message(_kline(next_open, '100.4', True))
+    assert archive.appends == 1
+
+
+FUTURE = 4_000_000_000.0  # every bar in the test series counts as closed on this clock
+
+
+class _Published(FakeMarket):
+    """FakeMarket whose REST klines reach only as far as the replayed stream has closed bars"""
+    cutoff = staticmethod(lambda: float('inf'))
+
+    def _klines(self, symbol, interval):
+        rows = super()._klines(symbol, interval)
+        return rows[rows[:, 0] <= self.cutoff()]
+
+    def series(self, symbol, interval):
+        return super()._klines(symbol, interval)
+
+
+def _wait(predicate, timeout=20.0):
+    import time
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_stream_reconnects_backfills_and_archives_each_close_once(tmp_path):
+    from core.archive import KlineArchive
+    from core.replay_server import ReplayServer
+
+    market = _Published(['BTCUSD'], bars=100)
+    series = market.series('BTCUSD', '1m')
+    messages = []
+    for row in series[80:]:
+        t, o, h, l, c, v, _ = row
+        for closed, close in ((False, c * 1.01), (True, c)):  # an intra-bar update, then the close
+            messages.append({'stream': 'btcusd@kline_1m', 'data': {'e': 'kline', 'k': {
+                's': 'BTCUSD', 'i': '1m', 't': int(t), 'T': int(t) + INTERVAL_MS['1m'] - 1, 'o': str(o),
+                'h': str(max(h, close)), 'l': str(l), 'c': str(close), 'v': str(v), 'x': closed}}})
+    server = ReplayServer(messages, drop_after=10, gap=4, logger=QUIET)
+
+    def cutoff():
+        closed = [m['data']['k']['t'] for m in messages[:server.position] if m['data']['k']['x']]
+        return closed[-1] if closed else series[79, 0]
+    market.cutoff = cutoff
+
+    archive = KlineArchive(str(tmp_path), client=market, logger=QUIET)
+    feed = DataFeed(market, QUIET, archive=archive, clock=lambda: FUTURE)
+    stream = MarketStream(feed, ['BTCUSD'], ['1m'], lookback=100, url=server.start().url, logger=QUIET)
+    feed.attach_stream(stream.start())
+    try:
+        assert _wait(lambda: archive.length('BTCUSD', '1m') >= 100)
+        assert _wait(lambda: server.position == len(messages) and stream.is_live())
+    finally:
+        stream.stop()
+        server.stop()
+
+    assert server.connections >= 3 and stream.reconnects >= 2
+    stored = archive.tail('BTCUSD', '1m', 1000)
+    # Every bar exactly once, with its closing values: none of the intra-bar updates
+    np.testing.assert_array_equal(stored[:, 0], series[:, 0])
+    np.testing.assert_allclose(stored[:, 4], series[:, 4])
+    # The bars that went by while disconnected came from REST
+    assert feed.kline_buffers[('BTCUSD', '1m')].view()[-1, 0] == series[-1, 0]
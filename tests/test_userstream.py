@@ -0,0 +1,136 @@
+import logging
+import time
+
+from core.account import Account
+from core.bench import load_config
+from core.broker import LiveBroker
+from core.engine import Engine
+from core.fake_exchange import FakeExchange
+from core.replay_server import ReplayServer
+from core.userstream import UserDataStream
+
+PRICES = {"BTCUSD": 50000.0}
+PRECISIONS = {"BTCUSD": {"qty": 6, "price": 2}}
+QUIET = logging.getLogger("test")
+QUIET.disabled = True
+
+
+class _StreamClient(FakeExchange):
+    """FakeExchange plus the listenKey endpoints; `offline` actions run before a reconnect's new key,
+    i.e. while the stream was down"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keys = 0
+        self.keepalives, self.closed, self.offline = [], [], []
+
+    def stream_get_listen_key(self):
+        self._call('stream_get_listen_key', {})
+        self.keys += 1
+        if self.keys > 1:
+            while self.offline:
+                self.offline.pop(0)()
+        return f"key-{self.keys}"
+
+    def stream_keepalive(self, listenKey):
+        self.keepalives.append(listenKey)
+
+    def stream_close(self, listenKey):
+        self.closed.append(listenKey)
+
+
+class _Storage:
+    def __init__(self):
+        self.closes = []
+
+    def log_trade_close(self, fill_event):
+        self.closes.append((fill_event['clientOrderId'], round(fill_event['pnl'], 6)))
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def _engine(ex):
+    account = Account(ex, QUIET, snapshot_ttl=3600)
+    broker = LiveBroker(ex, PRECISIONS, native_oco=False)
+    return Engine(broker, None, account, load_config(), _Storage(), QUIET), account
+
+
+def _bracket(engine, tp_price):
+    entry, sl, tp, native = engine.broker.place_bracket("BTCUSD", "BUY", 0.01, stop_price=49000,
+                                                       limit_price=48950, tp_price=tp_price)
+    engine.broker.register_bracket("BTCUSD", 0.01, 50000.0, entry, sl, tp, native)
+    return sl['clientOrderId'], tp['clientOrderId']
+
+
+def _run(ex, engine, messages, on_resync=None, **server_kwargs):
+    server = ReplayServer(messages, logger=QUIET, **server_kwargs).start()
+    stream = UserDataStream(ex, engine.on_execution_report, on_resync=on_resync or engine.resync_brackets,
+                            url=server.url, keepalive_s=0.2, logger=QUIET)
+    return server, stream.start()
+
+
+def test_fill_missed_while_dropped_is_recovered_on_reconnect():
+    ex = _StreamClient(PRICES)
+    engine, account = _engine(ex)
+    sl_a, tp_a = _bracket(engine, 52000)
+    sl_b, tp_b = _bracket(engine, 53000)
+    report = {'e': 'executionReport', 's': "BTCUSD", 'S': "SELL", 'c': tp_a, 'X': 'FILLED', 'z': "0.01",
+              'Z': "520.0", 'L': "52000.0"}
+    resyncs = []
+
+    def on_resync():
+        engine.resync_brackets()
+        if not resyncs:  # A's take-profit fills once we are live; its report is the first message
+            ex.fill_order(tp_a)
+        resyncs.append(1)
+    ex.offline.append(lambda: ex.fill_order(sl_b, 48990))  # while dropped: never reaches the socket
+
+    server, stream = _run(ex, engine, [report], on_resync=on_resync, drop_after=1)
+    try:
+        assert _wait(lambda: stream.reconnects >= 1 and stream.is_live())
+        assert _wait(lambda: len(engine.storage.closes) == 2)
+        assert _wait(lambda: "key-2" in ex.keepalives)
+    finally:
+        stream.stop()
+        server.stop()
+
+    assert engine.storage.closes == [(tp_a, 20.0), (sl_b, -10.1)]
+    assert len(resyncs) == 2
+    assert stream.events == 1  # the second exit came from the REST resync, not the socket
+    assert ex.get_open_orders() == []  # both siblings cancelled
+    assert engine.broker.brackets.open_brackets() == []
+    assert 'BTC' not in account.balances()  # re-read after the resync: both positions are out
+    assert account.balances()['USD']['total'] == 100_000.0 - 1_000.0 + 520.0 + 489.9
+    assert ex.closed == ["key-2"]
+
+
+def test_reconnect_resyncs_balances_and_open_orders():
+    ex = _StreamClient(PRICES)
+    engine, account = _engine(ex)
+    sl, tp = _bracket(engine, 52000)
+    assert account.balances()['USD']['total'] == 99_500.0
+    assert len(account.open_orders()) == 2
+
+    def elsewhere():  # a deposit and an order placed from another session
+        ex.balances['USD'] += 1_000.0
+        ex.create_order("BTCUSD", "BUY", "LIMIT", 0.01, newClientOrderId="manual", price=45000)
+    ex.offline.append(elsewhere)
+
+    server, stream = _run(ex, engine, [{'e': 'listenKeyExpired', 'E': 0}])
+    try:
+        assert _wait(lambda: stream.reconnects >= 1 and stream.is_live())
+    finally:
+        stream.stop()
+        server.stop()
+
+    assert ex.keys == 2 and server.connections == 2
+    calls = [m for m, _ in ex.calls]
+    assert calls.count('get_account') == 3 and calls.count('get_open_orders') == 3  # startup, both connects
+    assert account.balances()['USD']['total'] == 100_500.0  # from the resync, not a new read
+    assert {o['clientOrderId'] for o in account.open_orders()} == {sl, tp, "manual"}
+    assert [m for m, _ in ex.calls].count('get_open_orders') == 3
+    assert engine.storage.closes == []
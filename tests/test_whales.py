@@ -0,0 +1,58 @@
+import logging
+
+from core.datafeed import DataFeed
+from core.fake_exchange import FakeMarket
+from core.whales import WhaleDetector
+
+QUIET = logging.getLogger("test")
+QUIET.setLevel(logging.CRITICAL)
+
+T = 1_700_000_000_000
+
+
+def test_buckets_expire_out_of_the_window():
+    detector = WhaleDetector(windows_s=(60,))
+    detector.add(1, T, 100.0, 10.0, False)           # 1000 buy
+    detector.add(2, T + 30_000, 100.0, 20.0, True)   # 2000 sell
+    assert detector.stats(60, now_ms=T + 30_000) == (3000.0, 1000.0, 2000.0)
+
+    # First bucket [T, T+1s) leaves once the window start passes its end
+    assert detector.stats(60, now_ms=T + 61_000) == (2000.0, 0.0, 2000.0)
+    assert detector.stats(60, now_ms=T + 91_000) == (0.0, 0.0, 0.0)
+
+
+def test_duplicate_ids_are_ignored():
+    detector = WhaleDetector()
+    assert detector.add(5, T, 100.0, 1.0, False)
+    assert not detector.add(5, T, 100.0, 1.0, False)
+    assert not detector.add(4, T, 100.0, 1.0, False)
+    assert detector.stats(60, now_ms=T)[0] == 100.0
+
+
+def test_single_trade_flag():
+    detector = WhaleDetector()
+    detector.add(1, T, 50_000.0, 4.0, True)  # 200k
+    assert detector.flag(60, 250_000, 1e12, 0.65, now_ms=T) == (False, "")
+    detector.add(2, T + 1000, 50_000.0, 5.0, True)  # 250k
+    flagged, reason = detector.flag(60, 250_000, 1e12, 0.65, now_ms=T + 1000)
+    assert flagged and reason.startswith("Whale trade detected")
+    # Gone once it leaves the window
+    assert not detector.flag(60, 250_000, 1e12, 0.65, now_ms=T + 62_000)[0]
+
+
+def test_imbalance_flag_needs_volume_and_one_sided_flow():
+    detector = WhaleDetector()
+    for i in range(10):
+        detector.add(i + 1, T + i * 1000, 100.0, 1_000.0, i >= 8)  # 8 of 10 buys, 1M total
+    flagged, reason = detector.flag(60, 1e12, 1_000_000, 0.65, now_ms=T + 9_000)
+    assert flagged and "80.00% buy ratio" in reason
+    assert not detector.flag(60, 1e12, 2_000_000, 0.65, now_ms=T + 9_000)[0]  # not enough volume
+    assert not detector.flag(60, 1e12, 1_000_000, 0.85, now_ms=T + 9_000)[0]  # not one-sided enough
+
+
+def test_whale_flag_polls_and_flags_the_whale_sized_trade():
+    market = FakeMarket(['BTCUSD'], bars=10, trades_per_s=600)  # every 500th trade is 20k notional
+    feed = DataFeed(market, QUIET)
+    assert not feed.whale_flag('BTCUSD', window_min=1, single_trade=25_000, window_notional=1e12)
+    assert feed.whale_flag('BTCUSD', window_min=1, single_trade=15_000, window_notional=1e12)
+    assert feed.whale_detector('BTCUSD').trades_seen >= 600